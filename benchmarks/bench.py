@@ -0,0 +1,406 @@
+# benchmarks/bench.py
+"""
+Load and latency benchmarks for the MCP filesystem server.
+
+Each scenario is run against one or more targets:
+
+    direct  - MCPServer.handle_request in-process (no transport)
+    client  - MCPClient talking JSON-RPC to a child mcp_server.py over stdio
+    http    - the Flask bridge on a local port, driven with `requests`
+
+Results (p50/p95/p99 latency, ops/sec, errors) are written as JSON and can be
+compared against a previous run to flag regressions:
+
+    python benchmarks/bench.py --output bench.json
+    python benchmarks/bench.py --scenarios read_small,mixed_concurrent --targets direct,client
+    python benchmarks/bench.py --baseline bench.json --threshold 0.15
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVER_DIR = ROOT / "server"
+sys.path.insert(0, str(SERVER_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_together import mock_url, start_mock_server  # noqa: E402
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    files: int = 0
+    file_size: int = 0
+    ops: int = 100
+    concurrency: int = 1
+    targets: tuple = ("direct", "client", "http")
+    operation: str = "read"
+    write_ratio: float = 0.0
+    budget_ms: Optional[float] = None
+
+
+# Cold-start budget for a respawned server (readiness + initialize round trip).
+STARTUP_BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', 150))
+
+SCENARIOS = {s.name: s for s in [
+    Scenario("read_small", "Read 1 KiB files", files=100, file_size=1024, ops=500),
+    Scenario("read_large", "Read 2 MiB files", files=5, file_size=2 * 1024 * 1024, ops=40),
+    Scenario("list_1k", "List a store of 1,000 files", files=1_000, file_size=16, ops=20, operation="list"),
+    Scenario("list_10k", "List a store of 10,000 files", files=10_000, file_size=16, ops=5, operation="list"),
+    Scenario("list_100k", "List a store of 100,000 files", files=100_000, file_size=16, ops=2, operation="list"),
+    Scenario("mixed_concurrent", "80/20 read/write mix, 16 concurrent callers", files=200, file_size=4096,
+             ops=1000, concurrency=16, operation="mixed", write_ratio=0.2),
+    Scenario("upload", "Multipart upload of 16 KiB files", file_size=16 * 1024, ops=100,
+             operation="upload", targets=("http",)),
+    Scenario("zip_export", "ZIP export of 200 x 4 KiB files", files=200, file_size=4096, ops=5,
+             operation="zip", targets=("http",)),
+    Scenario("startup", "Cold start: spawn mcp_server.py until initialize completes", ops=20,
+             operation="startup", targets=("client", "http"), budget_ms=STARTUP_BUDGET_MS),
+    Scenario("ai_edit", "AI edits against the mock Together AI endpoint", files=20, file_size=2048, ops=20,
+             concurrency=4, operation="ai_edit"),
+]}
+# list_100k takes a while to populate; request it explicitly or with --scenarios all.
+DEFAULT_SCENARIOS = [name for name in SCENARIOS if name != "list_100k"]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(scenario: Scenario, target: str, latencies: List[float], errors: int, elapsed: float) -> Dict:
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3)  # noqa: E731
+    result = {
+        "scenario": scenario.name,
+        "target": target,
+        "ops": len(latencies),
+        "errors": errors,
+        "concurrency": scenario.concurrency,
+        "duration_s": round(elapsed, 4),
+        "ops_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": ms(percentile(ordered, 50)),
+            "p95": ms(percentile(ordered, 95)),
+            "p99": ms(percentile(ordered, 99)),
+            "mean": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+            "max": ms(ordered[-1]) if ordered else 0.0
+        }
+    }
+    if scenario.budget_ms is not None:
+        result["budget_ms"] = scenario.budget_ms
+    return result
+
+
+def populate(storage: Path, scenario: Scenario) -> List[str]:
+    """Write the scenario's fixture files straight to disk (not timed)."""
+    for child in storage.iterdir():
+        if child.is_dir():
+            shutil.rmtree(child)
+        else:
+            child.unlink()
+    payload = ("x" * 63 + "\n") * (scenario.file_size // 64) + "x" * (scenario.file_size % 64)
+    names = []
+    for i in range(scenario.files):
+        name = f"dir{i % 50:02d}/file{i:06d}.txt"
+        path = storage / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(payload, encoding="utf-8")
+        names.append(name)
+    return names
+
+
+class DirectTarget:
+    name = "direct"
+
+    async def start(self):
+        from mcp_server import MCPServer
+        self.server = MCPServer()
+        self.request_id = 0
+
+    async def stop(self):
+        pass
+
+    async def call(self, tool: str, arguments: Dict) -> bool:
+        self.request_id += 1
+        response = await self.server.handle_request({
+            "jsonrpc": "2.0", "id": self.request_id, "method": "tools/call",
+            "params": {"name": tool, "arguments": arguments}
+        })
+        return "error" not in response
+
+
+class ClientTarget:
+    name = "client"
+
+    async def start(self):
+        from mcp_client import MCPClient
+        self.client = MCPClient()
+        if not await self.client.start_server():
+            raise RuntimeError("Failed to start MCP server")
+
+    async def stop(self):
+        await self.client.stop_server()
+
+    async def call(self, tool: str, arguments: Dict) -> bool:
+        if tool == "startup":
+            from mcp_client import MCPClient
+            client = MCPClient()
+            ok = await client.start_server()
+            await client.stop_server()
+            return ok
+        result = await self.client.call_tool(tool, arguments)
+        return bool(result.get("success"))
+
+
+class HttpTarget:
+    """The Flask bridge served by a threaded Werkzeug server on a free port."""
+
+    name = "http"
+
+    async def start(self):
+        import requests
+        from werkzeug.serving import make_server
+        import mcp_bridge
+        self.bridge = mcp_bridge
+        if not mcp_bridge.mcp_bridge.start_mcp_server():
+            raise RuntimeError("Failed to start MCP server")
+        self.httpd = make_server("127.0.0.1", 0, mcp_bridge.app, threaded=True)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.httpd.server_port}"
+        self.local = threading.local()
+        self.requests = requests
+
+    async def stop(self):
+        self.httpd.shutdown()
+        self.bridge.cleanup()
+
+    def _session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        return session
+
+    def _startup(self) -> bool:
+        bridge = self.bridge.MCPBridge()
+        ok = bridge.start_mcp_server()
+        bridge.stop_server()
+        return ok
+
+    def _request(self, method: str, path: str, **kwargs) -> bool:
+        response = self._session().request(method, self.base + path, timeout=120, **kwargs)
+        response.content  # read the full body
+        return response.ok
+
+    async def call(self, tool: str, arguments: Dict) -> bool:
+        if tool == "startup":
+            return await asyncio.to_thread(self._startup)
+        if tool == "read_file":
+            args = ("GET", f"/api/files/{arguments['filename']}")
+            kwargs = {}
+        elif tool == "list_files":
+            args, kwargs = ("GET", "/api/files"), {}
+        elif tool == "create_file":
+            args, kwargs = ("POST", "/api/files/create"), {"json": arguments}
+        elif tool == "edit_file":
+            args, kwargs = ("PUT", "/api/files/edit"), {"json": arguments}
+        elif tool == "upload":
+            args = ("POST", "/api/upload")
+            kwargs = {"files": [("files", (arguments["filename"], arguments["content"].encode()))]}
+        elif tool == "zip":
+            args, kwargs = ("GET", "/api/download/all"), {}
+        else:
+            raise ValueError(f"Unsupported tool for http target: {tool}")
+        return await asyncio.to_thread(self._request, *args, **kwargs)
+
+
+TARGETS = {"direct": DirectTarget, "client": ClientTarget, "http": HttpTarget}
+
+
+def make_operation(scenario: Scenario, names: List[str], rng: random.Random) -> Callable[[int], tuple]:
+    body = "y" * scenario.file_size
+
+    def operation(i: int):
+        if scenario.operation == "read":
+            return "read_file", {"filename": rng.choice(names)}
+        if scenario.operation == "list":
+            return "list_files", {}
+        if scenario.operation == "mixed":
+            if rng.random() < scenario.write_ratio:
+                return "edit_file", {"filename": rng.choice(names), "content": body, "use_ai": False}
+            return "read_file", {"filename": rng.choice(names)}
+        if scenario.operation == "upload":
+            return "upload", {"filename": f"upload/u{i:05d}.txt", "content": body}
+        if scenario.operation == "zip":
+            return "zip", {}
+        if scenario.operation == "startup":
+            return "startup", {}
+        if scenario.operation == "ai_edit":
+            return "edit_file", {"filename": names[i % len(names)], "prompt": "Upper-case everything", "use_ai": True}
+        raise ValueError(f"Unknown operation: {scenario.operation}")
+
+    return operation
+
+
+async def run_scenario(target, scenario: Scenario, storage: Path, seed: int, warmup: int) -> Dict:
+    names = populate(storage, scenario)
+    rng = random.Random(seed)
+    operation = make_operation(scenario, names, rng)
+    for i in range(min(warmup, scenario.ops)):
+        await target.call(*operation(i))
+
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(scenario.ops))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            tool, arguments = operation(i)
+            start = time.perf_counter()
+            ok = await target.call(tool, arguments)
+            latencies.append(time.perf_counter() - start)
+            errors += 0 if ok else 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(scenario.concurrency)))
+    return summarize(scenario, target.name, latencies, errors, time.perf_counter() - start)
+
+
+def compare(results: List[Dict], baseline: Dict, threshold: float) -> List[str]:
+    """Describe every (scenario, target) that got slower than ``threshold``."""
+    previous = {(r["scenario"], r["target"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        budget = result.get("budget_ms")
+        if budget is not None and result["latency_ms"]["p95"] > budget:
+            regressions.append(f"{result['scenario']}/{result['target']}: p95 {result['latency_ms']['p95']}ms "
+                               f"exceeds budget of {budget}ms")
+        base = previous.get((result["scenario"], result["target"]))
+        if not base:
+            continue
+        p95, base_p95 = result["latency_ms"]["p95"], base["latency_ms"]["p95"]
+        if base_p95 and (p95 - base_p95) / base_p95 > threshold:
+            regressions.append(f"{result['scenario']}/{result['target']}: p95 {base_p95}ms -> {p95}ms")
+        ops, base_ops = result["ops_per_sec"], base["ops_per_sec"]
+        if base_ops and (base_ops - ops) / base_ops > threshold:
+            regressions.append(f"{result['scenario']}/{result['target']}: {base_ops} -> {ops} ops/sec")
+    return regressions
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> Dict:
+    scenarios = list(SCENARIOS) if args.scenarios == "all" else args.scenarios.split(",")
+    targets = args.targets.split(",")
+    results = []
+    for target_name in targets:
+        target = TARGETS[target_name]()
+        await target.start()
+        try:
+            for name in scenarios:
+                scenario = SCENARIOS[name]
+                if target_name not in scenario.targets:
+                    continue
+                print(f"  {name:<18} {target_name:<7}", end="", flush=True)
+                result = await run_scenario(target, scenario, args.storage, args.seed, args.warmup)
+                latency = result["latency_ms"]
+                print(f" {result['ops_per_sec']:>10.1f} ops/s  p50 {latency['p50']:>9.3f}ms  "
+                      f"p95 {latency['p95']:>9.3f}ms  p99 {latency['p99']:>9.3f}ms  errors {result['errors']}")
+                results.append(result)
+        finally:
+            await target.stop()
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed
+        },
+        "results": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"Comma-separated list or 'all' (available: {', '.join(SCENARIOS)})")
+    parser.add_argument("--targets", default="direct,client,http", help="Comma-separated: direct, client, http")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against a previous results JSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative regression (default 0.10)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed operations before each scenario")
+    parser.add_argument("--ai-delay", type=float, default=0.05, help="Mock Together AI response delay (seconds)")
+    args = parser.parse_args()
+
+    unknown = [s for s in args.scenarios.split(",") if s not in SCENARIOS and args.scenarios != "all"]
+    unknown += [t for t in args.targets.split(",") if t not in TARGETS]
+    if unknown:
+        parser.error(f"Unknown scenario/target: {', '.join(unknown)}")
+
+    workspace = Path(tempfile.mkdtemp(prefix="mcp-bench-"))
+    args.storage = workspace / "files"
+    args.storage.mkdir()
+    mock = start_mock_server(delay=args.ai_delay)
+    # Must be set before the server modules are imported (they read it at import
+    # time) so that child servers inherit the same isolated configuration.
+    os.environ.update({
+        "FILE_STORAGE_PATH": str(args.storage),
+        "MCP_STATE_DIR": str(workspace / "state"),
+        "TOGETHER_AI_API_KEY": "benchmark-key",
+        "TOGETHER_AI_BASE_URL": mock_url(mock),
+        "TRACE_SAMPLE_RATE": os.getenv("TRACE_SAMPLE_RATE", "0"),
+    })
+    os.environ.pop("MCP_SERVER_ADDRESS", None)
+    import logging
+    logging.disable(logging.WARNING)
+
+    print(f"Benchmarking in {workspace}")
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        mock.shutdown()
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        regressions = compare(report["results"], json.loads(Path(args.baseline).read_text()), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
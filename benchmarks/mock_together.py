@@ -0,0 +1,65 @@
+# benchmarks/mock_together.py
+"""
+Local stand-in for the Together AI chat completions endpoint.
+
+Returns the submitted file content upper-cased after a configurable delay, with
+a plausible ``usage`` block, so AI edit paths can be benchmarked offline.
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockTogetherHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.05
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        messages = payload.get("messages", [])
+        prompt = messages[-1]["content"] if messages else ""
+        content = prompt.split("File content:\n", 1)[-1].split("\n\nInstructions:", 1)[0]
+        time.sleep(self.delay)
+        body = json.dumps({
+            "id": "mock-completion",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content.upper()}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(port: int = 0, delay: float = 0.05) -> ThreadingHTTPServer:
+    """Start the mock in a daemon thread; the URL is ``mock_url(server)``."""
+    handler = type("Handler", (MockTogetherHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def mock_url(server: ThreadingHTTPServer) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Together AI endpoint")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--delay", type=float, default=0.05, help="Seconds to wait before answering")
+    args = parser.parse_args()
+    server = start_mock_server(args.port, args.delay)
+    print(f"Mock Together AI listening on {mock_url(server)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
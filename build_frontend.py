@@ -0,0 +1,76 @@
+"""
+Frontend build
+
+Copies frontend/ to frontend/dist/ with content-hashed names for the
+stylesheet and script, rewrites index.html to reference them, and writes
+precompressed .gz (and .br, when the brotli package is installed) variants
+next to every text asset. Both bridges serve frontend/dist/ when it exists,
+with hashed assets cached for a year and index.html always revalidated.
+
+Run again after editing anything under frontend/.
+"""
+
+import gzip
+import hashlib
+import shutil
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FRONTEND_DIRECTORY = Path(__file__).parent / 'frontend'
+DIST_DIRECTORY = FRONTEND_DIRECTORY / 'dist'
+HASHED_ASSETS = ['styles/main.css', 'scripts/app.js']
+PRECOMPRESS_SUFFIXES = {'.html', '.css', '.js', '.svg', '.json', '.txt'}
+
+
+def hashed_name(rel_path: str, content: bytes) -> str:
+    stem, _, ext = rel_path.rpartition('.')
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}.{ext}"
+
+
+def precompress(path: Path):
+    data = path.read_bytes()
+    # mtime=0 keeps the .gz output byte-identical across builds.
+    path.with_name(path.name + '.gz').write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        path.with_name(path.name + '.br').write_bytes(brotli.compress(data, quality=11))
+
+
+def build():
+    if DIST_DIRECTORY.exists():
+        shutil.rmtree(DIST_DIRECTORY)
+    renamed = {}
+    for source in sorted(FRONTEND_DIRECTORY.rglob('*')):
+        if not source.is_file() or DIST_DIRECTORY in source.parents:
+            continue
+        rel_path = source.relative_to(FRONTEND_DIRECTORY).as_posix()
+        content = source.read_bytes()
+        if rel_path in HASHED_ASSETS:
+            renamed[rel_path] = hashed_name(rel_path, content)
+        target = DIST_DIRECTORY / renamed.get(rel_path, rel_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+
+    index = DIST_DIRECTORY / 'index.html'
+    html = index.read_text(encoding='utf-8')
+    for original, hashed in renamed.items():
+        if f'"{original}"' not in html:
+            raise SystemExit(f"index.html does not reference {original}")
+        html = html.replace(f'"{original}"', f'"{hashed}"')
+    index.write_text(html, encoding='utf-8')
+
+    for path in sorted(DIST_DIRECTORY.rglob('*')):
+        if path.is_file() and path.suffix in PRECOMPRESS_SUFFIXES:
+            precompress(path)
+            print(f"  {path.relative_to(DIST_DIRECTORY)}  {path.stat().st_size} B"
+                  f" -> gz {path.with_name(path.name + '.gz').stat().st_size} B")
+    if brotli is None:
+        print("⚠️  brotli not installed; only .gz variants were written")
+    print(f"✅ Frontend built into {DIST_DIRECTORY}")
+
+
+if __name__ == '__main__':
+    build()
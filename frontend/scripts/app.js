@@ -62,7 +62,14 @@ class FilesystemApp {
       "toml",
     ];
 
+    this.liveUpdates = false; // true while the change event stream is connected
+    // Revalidated with If-None-Match, so unchanged content is not re-downloaded
+    this.filesEtag = null;
+    this.fileCache = new Map(); // filename -> { etag, content, hash }, oldest first
+    this.fileCacheLimit = 50;
+
     this.initializeEventListeners();
+    this.subscribeToChanges();
     this.loadFiles();
     this.checkAIService();
     this.applyTheme();
@@ -295,7 +302,13 @@ class FilesystemApp {
     for (let attempt = 1; attempt <= retries; attempt++) {
       try {
         const response = await fetch(url, options);
-        if (!response.ok) {
+        if (response.status === 429 && attempt < retries) {
+          // Shed by the server: wait as long as it asks before retrying.
+          const retryAfter = Number(response.headers.get("Retry-After")) || 1;
+          await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+          continue;
+        }
+        if (!response.ok && response.status !== 304) {
           throw new Error(`HTTP error! Status: ${response.status}`);
         }
         return response;
@@ -340,6 +353,9 @@ class FilesystemApp {
         this.showLoading(false);
         return;
       }
+      if (document.getElementById("extract-archives")?.checked) {
+        formData.append("extract", "true");
+      }
 
       const response = await this.retryFetch("/api/upload", {
         method: "POST",
@@ -349,11 +365,13 @@ class FilesystemApp {
       const result = await response.json();
 
       if (result.success) {
+        const skipped = result.skipped || [];
         this.showStatus(
-          `Successfully uploaded ${validFiles} file(s)`,
+          `Successfully uploaded ${(result.files || []).length} file(s)` +
+            (skipped.length ? `, skipped ${skipped.length}` : ""),
           "success"
         );
-        this.loadFiles(); // Refresh file list
+        this.refreshFilesIfNotLive(); // Change events update the list otherwise
       } else {
         this.showStatus(
           `Upload failed: ${result.error || "Unknown error"}`,
@@ -373,10 +391,14 @@ class FilesystemApp {
 
   async loadFiles() {
     try {
-      const response = await this.retryFetch("/api/files");
+      const response = await this.retryFetch("/api/files", {
+        headers: this.filesEtag ? { "If-None-Match": this.filesEtag } : {},
+      });
+      if (response.status === 304) return; // listing unchanged
       const result = await response.json();
 
       if (result.success) {
+        this.filesEtag = response.headers.get("ETag");
         this.allFiles = result.files || [];
         this.filteredFiles = [...this.allFiles];
         this.renderFileList();
@@ -396,6 +418,43 @@ class FilesystemApp {
     }
   }
 
+  subscribeToChanges() {
+    if (!window.EventSource) return;
+    // The browser reconnects on its own and sends Last-Event-ID, so missed
+    // changes are replayed; the server sends "reset" when it cannot.
+    const events = new EventSource("/api/events");
+    events.addEventListener("open", () => {
+      this.liveUpdates = true;
+    });
+    events.addEventListener("error", () => {
+      this.liveUpdates = false;
+    });
+    events.addEventListener("change", (e) =>
+      this.applyFileChange(JSON.parse(e.data))
+    );
+    events.addEventListener("reset", () => this.loadFiles());
+    this.changeEvents = events;
+  }
+
+  applyFileChange(change) {
+    this.fileCache.delete(change.path);
+    const index = this.allFiles.indexOf(change.path);
+    if (change.type === "deleted") {
+      if (index === -1) return;
+      this.allFiles.splice(index, 1);
+    } else if (index === -1) {
+      this.allFiles.push(change.path);
+      this.allFiles.sort();
+    } else {
+      return; // content change; the listing shows names only
+    }
+    this.filterFiles(document.getElementById("file-search").value);
+  }
+
+  refreshFilesIfNotLive() {
+    if (!this.liveUpdates) this.loadFiles();
+  }
+
   filterFiles(searchTerm) {
     if (!searchTerm.trim()) {
       this.filteredFiles = [...this.allFiles];
@@ -542,13 +601,13 @@ class FilesystemApp {
     try {
       this.showLoading(true, "Loading file...");
 
-      const response = await fetch(
-        `/api/files/${encodeURIComponent(filename)}`
-      );
-      const result = await response.json();
+      const result = await this.fetchFileContent(filename);
 
       if (result.success) {
         this.currentFile = filename;
+        // Saves send only the change against this content, guarded by its hash
+        this.savedContent = result.content;
+        this.currentHash = result.hash || null;
         document.getElementById("file-content").value = result.content;
         document.getElementById("current-file").textContent = filename;
         document.getElementById("editor-section").style.display = "block";
@@ -577,6 +636,29 @@ class FilesystemApp {
     }
   }
 
+  async fetchFileContent(filename) {
+    const cached = this.fileCache.get(filename);
+    const response = await fetch(`/api/files/${encodeURIComponent(filename)}`, {
+      headers: cached ? { "If-None-Match": cached.etag } : {},
+    });
+    if (response.status === 304 && cached) {
+      // Refresh its position so the least recently used entry is evicted first
+      this.fileCache.delete(filename);
+      this.fileCache.set(filename, cached);
+      return { success: true, content: cached.content, hash: cached.hash };
+    }
+    const result = await response.json();
+    const etag = response.headers.get("ETag");
+    if (result.success && etag) {
+      this.fileCache.delete(filename);
+      this.fileCache.set(filename, { etag, content: result.content, hash: result.hash });
+      if (this.fileCache.size > this.fileCacheLimit) {
+        this.fileCache.delete(this.fileCache.keys().next().value);
+      }
+    }
+    return result;
+  }
+
   applyGuidedAIPrompt(promptType) {
     const promptMap = {
       refactor:
@@ -609,34 +691,41 @@ class FilesystemApp {
     }
 
     this.showLoading(true, "Applying AI edits...");
+    const filename = this.currentFile;
 
     try {
-      // Corrected: Uses PUT method and /api/files/edit endpoint
-      const response = await fetch("/api/files/edit", {
-        method: "PUT", // Use PUT method
+      // The edit runs as a background job on the server; we only poll it.
+      const response = await fetch("/api/ai/jobs", {
+        method: "POST",
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({
-          filename: this.currentFile,
-          prompt: prompt,
-          use_ai: true, // Explicitly tell backend to use AI
-        }),
+        body: JSON.stringify({ filename: filename, prompt: prompt }),
       });
-
       const result = await response.json();
 
-      if (result.success) {
-        // The backend `edit_file` for AI should return `new_content`
-        if (result.new_content) {
-          document.getElementById("file-content").value = result.new_content;
+      if (response.status === 429) {
+        const retryAfter = response.headers.get("Retry-After") || "a few";
+        this.showStatus(`AI is busy, please try again in ${retryAfter} seconds`, "error");
+        return;
+      }
+      if (!result.success) {
+        this.showStatus(`AI edit failed: ${result.message || "Unknown error"}`, "error");
+        return;
+      }
+
+      const job = await this.waitForAIJob(result.job);
+      if (job.status === "succeeded") {
+        if (this.currentFile === filename && job.new_content !== undefined) {
+          document.getElementById("file-content").value = job.new_content;
+          this.savedContent = job.new_content;
+          this.currentHash = job.sha256 || null;
         }
         this.showStatus("AI edit applied successfully", "success");
+      } else if (job.status === "conflict") {
+        this.showStatus("AI edit not applied: the file changed while it was running", "error");
       } else {
-        this.showStatus(
-          `AI edit failed: ${result.message || "Unknown error"}`, // Use result.message from backend
-          "error"
-        );
+        this.showStatus(`AI edit ${job.status}: ${job.error || "Unknown error"}`, "error");
       }
     } catch (error) {
       console.error("AI edit error:", error);
@@ -649,40 +738,56 @@ class FilesystemApp {
     }
   }
 
+  async waitForAIJob(job, interval = 1000, timeout = 300000) {
+    const deadline = Date.now() + timeout;
+    while (job.status === "queued" || job.status === "running") {
+      if (Date.now() > deadline) {
+        await fetch(`/api/ai/jobs/${job.id}`, { method: "DELETE" });
+        return { ...job, status: "cancelled", error: "Timed out" };
+      }
+      await new Promise((resolve) => setTimeout(resolve, interval));
+      const response = await this.retryFetch(`/api/ai/jobs/${job.id}`);
+      job = (await response.json()).job;
+    }
+    return job;
+  }
+
   async saveFile() {
     if (!this.currentFile) {
       this.showStatus("No file is currently open", "warning");
       return;
     }
 
-    const content = document.getElementById("file-content").value;
+    const content = this.restoreLineEndings(
+      this.savedContent,
+      document.getElementById("file-content").value
+    );
+    if (content === this.savedContent) {
+      this.showStatus("No changes to save", "info");
+      return;
+    }
 
     this.showLoading(true, "Saving file...");
 
     try {
-      // Corrected: Uses PUT method and /api/files/edit endpoint
-      const response = await fetch(
-        `/api/files/edit`, // Unified edit endpoint
-        {
-          method: "PUT",
-          headers: {
-            "Content-Type": "application/json",
-          },
-          body: JSON.stringify({
-            filename: this.currentFile, // Pass filename in body for unified edit
-            content: content,
-            use_ai: false, // Explicitly tell backend NOT to use AI
-          }),
-        }
-      );
-
+      const response = this.currentHash
+        ? await this.savePatch(content)
+        : await this.saveFullContent(content);
       const result = await response.json();
 
       if (result.success) {
+        this.fileCache.delete(this.currentFile);
+        this.savedContent = content;
+        this.currentHash = result.hash || null;
         this.showStatus("File saved successfully", "success");
+      } else if (response.status === 409) {
+        this.showStatus(
+          "Save failed: the file was changed elsewhere. Reopen it to get the latest version.",
+          "error"
+        );
       } else {
         this.showStatus(
-          `Save failed: ${result.error || "Unknown error"}`,
+          `Save failed: ${result.message || "Unknown error"}`,
           "error"
         );
       }
@@ -697,6 +802,111 @@ class FilesystemApp {
     }
   }
 
+  saveFullContent(content) {
+    return fetch("/api/files/edit", {
+      method: "PUT",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({
+        filename: this.currentFile,
+        content: content,
+        use_ai: false,
+      }),
+    });
+  }
+
+  savePatch(content) {
+    // Only the changed region travels; the server rejects it with 409 if the
+    // file no longer matches the version it was computed against.
+    return fetch("/api/files/patch", {
+      method: "PATCH",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({
+        filename: this.currentFile,
+        base_hash: this.currentHash,
+        operations: [this.computeDelta(this.savedContent, content)],
+      }),
+    });
+  }
+
+  restoreLineEndings(base, edited) {
+    // The textarea turns every CRLF into "\n". Diff against the normalized
+    // base and give the edited region the file's own line ending back, so the
+    // untouched part of the file stays exactly as the server has it.
+    if (!base.includes("\r\n")) return edited;
+    const normalized = base.replace(/\r\n/g, "\n");
+    const rawIndex = [];
+    for (let i = 0; i < base.length; i++) {
+      rawIndex.push(i);
+      if (base[i] === "\r" && base[i + 1] === "\n") i++;
+    }
+    rawIndex.push(base.length);
+
+    const minLength = Math.min(normalized.length, edited.length);
+    let start = 0;
+    while (start < minLength && normalized[start] === edited[start]) {
+      start++;
+    }
+    let end = normalized.length;
+    let editedEnd = edited.length;
+    while (end > start && editedEnd > start && normalized[end - 1] === edited[editedEnd - 1]) {
+      end--;
+      editedEnd--;
+    }
+
+    return (
+      base.slice(0, rawIndex[start]) +
+      edited.slice(start, editedEnd).replace(/\n/g, "\r\n") +
+      base.slice(rawIndex[end])
+    );
+  }
+
+  computeDelta(oldText, newText) {
+    // One replacement covering everything between the common prefix and
+    // suffix. Offsets are counted in code points, as the server expects.
+    const isHigh = (code) => code >= 0xd800 && code <= 0xdbff;
+    const isLow = (code) => code >= 0xdc00 && code <= 0xdfff;
+    const minLength = Math.min(oldText.length, newText.length);
+
+    let start = 0;
+    while (start < minLength && oldText.charCodeAt(start) === newText.charCodeAt(start)) {
+      start++;
+    }
+    if (start > 0 && isHigh(oldText.charCodeAt(start - 1))) start--;
+
+    let oldEnd = oldText.length;
+    let newEnd = newText.length;
+    while (
+      oldEnd > start &&
+      newEnd > start &&
+      oldText.charCodeAt(oldEnd - 1) === newText.charCodeAt(newEnd - 1)
+    ) {
+      oldEnd--;
+      newEnd--;
+    }
+    if (oldEnd < oldText.length && isLow(oldText.charCodeAt(oldEnd))) {
+      oldEnd++;
+      newEnd++;
+    }
+
+    const countCodePoints = (text, from, to) => {
+      let count = 0;
+      for (let i = from; i < to; i++) {
+        if (!isLow(text.charCodeAt(i))) count++;
+      }
+      return count;
+    };
+
+    return {
+      offset: countCodePoints(oldText, 0, start),
+      delete: countCodePoints(oldText, start, oldEnd),
+      insert: newText.slice(start, newEnd),
+    };
+  }
+
   closeEditor() {
     this.currentFile = null;
     document.getElementById("editor-section").style.display = "none";
@@ -731,7 +941,7 @@ class FilesystemApp {
 
       if (result.success) {
         this.showStatus(`Deleted ${filename}`, "success");
-        this.loadFiles(); // Refresh file list
+        this.refreshFilesIfNotLive(); // Change events update the list otherwise
 
         // If the deleted file was currently open, close the editor
         if (this.currentFile === filename) {
@@ -790,7 +1000,7 @@ class FilesystemApp {
       if (result.success) {
         this.showStatus(`Created ${filename}`, "success");
         this.hideCreateFileModal();
-        this.loadFiles(); // Refresh file list
+        this.refreshFilesIfNotLive(); // Change events update the list otherwise
       } else {
         this.showStatus(
           `Create failed: ${result.error || "Unknown error"}`,
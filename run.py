@@ -18,10 +18,27 @@ load_dotenv()
 server_dir = Path(__file__).parent / 'server'
 sys.path.insert(0, str(server_dir))
 
-# Import and run the MCP bridge server (fixed version)
-from server.mcp_bridge import app, mcp_bridge, cleanup
+
+def run_asgi(port):
+    """Serve the async bridge (server/mcp_asgi.py) under uvicorn."""
+    import uvicorn
+
+    workers = int(os.getenv('BRIDGE_WORKERS', 1))
+    print(f"⚡ Starting ASGI bridge with {workers} worker(s)...")
+    if workers > 1 and not os.getenv('MCP_SERVER_ADDRESS'):
+        print("   Tip: set MCP_SERVER_ADDRESS so workers share one MCP server.")
+    print(f"🌐 Frontend available at: http://localhost:{port}")
+    uvicorn.run("mcp_asgi:app", host='0.0.0.0', port=port, workers=workers, app_dir=str(server_dir))
+
 
 if __name__ == '__main__':
+    if os.getenv('BRIDGE_MODE', 'flask').lower() == 'asgi':
+        run_asgi(int(os.getenv('PORT', 5000)))
+        sys.exit(0)
+
+    # Import and run the MCP bridge server (fixed version)
+    from server.mcp_bridge import app, mcp_bridge, cleanup
+
     import atexit
     
     # Check if Together AI API key is set
@@ -59,7 +76,8 @@ if __name__ == '__main__':
     debug = os.getenv('DEBUG', 'True').lower() == 'true'
     
     try:
-        app.run(debug=debug, host='0.0.0.0', port=port)
+        # No reloader: it re-executes this script and would start a second MCP server.
+        app.run(debug=debug, use_reloader=False, host='0.0.0.0', port=port)
     except KeyboardInterrupt:
         print("\n🛑 Server interrupted by user")
     finally:
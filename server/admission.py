@@ -0,0 +1,183 @@
+# server/admission.py
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+from metrics import Counter, Gauge, Histogram
+
+LANE_QUEUE_DEPTH = Gauge('mcp_server_lane_queue_depth', 'Requests waiting for a slot, by lane', ['lane'])
+LANE_ACTIVE = Gauge('mcp_server_lane_active_requests', 'Requests holding a slot, by lane', ['lane'])
+LANE_WAIT = Histogram('mcp_server_lane_wait_seconds', 'Time spent queued before running, by lane', ['lane'])
+LANE_REJECTED = Counter('mcp_server_lane_rejected_total', 'Requests shed before running, by lane and reason', ['lane', 'reason'])
+
+
+class Overloaded(Exception):
+    """A request was shed; the caller may retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, lane: str, reason: str, retry_after: float):
+        super().__init__(message)
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Take a token; returns 0, or the seconds until one is available."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.burst
+
+
+class Lane:
+    """A class of work with its own concurrency limit and bounded queue.
+
+    ``per_client`` caps how many requests one client may have queued or
+    running in the lane; ``rate``/``burst`` configure a per-client token bucket
+    (requests per second). 0 disables either.
+    """
+
+    def __init__(self, name: str, priority: int, concurrency: int, max_queue: int,
+                 per_client: int = 0, rate: float = 0.0, burst: float = 1.0):
+        self.name = name
+        self.priority = priority
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.per_client = per_client
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.active = 0
+        self.waiting: deque = deque()
+        self.clients: Dict[str, int] = {}
+        self.buckets: Dict[str, TokenBucket] = {}
+        # Moving average of how long a slot is held, for Retry-After estimates.
+        self.service_time = 1.0
+        LANE_QUEUE_DEPTH.labels(name).set_function(lambda: len(self.waiting))
+        LANE_ACTIVE.labels(name).set_function(lambda: self.active)
+
+    def retry_after(self) -> float:
+        backlog = len(self.waiting) + self.active
+        return max(1.0, self.service_time * backlog / max(self.concurrency, 1))
+
+    def check(self, client: str):
+        if self.per_client and self.clients.get(client, 0) >= self.per_client:
+            raise Overloaded(f"Too many concurrent {self.name} requests from this client", self.name, "client_limit", self.retry_after())
+        if len(self.waiting) >= self.max_queue:
+            raise Overloaded(f"The {self.name} queue is full", self.name, "queue_full", self.retry_after())
+        self.throttle(client)
+
+    def throttle(self, client: str):
+        """Take a token from the client's bucket, if the lane is rate limited."""
+        if self.rate > 0:
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                if len(self.buckets) > 1000:
+                    # Idle clients' buckets have refilled; dropping them changes nothing.
+                    self.buckets = {c: b for c, b in self.buckets.items() if not b.full()}
+                bucket = self.buckets[client] = TokenBucket(self.rate, self.burst)
+            wait = bucket.take()
+            if wait:
+                raise Overloaded(f"{self.name} request rate limit exceeded", self.name, "rate_limit", wait)
+
+
+class AdmissionController:
+    """Admits requests into lanes and runs them in priority order.
+
+    At most ``capacity`` requests run at once across all lanes, and never more
+    than a lane's own limit. When a slot frees, the waiter from the lane with
+    the lowest ``priority`` value goes first, so a backlog of slow work cannot
+    delay fast work queued behind it.
+    """
+
+    def __init__(self, capacity: int, lanes: List[Lane]):
+        self.capacity = capacity
+        self.lanes = {lane.name: lane for lane in lanes}
+        self._by_priority = sorted(lanes, key=lambda lane: lane.priority)
+        self.active = 0
+
+    @asynccontextmanager
+    async def admit(self, lane_name: str, client: str, enforce_limits: bool = True):
+        """Wait for a slot in the lane; raises Overloaded if the request is shed.
+
+        Work the server already accepted (e.g. a queued job) passes
+        ``enforce_limits=False`` to skip the shedding checks and only wait.
+        """
+        lane = self.lanes[lane_name]
+        try:
+            if enforce_limits:
+                lane.check(client)
+        except Overloaded as e:
+            LANE_REJECTED.labels(lane.name, e.reason).inc()
+            raise
+        lane.clients[client] = lane.clients.get(client, 0) + 1
+        queued = time.perf_counter()
+        try:
+            if self.active < self.capacity and lane.active < lane.concurrency and not lane.waiting:
+                self._start(lane)
+            else:
+                waiter = asyncio.get_running_loop().create_future()
+                lane.waiting.append(waiter)
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    if waiter.done() and not waiter.cancelled():
+                        self._finish(lane)  # woken and cancelled in the same tick
+                    elif waiter in lane.waiting:
+                        lane.waiting.remove(waiter)
+                    raise
+            started = time.perf_counter()
+            LANE_WAIT.labels(lane.name).observe(started - queued)
+            try:
+                yield
+            finally:
+                lane.service_time += 0.2 * (time.perf_counter() - started - lane.service_time)
+                self._finish(lane)
+        finally:
+            lane.clients[client] -= 1
+            if not lane.clients[client]:
+                del lane.clients[client]
+
+    def shed(self, error: Overloaded) -> Overloaded:
+        """Count a rejection made outside ``admit``; returns the error to raise."""
+        LANE_REJECTED.labels(error.lane, error.reason).inc()
+        return error
+
+    def _start(self, lane: Lane):
+        lane.active += 1
+        self.active += 1
+
+    def _finish(self, lane: Lane):
+        lane.active -= 1
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        for lane in self._by_priority:
+            while lane.waiting and self.active < self.capacity and lane.active < lane.concurrency:
+                waiter = lane.waiting.popleft()
+                if waiter.done():
+                    continue  # cancelled, and its task not yet resumed to see it
+                self._start(lane)
+                waiter.set_result(None)
+            if self.active >= self.capacity:
+                return
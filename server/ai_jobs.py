@@ -0,0 +1,104 @@
+# server/ai_jobs.py
+
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from metrics import Counter
+
+AI_JOBS = Counter('mcp_server_ai_jobs_total', 'AI edit jobs, by final status', ['status'])
+
+QUEUED, RUNNING = "queued", "running"
+SUCCEEDED, FAILED, CANCELLED, CONFLICT = "succeeded", "failed", "cancelled", "conflict"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED, CONFLICT)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    model TEXT NOT NULL,
+    base_hash TEXT NOT NULL,
+    client TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    error TEXT,
+    sha256 TEXT,
+    result TEXT,
+    coalesced INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+"""
+
+
+class JobStore:
+    """AI edit jobs in SQLite, so queued work survives a restart.
+
+    All access happens on the server's event loop; each call is a single
+    short statement in autocommit mode.
+    """
+
+    def __init__(self, path: str):
+        # Nothing else creates the state directory with the s3 backend.
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def recover(self) -> int:
+        """Requeue jobs that were running when the previous process stopped."""
+        cursor = self._db.execute("UPDATE jobs SET status = ?, updated = ? WHERE status = ?", (QUEUED, time.time(), RUNNING))
+        return cursor.rowcount
+
+    def submit(self, filename: str, prompt: str, model: str, base_hash: str, client: str) -> Dict[str, Any]:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        self._db.execute(
+            "INSERT INTO jobs (id, filename, prompt, model, base_hash, client, status, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, filename, prompt, model, base_hash, client, QUEUED, now, now)
+        )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self, status: str, client: Optional[str] = None) -> int:
+        if client is None:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+        return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ? AND client = ?", (status, client)).fetchone()[0]
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Mark the oldest queued job running and return it."""
+        row = self._db.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ?", (RUNNING, time.time(), row["id"]))
+        return self.get(row["id"])
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None, sha256: Optional[str] = None,
+               result: Optional[str] = None, coalesced: bool = False) -> bool:
+        """Record a job's outcome unless it already finished (e.g. was cancelled)."""
+        placeholders = ", ".join("?" for _ in FINISHED)
+        cursor = self._db.execute(
+            f"UPDATE jobs SET status = ?, updated = ?, error = ?, sha256 = ?, result = ?, coalesced = ? WHERE id = ? AND status NOT IN ({placeholders})",
+            (status, time.time(), error, sha256, result, int(coalesced), job_id, *FINISHED)
+        )
+        if cursor.rowcount:
+            AI_JOBS.labels(status).inc()
+        return bool(cursor.rowcount)
+
+    def prune(self, max_age_seconds: float) -> int:
+        placeholders = ", ".join("?" for _ in FINISHED)
+        cursor = self._db.execute(
+            f"DELETE FROM jobs WHERE status IN ({placeholders}) AND updated < ?",
+            (*FINISHED, time.time() - max_age_seconds)
+        )
+        return cursor.rowcount
+
+    def close(self):
+        self._db.close()
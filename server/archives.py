@@ -0,0 +1,133 @@
+# server/archives.py
+"""Reading zip, tar (plain or compressed) and gzip archives entry by entry.
+
+``entries`` decompresses one entry at a time, so memory holds the archive and
+a single entry rather than everything it expands to. Limits are checked
+against the bytes actually produced, not the sizes an archive declares.
+"""
+
+import gzip
+import io
+import stat
+import tarfile
+import zipfile
+from typing import Iterator, NamedTuple, Optional
+
+
+class ArchiveEntry(NamedTuple):
+    name: str
+    data: Optional[bytes]
+    # Why the entry was not read; data is None then.
+    error: Optional[str] = None
+
+
+class ArchiveLimitExceeded(ValueError):
+    pass
+
+
+def _normalize(name: str) -> str:
+    # Only "./" is dropped; anything else, "../" included, is left for path validation.
+    while name.startswith("./"):
+        name = name[2:]
+    return name
+
+
+class _Budget:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.entries = max_entries
+        self.bytes = max_bytes
+
+    def entry(self):
+        self.entries -= 1
+        if self.entries < 0:
+            raise ArchiveLimitExceeded("The archive has too many entries")
+
+    def read(self, f) -> bytes:
+        data = f.read(self.bytes + 1)
+        self.bytes -= len(data)
+        if self.bytes < 0:
+            raise ArchiveLimitExceeded("The archive expands to more than the size limit")
+        return data
+
+
+def entries(data: bytes, name: str, max_entries: int, max_bytes: int) -> Iterator[ArchiveEntry]:
+    """Regular-file entries of a zip, tar(.gz/.bz2/.xz) or .gz archive; directories are left out.
+
+    Raises ValueError for anything that is not such an archive, and
+    ArchiveLimitExceeded (possibly after some entries were produced) once
+    more than ``max_entries`` entries or ``max_bytes`` uncompressed bytes
+    are found.
+    """
+    budget = _Budget(max_entries, max_bytes)
+    buffer = io.BytesIO(data)
+    if zipfile.is_zipfile(buffer):
+        yield from _zip_entries(buffer, budget)
+        return
+    buffer.seek(0)
+    try:
+        archive = tarfile.open(fileobj=buffer, mode="r|*")
+    except tarfile.TarError:
+        archive = None
+    if archive is not None:
+        with archive:
+            yield from _tar_entries(archive, budget)
+        return
+    if data[:2] == b"\x1f\x8b":
+        yield from _gzip_entry(data, name, budget)
+        return
+    raise ValueError("Not a zip, tar or gzip archive")
+
+
+def _zip_entries(buffer: io.BytesIO, budget: _Budget) -> Iterator[ArchiveEntry]:
+    with zipfile.ZipFile(buffer) as archive:
+        infos = archive.infolist()
+        # The central directory gives a cheap first check; reads are still capped.
+        if len(infos) > budget.entries:
+            raise ArchiveLimitExceeded("The archive has too many entries")
+        if sum(info.file_size for info in infos) > budget.bytes:
+            raise ArchiveLimitExceeded("The archive expands to more than the size limit")
+        for info in infos:
+            budget.entry()
+            if info.is_dir():
+                continue
+            name = _normalize(info.filename)
+            if stat.S_ISLNK(info.external_attr >> 16):
+                yield ArchiveEntry(name, None, "Not a regular file")
+            elif info.flag_bits & 0x1:
+                yield ArchiveEntry(name, None, "Encrypted entries are not supported")
+            else:
+                try:
+                    with archive.open(info) as f:
+                        yield ArchiveEntry(name, budget.read(f))
+                except (zipfile.BadZipFile, NotImplementedError, EOFError) as e:
+                    yield ArchiveEntry(name, None, f"Cannot read entry: {e}")
+
+
+def _tar_entries(archive: tarfile.TarFile, budget: _Budget) -> Iterator[ArchiveEntry]:
+    # Stream mode: each member's data has to be read before moving on.
+    try:
+        for member in archive:
+            budget.entry()
+            if member.isdir():
+                continue
+            name = _normalize(member.name)
+            if not member.isfile():
+                yield ArchiveEntry(name, None, "Not a regular file")
+                continue
+            yield ArchiveEntry(name, budget.read(archive.extractfile(member)))
+    except (tarfile.TarError, EOFError, OSError) as e:
+        raise ValueError(f"Cannot read tar archive: {e}")
+
+
+def _gzip_entry(data: bytes, name: str, budget: _Budget) -> Iterator[ArchiveEntry]:
+    # A single compressed file, named after the archive.
+    base = name.replace("\\", "/").rsplit("/", 1)[-1]
+    if not base.lower().endswith(".gz") or len(base) <= 3:
+        raise ValueError("Cannot name the content of a .gz file without the archive name")
+    budget.entry()
+    try:
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as f:
+            content = budget.read(f)
+    except (OSError, EOFError) as e:
+        raise ValueError(f"Cannot read gzip data: {e}")
+    yield ArchiveEntry(base[:-3], content)
@@ -0,0 +1,144 @@
+# server/blob_store.py
+
+import errno
+import hashlib
+import logging
+import os
+import time
+import uuid
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+BLOB_WRITES = Counter('mcp_server_blob_writes_total', 'Content writes to the blob store, by result', ['result'])
+BLOB_BYTES_SAVED = Counter('mcp_server_blob_bytes_deduplicated_total', 'Bytes not written because an identical blob existed')
+BLOB_GC_REMOVED = Counter('mcp_server_blob_gc_removed_total', 'Unreferenced blobs removed by garbage collection')
+BLOB_COUNT = Gauge('mcp_server_blobs', 'Blobs in the store at the last garbage collection')
+
+
+class BlobStore:
+    """sha256-addressed content store, sharded as ``root/ab/cd/abcd...``.
+
+    Stored files and versions are hard links to their blob, so each distinct
+    content is on disk once and the blob's link count is its reference count:
+    a blob with ``st_nlink == 1`` is referenced by nothing but the store.
+    Blobs are read-only and never modified; a write replaces the stored
+    file's link instead (see ``LocalStorage.write``).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put_file(self, file_path: str, digest: str) -> str:
+        """Path of the blob holding ``file_path``'s content, whose sha256 is ``digest``; made from the file if missing."""
+        from storage import clone_file  # storage imports this module
+        path = self.blob_path(digest)
+        try:
+            os.utime(path)  # a fresh grace period, until the caller has linked it
+            BLOB_BYTES_SAVED.inc(os.stat(path).st_size)
+            BLOB_WRITES.labels("deduplicated").inc()
+            return path
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            clone_file(file_path, tmp_path)
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        BLOB_WRITES.labels("stored").inc()
+        return path
+
+    def put(self, data: bytes) -> str:
+        """Path of the blob holding ``data``; written if missing."""
+        path = self.blob_path(hashlib.sha256(data).hexdigest())
+        try:
+            os.utime(path)  # a fresh grace period, and a fresh mtime for whoever links it
+            BLOB_BYTES_SAVED.inc(len(data))
+            BLOB_WRITES.labels("deduplicated").inc()
+            return path
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        BLOB_WRITES.labels("stored").inc()
+        return path
+
+    def link(self, blob: str, dest_path: str) -> str:
+        """Replace ``dest_path`` with a hard link to ``blob``; returns how the file was made.
+
+        Where the link cannot be made (another file system, too many links)
+        the file becomes a copy of the blob instead.
+        """
+        from storage import clone_file  # storage imports this module
+        tmp_path = os.path.join(os.path.dirname(dest_path), f".{os.path.basename(dest_path)}.{uuid.uuid4().hex}.tmp")
+        try:
+            try:
+                os.link(blob, tmp_path)
+                method = "link"
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+                    raise
+                logger.warning(f"Cannot hard-link {dest_path} to its blob ({e}); copying")
+                method = clone_file(blob, tmp_path)
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return method
+
+    def store(self, data: bytes, dest_path: str) -> str:
+        """Make ``dest_path`` a link to the blob holding ``data``; returns its sha256."""
+        blob = self.put(data)
+        self.link(blob, dest_path)
+        return os.path.basename(blob)
+
+    def collect_garbage(self, grace_seconds: float = 60.0) -> int:
+        """Remove blobs no file or version links to any more; returns how many were removed.
+
+        Blobs younger than ``grace_seconds`` are kept so a file or version
+        being written can still link the blob ``put`` or ``put_file`` just
+        returned.
+        """
+        removed = kept = 0
+        cutoff = time.time() - grace_seconds
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                    if name.endswith('.tmp'):
+                        if st.st_mtime < cutoff:
+                            os.unlink(path)
+                        continue
+                    if st.st_nlink == 1 and st.st_mtime < cutoff:
+                        os.unlink(path)
+                        removed += 1
+                    else:
+                        kept += 1
+                except FileNotFoundError:
+                    continue
+        BLOB_GC_REMOVED.inc(removed)
+        BLOB_COUNT.set(kept)
+        if removed:
+            logger.info(f"Blob garbage collection removed {removed} unreferenced blobs")
+        return removed
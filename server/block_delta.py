@@ -0,0 +1,127 @@
+# server/block_delta.py
+"""rsync-style block deltas for workspace sync.
+
+The side that has the old content sends ``signatures`` of its blocks; the
+side with the new content answers with ``delta``: runs of blocks to copy
+from the old content and literal bytes for everything else. A rolling
+checksum finds matching blocks at any offset, so insertions and deletions
+only cost the bytes around them.
+"""
+
+import base64
+import hashlib
+import math
+from itertools import accumulate
+from typing import Any, Dict, List, Optional
+
+MIN_BLOCK_SIZE = 2048
+MAX_BLOCK_SIZE = 64 * 1024
+
+
+def default_block_size(size: int) -> int:
+    # About sqrt(size), which balances signature size against literal bytes.
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, math.isqrt(size)))
+
+
+def _weak(block: bytes):
+    # b = sum((len - i) * x_i) is the sum of the prefix sums.
+    return sum(block) & 0xffff, sum(accumulate(block)) & 0xffff
+
+
+def _strong(block: bytes) -> str:
+    return hashlib.blake2b(block, digest_size=8).hexdigest()
+
+
+def signatures(data: bytes, block_size: Optional[int] = None) -> Dict[str, Any]:
+    block_size = block_size or default_block_size(len(data))
+    blocks = []
+    for offset in range(0, len(data), block_size):
+        block = data[offset:offset + block_size]
+        a, b = _weak(block)
+        blocks.append([a | b << 16, _strong(block)])
+    return {"block_size": block_size, "size": len(data), "blocks": blocks}
+
+
+def delta(data: bytes, sigs: Dict[str, Any], max_literal: Optional[int] = None) -> Optional[List[list]]:
+    """Operations rebuilding ``data`` from the content ``sigs`` describe.
+
+    Each operation is ``["c", first_block, count]`` or ``["l", base64]``.
+    Returns None once more than ``max_literal`` bytes would be sent literally,
+    when sending the whole content is as cheap.
+    """
+    block_size, base_size = int(sigs["block_size"]), int(sigs["size"])
+    if block_size < 1:
+        raise ValueError(f"Invalid block size: {block_size}")
+    full_blocks = base_size // block_size
+    index: Dict[int, List[tuple]] = {}
+    for i, (weak, strong) in enumerate(sigs["blocks"][:full_blocks]):
+        index.setdefault(weak, []).append((strong, i))
+    ops: List[list] = []
+    literal = 0
+
+    def emit_literal(start: int, end: int):
+        if end > start:
+            ops.append(["l", base64.b64encode(data[start:end]).decode('ascii')])
+
+    def emit_copy(block: int):
+        if ops and ops[-1][0] == "c" and ops[-1][1] + ops[-1][2] == block:
+            ops[-1][2] += 1
+        else:
+            ops.append(["c", block, 1])
+
+    n = len(data)
+    pos = start = 0
+    if index and n >= block_size:
+        a, b = _weak(data[:block_size])
+        while pos + block_size <= n:
+            candidates = index.get(a | b << 16)
+            if candidates:
+                strong = _strong(data[pos:pos + block_size])
+                match = next((i for s, i in candidates if s == strong), None)
+                if match is not None:
+                    literal += pos - start
+                    emit_literal(start, pos)
+                    emit_copy(match)
+                    pos += block_size
+                    start = pos
+                    if pos + block_size <= n:
+                        a, b = _weak(data[pos:pos + block_size])
+                    continue
+            if pos + block_size < n:
+                out, new = data[pos], data[pos + block_size]
+                a = (a - out + new) & 0xffff
+                b = (b - block_size * out + a) & 0xffff
+            pos += 1
+            if max_literal is not None and literal + pos - start > max_literal:
+                return None
+    # The old content's short last block can only match at the very end.
+    tail = base_size - full_blocks * block_size
+    if tail and n - start >= tail and _strong(data[n - tail:]) == sigs["blocks"][full_blocks][1]:
+        literal += n - tail - start
+        emit_literal(start, n - tail)
+        ops.append(["c", full_blocks, 1])
+    else:
+        literal += n - start
+        emit_literal(start, n)
+    if max_literal is not None and literal > max_literal:
+        return None
+    return ops
+
+
+def apply(base: bytes, ops: List[list], block_size: int) -> bytes:
+    if block_size < 1:
+        raise ValueError(f"Invalid block size: {block_size}")
+    blocks = -(-len(base) // block_size)
+    parts = []
+    for op in ops:
+        if op[0] == "c":
+            first, count = int(op[1]), int(op[2])
+            # The whole run, not just its first block, has to be in the base.
+            if first < 0 or count < 1 or first + count > blocks:
+                raise ValueError(f"Delta copies blocks {first}-{first + count - 1} beyond the base content")
+            parts.append(base[first * block_size:(first + count) * block_size])
+        elif op[0] == "l":
+            parts.append(base64.b64decode(op[1]))
+        else:
+            raise ValueError(f"Unknown delta operation: {op[0]!r}")
+    return b"".join(parts)
@@ -0,0 +1,133 @@
+# server/change_feed.py
+
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import Counter, Gauge
+
+FEED_EVENTS = Counter('mcp_change_feed_events_total', 'File change notifications received from the MCP server')
+FEED_RESETS = Counter('mcp_change_feed_resets_total', 'Subscribers told to reload because they could not resume')
+FEED_SUBSCRIBERS = Gauge('mcp_change_feed_subscribers', 'Open change event streams')
+
+RESET = "reset"
+
+
+class ChangeFeed:
+    """Recent ``notifications/file_changed`` events, replayable by event id.
+
+    Event ids are ``"<epoch>-<seq>"`` as assigned by the MCP server. A
+    subscriber resuming from an id that is no longer buffered, that belongs to
+    an earlier server run, or from before a gap in the sequence gets a reset
+    and reloads the full listing instead.
+    """
+
+    def __init__(self, size: int = 1000):
+        self._events: deque = deque(maxlen=size)
+        self._epoch: Optional[str] = None
+        self._floor = 0  # events with seq <= floor can no longer be replayed
+        self._listing_validated = False
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def publish(self, params: Dict[str, Any]):
+        epoch, seq = params.get("epoch"), params.get("seq")
+        with self._cond:
+            last_seq = self._events[-1][0] if self._events else self._floor
+            if epoch != self._epoch or seq != last_seq + 1:
+                # New server run or missed notifications: nothing before this
+                # event can be resumed from.
+                self._epoch = epoch
+                self._events.clear()
+                self._floor = seq - 1
+            elif len(self._events) == self._events.maxlen:
+                self._floor = self._events[0][0]
+            self._events.append((seq, params))
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        FEED_EVENTS.inc()
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def prime(self, changes: Optional[Dict[str, Any]]):
+        """Start from the position an ``initialize`` result reports."""
+        if not changes:
+            return
+        with self._cond:
+            if changes.get("epoch") != self._epoch:
+                self._epoch = changes.get("epoch")
+                self._events.clear()
+                self._floor = changes.get("seq", 0)
+            self._listing_validated = bool(changes.get("watching"))
+
+    def listing_etag(self) -> Optional[str]:
+        """ETag for the file listing, or None if changes may go unnoticed.
+
+        Only valid while the server watches the store, and only as fresh as its
+        scan interval for changes made behind its back.
+        """
+        cursor = self.cursor() if self._listing_validated else None
+        return f'"{cursor}"' if cursor else None
+
+    def cursor(self) -> Optional[str]:
+        """Id of the newest event, for subscribers that start from "now"."""
+        with self._cond:
+            if self._epoch is None:
+                return None
+            return f"{self._epoch}-{self._events[-1][0] if self._events else self._floor}"
+
+    def since(self, last_event_id: Optional[str]):
+        """Events after ``last_event_id``, or RESET if that point cannot be resumed."""
+        with self._cond:
+            if not last_event_id:
+                return [params for _, params in self._events]
+            epoch, _, seq = last_event_id.rpartition("-")
+            try:
+                seq = int(seq)
+            except ValueError:
+                return RESET
+            if epoch != self._epoch or seq < self._floor:
+                FEED_RESETS.inc()
+                return RESET
+            return [params for event_seq, params in self._events if event_seq > seq]
+
+    def wait(self, last_event_id: Optional[str], timeout: float):
+        """Like ``since`` but blocks up to ``timeout`` seconds for a new event."""
+        with self._cond:
+            events = self.since(last_event_id)
+            if events == []:
+                self._cond.wait(timeout)
+                events = self.since(last_event_id)
+            return events
+
+    async def wait_async(self, last_event_id: Optional[str], timeout: float):
+        event = asyncio.Event()
+        with self._cond:
+            events = self.since(last_event_id)
+            if events != []:
+                return events
+            self._async_waiters.append((asyncio.get_running_loop(), event))
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.since(last_event_id)
+
+
+def event_id(params: Dict[str, Any]) -> str:
+    return f"{params['epoch']}-{params['seq']}"
+
+
+def format_event(params: Dict[str, Any]) -> str:
+    """One Server-Sent Events message for a change notification."""
+    data = {k: v for k, v in params.items() if k not in ("epoch", "seq")}
+    return f"id: {event_id(params)}\nevent: change\ndata: {json.dumps(data)}\n\n"
+
+
+def format_reset(cursor: Optional[str]) -> str:
+    # Carrying the current cursor as the id lets the client resume from here
+    # after it has reloaded the listing.
+    prefix = f"id: {cursor}\n" if cursor else ""
+    return f"{prefix}event: {RESET}\ndata: {{}}\n\n"
@@ -0,0 +1,202 @@
+# server/compression.py
+"""Content-Encoding negotiation shared by both bridges.
+
+gzip is always available; brotli and zstd are used when the ``brotli`` and
+``zstandard`` packages are installed.
+"""
+
+import gzip
+import os
+import re
+import zlib
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from metrics import Counter
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Tried in this order when the client weighs them equally: zstd and brotli
+# at low levels beat gzip on both ratio and speed for JSON.
+ENCODINGS: List[str] = [e for e, lib in (('zstd', zstandard), ('br', brotli), ('gzip', gzip)) if lib]
+# Variants build_frontend.py writes next to each asset, best first.
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml',
+    'application/octet-stream', 'image/svg+xml'
+)
+# Downloads of these are served as octet-stream but are already compressed.
+COMPRESSED_EXTENSIONS = frozenset({
+    'zip', 'rar', '7z', 'gz', 'tgz', 'bz2', 'xz', 'zst', 'br',
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'docx', 'xlsx', 'pptx'
+})
+_HASHED_ASSET = re.compile(r'\.[0-9a-f]{8,}\.(?:css|js)$')
+
+RESPONSES_COMPRESSED = Counter('mcp_bridge_responses_compressed_total', 'Responses compressed on the fly, by encoding', ['encoding'])
+COMPRESSION_BYTES_SAVED = Counter('mcp_bridge_compression_bytes_saved_total', 'Response bytes saved by on-the-fly compression')
+
+
+def negotiate(accept_encoding: Optional[str], available: List[str] = ENCODINGS) -> Optional[str]:
+    """Best of ``available`` for an Accept-Encoding header, or None for identity."""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                weight = float(match.group(1))
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in available:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def should_compress(status: int, headers: Mapping[str, str]) -> bool:
+    if not COMPRESSION_ENABLED or status < 200 or status in (204, 206, 304):
+        return False
+    if headers.get('Content-Encoding'):
+        return False
+    content_type = (headers.get('Content-Type') or '').split(';')[0].strip().lower()
+    if content_type == 'text/event-stream' or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return False
+    disposition = headers.get('Content-Disposition') or ''
+    match = re.search(r'filename="?([^";]+)', disposition)
+    if match and match.group(1).rsplit('.', 1)[-1].lower() in COMPRESSED_EXTENSIONS:
+        return False
+    return True
+
+
+def compressor(encoding: str):
+    """An object with ``compress(bytes)`` and ``flush()`` for streaming bodies."""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if encoding == 'br':
+        return _BrotliStream(brotli.Compressor(quality=4))
+    return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+
+class _BrotliStream:
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    stream = compressor(encoding)
+    return stream.compress(data) + stream.flush()
+
+
+def weak_etag(etag: Optional[str]) -> Optional[str]:
+    # The encoded body is a different byte sequence, so a strong validator
+    # for the identity body must not be reused for it.
+    if etag and not etag.startswith('W/'):
+        return f'W/{etag}'
+    return etag
+
+
+def record(encoding: str, before: int, after: int):
+    RESPONSES_COMPRESSED.labels(encoding).inc()
+    COMPRESSION_BYTES_SAVED.inc(max(before - after, 0))
+
+
+def precompressed_variant(path: str, accept_encoding: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Suffix and encoding of the best prebuilt ``.br``/``.gz`` sibling of ``path`` the client accepts."""
+    available = [e for e, suffix in PRECOMPRESSED_SUFFIXES.items() if os.path.isfile(path + suffix)]
+    encoding = negotiate(accept_encoding, available)
+    return (PRECOMPRESSED_SUFFIXES[encoding], encoding) if encoding else ('', None)
+
+
+def static_cache_control(path: str) -> str:
+    """Content-hashed assets never change under their name; everything else revalidates."""
+    return IMMUTABLE_CACHE_CONTROL if _HASHED_ASSET.search(path) else 'no-cache'
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing both single-body and streamed responses."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept_encoding = next((v.decode('latin-1') for k, v in scope.get("headers") or [] if k.lower() == b'accept-encoding'), None)
+        encoding = negotiate(accept_encoding)
+        start = None
+        stream = None
+        sizes = [0, 0]
+
+        async def send_wrapper(message):
+            nonlocal start, stream
+            if message["type"] == "http.response.start":
+                start = message  # held back until the first body chunk shows the size
+                return
+            if message["type"] != "http.response.body" or start is None:
+                return await send(message)
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not True:
+                headers = list(start["headers"])
+                header_map = {k.decode('latin-1').title(): v.decode('latin-1') for k, v in headers}
+                if should_compress(start["status"], header_map):
+                    headers = _add_vary(headers)
+                    if encoding and (more_body or len(body) >= self.minimum_size):
+                        headers = [(k, v) for k, v in headers if k.lower() not in (b'content-length', b'etag')]
+                        headers.append((b'content-encoding', encoding.encode('latin-1')))
+                        if header_map.get('Etag'):
+                            headers.append((b'etag', weak_etag(header_map['Etag']).encode('latin-1')))
+                        if more_body:
+                            stream = compressor(encoding)
+                        else:
+                            compressed = compress(body, encoding)
+                            headers.append((b'content-length', str(len(compressed)).encode('latin-1')))
+                            record(encoding, len(body), len(compressed))
+                            body = compressed
+                await send({**start, "headers": headers})
+                start = True
+            if stream is not None:
+                sizes[0] += len(body)
+                body = stream.compress(body)
+                if not more_body:
+                    body += stream.flush()
+                sizes[1] += len(body)
+                if not more_body:
+                    record(encoding, *sizes)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _add_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    for i, (k, v) in enumerate(headers):
+        if k.lower() == b'vary':
+            if b'accept-encoding' not in v.lower():
+                headers[i] = (k, v + b', Accept-Encoding')
+            return headers
+    return headers + [(b'vary', b'Accept-Encoding')]
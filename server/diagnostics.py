@@ -0,0 +1,223 @@
+# server/diagnostics.py
+"""On-demand profiles, allocation snapshots and stack dumps, returned as files.
+
+Nothing is installed until a capture is asked for: profiles run for the
+requested number of seconds and then remove themselves, and tracemalloc only
+traces between an explicit start and stop.
+"""
+
+import asyncio
+import base64
+import cProfile
+import hmac
+import io
+import linecache
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, NamedTuple, Optional
+
+# Longest profile one request can ask for, and how often the sampler looks.
+DIAGNOSTICS_MAX_SECONDS = float(os.getenv('DIAGNOSTICS_MAX_SECONDS', 120))
+SAMPLE_INTERVAL = float(os.getenv('DIAGNOSTICS_SAMPLE_INTERVAL_MS', 5)) / 1000
+# Lines of a cProfile text report.
+PROFILE_REPORT_LINES = 100
+
+_capturing = threading.Lock()
+_memory_lock = threading.Lock()
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+# Leave the tracer's own bookkeeping, and the source lines cached while
+# formatting reports, out of allocation reports.
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+
+class Artifact(NamedTuple):
+    filename: str
+    content_type: str
+    data: bytes
+
+    def to_result(self) -> Dict[str, Any]:
+        """JSON-RPC form; the data is base64."""
+        return {"filename": self.filename, "content_type": self.content_type,
+                "data": base64.b64encode(self.data).decode('ascii')}
+
+    @classmethod
+    def from_result(cls, result: Dict[str, Any]) -> "Artifact":
+        return cls(result["filename"], result["content_type"], base64.b64decode(result["data"]))
+
+
+def authorized(header: Optional[str], token: Optional[str]) -> bool:
+    """Whether an Authorization header carries ``Bearer <token>``."""
+    if not token or not header:
+        return False
+    scheme, _, value = header.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(value.strip().encode(), token.encode())
+
+
+def _text(label: str, kind: str, text: str) -> Artifact:
+    return Artifact(f"{label}-{kind}-{time.strftime('%Y%m%d-%H%M%S')}.txt", "text/plain; charset=utf-8", text.encode('utf-8'))
+
+
+def _duration(seconds: Any) -> float:
+    seconds = float(seconds)
+    if not 0 < seconds <= DIAGNOSTICS_MAX_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {DIAGNOSTICS_MAX_SECONDS:g}")
+    return seconds
+
+
+@contextmanager
+def _capture():
+    # One profile at a time per process: two would mostly measure each other.
+    if not _capturing.acquire(blocking=False):
+        raise ValueError("A profile is already being captured")
+    try:
+        yield
+    finally:
+        _capturing.release()
+
+
+# -- profiles -------------------------------------------------------------------
+
+def sample(seconds: float, label: str = "server") -> Artifact:
+    """Sample every thread's stack for ``seconds``; folded stacks, one line per stack with its count.
+
+    Blocks the calling thread. The output loads into speedscope or flamegraph.pl.
+    """
+    seconds = _duration(seconds)
+    me = threading.get_ident()
+    counts: Counter = Counter()
+    with _capture():
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    counts[_folded(names.get(ident, str(ident)), frame)] += 1
+            time.sleep(SAMPLE_INTERVAL)
+    text = "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+    return Artifact(f"{label}-sampling-{time.strftime('%Y%m%d-%H%M%S')}.folded", "text/plain; charset=utf-8", text.encode('utf-8'))
+
+
+def _folded(thread_name: str, frame) -> str:
+    functions = []
+    while frame is not None:
+        code = frame.f_code
+        functions.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    functions.append(thread_name.replace(";", ":"))
+    return ";".join(reversed(functions))
+
+
+async def cprofile(seconds: float, fmt: str = "text", label: str = "server") -> Artifact:
+    """Deterministically profile the running event loop's thread for ``seconds``.
+
+    ``fmt`` "text" gives a report by cumulative time; "pstats" the raw stats,
+    as written by ``pstats.Stats.dump_stats``. Work handed to other threads
+    is not seen; the sampler covers those.
+    """
+    seconds = _duration(seconds)
+    if fmt not in ("text", "pstats"):
+        raise ValueError(f"Unknown profile format: {fmt}")
+    profiler = cProfile.Profile()
+    with _capture():
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+    stats = pstats.Stats(profiler)
+    if fmt == "pstats":
+        return Artifact(f"{label}-cprofile-{time.strftime('%Y%m%d-%H%M%S')}.pstats", "application/octet-stream", marshal.dumps(stats.stats))
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_REPORT_LINES)
+    return _text(label, "cprofile", out.getvalue())
+
+
+async def profile(seconds: float, mode: str = "sampling", fmt: str = "text", label: str = "server") -> Artifact:
+    """A ``mode`` "sampling" or "cprofile" profile, from within an event loop."""
+    if mode == "sampling":
+        return await asyncio.to_thread(sample, seconds, label)
+    if mode == "cprofile":
+        return await cprofile(seconds, fmt, label)
+    raise ValueError(f"Unknown profile mode: {mode}")
+
+
+# -- memory ---------------------------------------------------------------------
+
+def memory(action: str, limit: int = 25, frames: int = 1, label: str = "server") -> Artifact:
+    """``start`` or ``stop`` tracing allocations, or report a ``snapshot``.
+
+    A snapshot lists the top ``limit`` allocation sites, and how they changed
+    since the previous snapshot. ``frames`` > 1 groups sites by traceback.
+    """
+    global _last_snapshot
+    limit = max(1, int(limit))
+    with _memory_lock:
+        if action == "start":
+            if tracemalloc.is_tracing():
+                raise ValueError("Allocations are already being traced")
+            frames = max(1, int(frames))
+            tracemalloc.start(frames)
+            _last_snapshot = None
+            return _text(label, "memory", f"Tracing allocations, {frames} frame(s) per traceback\n")
+        if action == "stop":
+            if not tracemalloc.is_tracing():
+                raise ValueError("Allocations are not being traced")
+            tracemalloc.stop()
+            _last_snapshot = None
+            return _text(label, "memory", "Stopped tracing allocations\n")
+        if action != "snapshot":
+            raise ValueError(f"Unknown memory action: {action}")
+        if not tracemalloc.is_tracing():
+            raise ValueError("Allocations are not being traced; start tracing first")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        current, peak = tracemalloc.get_traced_memory()
+        key = "traceback" if tracemalloc.get_traceback_limit() > 1 else "lineno"
+        lines = [f"Traced memory: {current} bytes, peak {peak} bytes", "", f"Top {limit} allocation sites:"]
+        for stat in snapshot.statistics(key)[:limit]:
+            lines.append(str(stat))
+            if key == "traceback":
+                lines.extend("    " + line for line in stat.traceback.format())
+        if _last_snapshot is not None:
+            lines += ["", f"Top {limit} changes since the previous snapshot:"]
+            lines += [str(stat) for stat in snapshot.compare_to(_last_snapshot, key)[:limit]]
+        _last_snapshot = snapshot
+        return _text(label, "memory", "\n".join(lines) + "\n")
+
+
+# -- stacks ---------------------------------------------------------------------
+
+def stacks(label: str = "server") -> Artifact:
+    """Every thread's stack, and every asyncio task's when called from an event loop."""
+    out = io.StringIO()
+    threads = {thread.ident: thread for thread in threading.enumerate()}
+    frames = sys._current_frames()
+    out.write(f"{len(frames)} threads:\n\n")
+    for ident, frame in frames.items():
+        thread = threads.get(ident)
+        name = thread.name if thread else "?"
+        daemon = " daemon" if thread is not None and thread.daemon else ""
+        out.write(f"Thread {name} ({ident}){daemon}:\n{''.join(traceback.format_stack(frame))}\n")
+    try:
+        tasks = asyncio.all_tasks()
+    except RuntimeError:
+        tasks = None  # no running loop
+    if tasks is not None:
+        out.write(f"{len(tasks)} asyncio tasks:\n\n")
+        for task in sorted(tasks, key=lambda t: t.get_name()):
+            task.print_stack(file=out)
+            out.write("\n")
+    return _text(label, "stacks", out.getvalue())
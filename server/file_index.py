@@ -0,0 +1,319 @@
+# server/file_index.py
+
+import hashlib
+import logging
+import mmap
+import os
+import stat
+import struct
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"MCPIDX01"
+_HEADER = struct.Struct("<8sQQH")      # magic, file count, dir count, root path length
+_DIR = struct.Struct("<qH")            # mtime_ns, path length
+_FILE = struct.Struct("<QqQ?32sH")     # size, mtime_ns, inode, has digest, sha256, path length
+HASH_CHUNK_SIZE = 1024 * 1024
+# Directory mtimes this close to "now" may still change within the same
+# timestamp tick, so such directories are rescanned on the next reconcile.
+RACY_WINDOW_NS = 2_000_000_000
+
+INDEX_DIRECTORIES = Counter('mcp_server_index_directories_total', 'Directories visited by index reconciliation, by result', ['result'])
+CACHE_LOOKUPS = Counter('mcp_server_cache_lookups_total', 'Cache lookups, by cache and result', ['cache', 'result'])
+
+
+class FileEntry:
+    __slots__ = ("size", "mtime_ns", "inode", "digest")
+
+    def __init__(self, size: int, mtime_ns: int, inode: int, digest: Optional[bytes] = None):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.digest = digest
+
+    @classmethod
+    def from_stat(cls, st: os.stat_result) -> "FileEntry":
+        return cls(st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def matches(self, st: os.stat_result) -> bool:
+        return (self.size, self.mtime_ns, self.inode) == (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def _rel(parent: str, name: str) -> str:
+    return f"{parent}/{name}" if parent else name
+
+
+def _parent(rel_path: str) -> str:
+    return rel_path.rpartition("/")[0]
+
+
+class FileIndex:
+    """Metadata for every file under ``root``, keyed by '/'-separated relative path.
+
+    Directory mtimes are remembered so ``reconcile`` only re-lists directories
+    whose entries changed. The index persists to a compact binary snapshot so
+    a restart starts from the previous state instead of a full scan.
+    """
+
+    def __init__(self, root: str, snapshot_path: Optional[str] = None, ignore_suffixes: Tuple[str, ...] = (".lock",),
+                 ignore_dirs: Tuple[str, ...] = ()):
+        self.root = os.path.realpath(root)
+        self.snapshot_path = snapshot_path
+        self.ignore_suffixes = ignore_suffixes
+        # Relative directories left out entirely, e.g. server state kept in the root.
+        self.ignore_dirs = frozenset(ignore_dirs)
+        self.files: Dict[str, FileEntry] = {}
+        self.dirs: Dict[str, int] = {}
+        self._children: Dict[str, Set[str]] = defaultdict(set)
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    def _set(self, rel_path: str, entry: FileEntry):
+        self.files[rel_path] = entry
+        self._children[_parent(rel_path)].add(rel_path)
+
+    def _pop(self, rel_path: str) -> Optional[FileEntry]:
+        entry = self.files.pop(rel_path, None)
+        if entry is not None:
+            siblings = self._children.get(_parent(rel_path))
+            if siblings is not None:
+                siblings.discard(rel_path)
+        return entry
+
+    def _abs(self, rel_path: str) -> str:
+        return os.path.join(self.root, *rel_path.split("/")) if rel_path else self.root
+
+    # -- snapshot -----------------------------------------------------------
+
+    def load(self) -> bool:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        start = time.perf_counter()
+        try:
+            with open(self.snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                files, dirs = self._decode(buf)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Ignoring unreadable index snapshot {self.snapshot_path}: {e}")
+            return False
+        if files is None:
+            logger.info("Index snapshot belongs to a different storage root; rebuilding")
+            return False
+        with self._lock:
+            self.files, self.dirs = files, dirs
+            self._children = defaultdict(set)
+            for rel_path in files:
+                self._children[_parent(rel_path)].add(rel_path)
+        logger.info(f"Loaded index snapshot with {len(files)} files in {time.perf_counter() - start:.3f}s")
+        return True
+
+    def _decode(self, buf) -> Tuple[Optional[Dict[str, FileEntry]], Dict[str, int]]:
+        magic, file_count, dir_count, root_len = _HEADER.unpack_from(buf, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("bad magic")
+        offset = _HEADER.size
+        root = bytes(buf[offset:offset + root_len]).decode("utf-8")
+        offset += root_len
+        if root != self.root:
+            return None, {}
+        dirs: Dict[str, int] = {}
+        for _ in range(dir_count):
+            mtime_ns, length = _DIR.unpack_from(buf, offset)
+            offset += _DIR.size
+            dirs[bytes(buf[offset:offset + length]).decode("utf-8")] = mtime_ns
+            offset += length
+        files: Dict[str, FileEntry] = {}
+        for _ in range(file_count):
+            size, mtime_ns, inode, has_digest, digest, length = _FILE.unpack_from(buf, offset)
+            offset += _FILE.size
+            files[bytes(buf[offset:offset + length]).decode("utf-8")] = FileEntry(
+                size, mtime_ns, inode, digest if has_digest else None
+            )
+            offset += length
+        return files, dirs
+
+    def save(self):
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            root = self.root.encode("utf-8")
+            parts = [_HEADER.pack(SNAPSHOT_MAGIC, len(self.files), len(self.dirs), len(root)), root]
+            for rel_dir, mtime_ns in self.dirs.items():
+                encoded = rel_dir.encode("utf-8")
+                parts.append(_DIR.pack(mtime_ns, len(encoded)))
+                parts.append(encoded)
+            for rel_path, entry in self.files.items():
+                encoded = rel_path.encode("utf-8")
+                parts.append(_FILE.pack(entry.size, entry.mtime_ns, entry.inode, entry.digest is not None,
+                                        entry.digest or b"", len(encoded)))
+                parts.append(encoded)
+            self.dirty = False
+        os.makedirs(os.path.dirname(os.path.abspath(self.snapshot_path)), exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(parts))
+        os.replace(tmp_path, self.snapshot_path)
+
+    # -- reconciliation -----------------------------------------------------
+
+    def reconcile(self) -> List[Tuple[str, str]]:
+        """Bring the index up to date, re-listing only directories whose mtime moved.
+
+        Returns the ``(kind, rel_path)`` changes found, kind being
+        "created", "modified" or "deleted". The walk stats and lists without
+        the lock, so the write path and lookups are not held up by it; the
+        lock covers applying one directory's listing at a time.
+        """
+        changes: List[Tuple[str, str]] = []
+        with self._lock:
+            subdirs: Dict[str, List[str]] = defaultdict(list)
+            for rel_dir in self.dirs:
+                if rel_dir:
+                    subdirs[_parent(rel_dir)].append(rel_dir)
+            known = dict(self.dirs)
+        seen_dirs = set()
+        stack = [""]
+        now_ns = time.time_ns()
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                st = os.stat(self._abs(rel_dir))
+            except FileNotFoundError:
+                continue
+            seen_dirs.add(rel_dir)
+            if known.get(rel_dir) == st.st_mtime_ns:
+                INDEX_DIRECTORIES.labels("reused").inc()
+                stack.extend(subdirs.get(rel_dir, ()))
+                continue
+            INDEX_DIRECTORIES.labels("rescanned").inc()
+            listed_dirs, listed_files = self._list(rel_dir)
+            with self._lock:
+                self._apply(rel_dir, listed_files, changes)
+                self.dirs[rel_dir] = 0 if now_ns - st.st_mtime_ns < RACY_WINDOW_NS else st.st_mtime_ns
+                self.dirty = True
+            stack.extend(listed_dirs)
+        with self._lock:
+            for rel_dir in [d for d in self.dirs if d not in seen_dirs]:
+                if os.path.isdir(self._abs(rel_dir)):
+                    continue  # created by a write while the walk went on; listed next time
+                del self.dirs[rel_dir]
+                for rel_path in self._children.pop(rel_dir, ()):
+                    if self.files.pop(rel_path, None) is not None:
+                        changes.append(("deleted", rel_path))
+                self.dirty = True
+        return changes
+
+    def _list(self, rel_dir: str) -> Tuple[List[str], Dict[str, os.stat_result]]:
+        subdirs, files = [], {}
+        try:
+            with os.scandir(self._abs(rel_dir)) as it:
+                for entry in it:
+                    rel_path = _rel(rel_dir, entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        if rel_path not in self.ignore_dirs:
+                            subdirs.append(rel_path)
+                    elif entry.is_file(follow_symlinks=False) and not entry.name.endswith(self.ignore_suffixes):
+                        files[rel_path] = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            pass
+        return subdirs, files
+
+    def _apply(self, rel_dir: str, listed: Dict[str, os.stat_result], changes: List[Tuple[str, str]]):
+        # The listing may predate a write recorded since: anything that looks
+        # changed or gone is looked at again before the index follows it.
+        for rel_path in set(listed) | self._children.get(rel_dir, set()):
+            st = listed.get(rel_path)
+            current = self.files.get(rel_path)
+            if st is not None and current is not None and current.matches(st):
+                continue
+            try:
+                st = os.stat(self._abs(rel_path), follow_symlinks=False)
+            except FileNotFoundError:
+                st = None
+            if st is None or not stat.S_ISREG(st.st_mode):
+                if self._pop(rel_path) is not None:
+                    changes.append(("deleted", rel_path))
+            elif current is None or not current.matches(st):
+                self._set(rel_path, FileEntry.from_stat(st))
+                changes.append(("created" if current is None else "modified", rel_path))
+
+    # -- updates from the write path -----------------------------------------
+
+    def update(self, rel_path: str, digest: Optional[bytes] = None):
+        """Record a file the server just wrote (optionally with its known sha256)."""
+        try:
+            st = os.stat(self._abs(rel_path))
+        except FileNotFoundError:
+            self.remove(rel_path)
+            return
+        with self._lock:
+            entry = FileEntry.from_stat(st)
+            entry.digest = digest
+            if rel_path not in self.files:
+                self._invalidate_dirs(rel_path)
+            self._set(rel_path, entry)
+            self.dirty = True
+
+    def remove(self, rel_path: str):
+        with self._lock:
+            if self._pop(rel_path) is not None:
+                self._invalidate_dirs(rel_path)
+                self.dirty = True
+
+    def move(self, src: str, dst: str):
+        """Re-key a renamed file; a rename keeps its size, mtime, inode and digest."""
+        with self._lock:
+            entry = self._pop(src)
+            if entry is None:
+                self.update(dst)
+                return
+            self._invalidate_dirs(src)
+            if dst not in self.files:
+                self._invalidate_dirs(dst)
+            self._set(dst, entry)
+            self.dirty = True
+
+    def _invalidate_dirs(self, rel_path: str):
+        # Creating a file may also have created its parent directories; forget
+        # their mtimes so the next reconcile re-lists them once.
+        parent = _parent(rel_path)
+        while True:
+            self.dirs[parent] = 0
+            if not parent:
+                break
+            parent = _parent(parent)
+
+    # -- queries --------------------------------------------------------------
+
+    def get(self, rel_path: str) -> Optional[FileEntry]:
+        return self.files.get(rel_path)
+
+    def paths(self) -> List[str]:
+        with self._lock:
+            return sorted(self.files)
+
+    def digest(self, rel_path: str) -> str:
+        """sha256 of a file's content, recomputed only if size/mtime/inode changed."""
+        st = os.stat(self._abs(rel_path))
+        with self._lock:
+            entry = self.files.get(rel_path)
+            if entry is not None and entry.digest is not None and entry.matches(st):
+                CACHE_LOOKUPS.labels("digest", "hit").inc()
+                return entry.digest.hex()
+        CACHE_LOOKUPS.labels("digest", "miss").inc()
+        sha = hashlib.sha256()
+        with open(self._abs(rel_path), "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                sha.update(chunk)
+        with self._lock:
+            entry = FileEntry.from_stat(st)
+            entry.digest = sha.digest()
+            self._set(rel_path, entry)
+            self.dirty = True
+        return sha.hexdigest()
+
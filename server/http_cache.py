@@ -0,0 +1,92 @@
+# server/http_cache.py
+"""Validators for conditional GETs that the bridges can check without the MCP server."""
+
+import os
+import re
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+
+def stat_etag(size: int, mtime_ns: int, inode: int) -> str:
+    # Stored files are always replaced rather than rewritten in place, so a
+    # new content means a new inode or mtime.
+    return f'"{inode:x}-{size:x}-{mtime_ns:x}"'
+
+
+def stat_stored_file(directory: str, filename: str) -> Optional[os.stat_result]:
+    """stat() a stored file by its relative name, or None if unsafe or missing."""
+    if '..' in filename or filename.startswith('/') or filename.startswith('\\'):
+        return None
+    base = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(base, filename))
+    if not path.startswith(base + os.sep):
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st if stat.S_ISREG(st.st_mode) else None
+
+
+def not_modified(headers: Mapping[str, str], etag: str, mtime: Optional[float] = None) -> bool:
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since and mtime is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def validator_headers(etag: Optional[str], mtime: Optional[float] = None) -> Dict[str, str]:
+    """ETag/Last-Modified plus ``no-cache`` so browsers revalidate before reuse."""
+    if etag is None:
+        return {}
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if mtime is not None:
+        headers['Last-Modified'] = formatdate(mtime, usegmt=True)
+    return headers
+
+
+def result_validators(mcp_result: Dict[str, Any]) -> Dict[str, str]:
+    """Validator headers for the file stat a read_file result reports."""
+    st = mcp_result.get("stat")
+    if not st:
+        return {}
+    return validator_headers(stat_etag(st["size"], st["mtime_ns"], st["inode"]), st["mtime_ns"] / 1e9)
+
+
+def requested_range(headers: Mapping[str, str]) -> Optional[Tuple[int, Optional[int]]]:
+    """(offset, length) of a single-range ``Range: bytes=...`` request, as read_file takes them.
+
+    A suffix range ``bytes=-N`` gives a negative offset and no length. Returns
+    None when the whole file should be sent: no Range, several ranges, one
+    that does not parse, or an If-Range (not worth a round trip to check).
+    """
+    header = headers.get('Range')
+    if not header or headers.get('If-Range') is not None:
+        return None
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header, re.IGNORECASE)
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        return (-int(last), None) if int(last) else None
+    if not last:
+        return int(first), None
+    if int(last) < int(first):
+        return None
+    return int(first), int(last) - int(first) + 1
+
+
+def content_range(offset: int, length: int, size: int) -> str:
+    """Content-Range of a 206 response, or of a 416 one when ``length`` is 0."""
+    if not length:
+        return f"bytes */{size}"
+    return f"bytes {offset}-{offset + length - 1}/{size}"
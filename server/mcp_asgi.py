@@ -0,0 +1,822 @@
+# server/mcp_asgi.py
+
+import base64
+import functools
+import io
+import logging
+import math
+import mimetypes
+import os
+import time
+import zipfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+import diagnostics
+import tracing
+from compression import CompressionMiddleware, precompressed_variant, static_cache_control
+from http_cache import (
+    content_range, not_modified, requested_range, result_validators, stat_etag, stat_stored_file, validator_headers
+)
+from change_feed import ChangeFeed, FEED_SUBSCRIBERS, RESET, event_id, format_event, format_reset
+from mcp_client import INVALID_PARAMS, PRECONDITION_FAILED, MCPClient, request_context
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Gauge, Histogram
+
+# Load environment variables
+load_dotenv()
+os.environ['MCP_DOTENV_LOADED'] = '1'  # spawned MCP servers can skip re-reading .env
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configuration
+FILE_DIRECTORY = os.getenv('FILE_STORAGE_PATH', 'uploaded_files')
+# Conditional GETs are answered from a local stat() only when the MCP server
+# stores files on this disk.
+LOCAL_STORAGE = os.getenv('STORAGE_BACKEND', 'local').lower() == 'local'
+MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 10 * 1024 * 1024))
+# Uploads sent with extract=true unpack these on the MCP server.
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.gz')
+# Bearer token for the /api/admin diagnostics endpoints; they are off without one.
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# Serve the output of build_frontend.py (hashed, precompressed assets) when present.
+FRONTEND_DIRECTORY = (Path(__file__).parent.parent / 'frontend').resolve()
+if (FRONTEND_DIRECTORY / 'dist' / 'index.html').is_file():
+    FRONTEND_DIRECTORY = FRONTEND_DIRECTORY / 'dist'
+STREAM_CHUNK_SIZE = 64 * 1024
+CHANGE_FEED_SIZE = int(os.getenv('CHANGE_FEED_SIZE', 1000))
+SSE_KEEPALIVE_INTERVAL = 15.0
+# POST /api/sync/{action} -> MCP tool
+SYNC_TOOLS = {"signatures": "get_block_signatures", "pull": "pull_files", "push": "push_files"}
+
+# Ensure directory exists
+Path(FILE_DIRECTORY).mkdir(exist_ok=True)
+
+HTTP_REQUESTS = Counter('mcp_asgi_http_requests_total', 'HTTP requests served, by route and status', ['route', 'status'])
+HTTP_DURATION = Histogram('mcp_asgi_http_request_duration_seconds', 'HTTP request latency to first response byte, by route', ['route'])
+HTTP_INFLIGHT = Gauge('mcp_asgi_http_inflight_requests', 'HTTP requests currently being served')
+
+# One multiplexed client per worker process. Every request handler shares it,
+# so idle connections cost a coroutine rather than a thread.
+mcp_client = MCPClient()
+change_feed = ChangeFeed(CHANGE_FEED_SIZE)
+
+
+def handle_notification(message: dict):
+    if message.get("method") == "notifications/file_changed":
+        change_feed.publish(message.get("params") or {})
+
+
+mcp_client.on_notification = handle_notification
+
+validate_file_extension = MCPClient.validate_file_extension
+
+
+def error(message: str, status_code: int) -> JSONResponse:
+    return JSONResponse({"success": False, "message": message}, status_code=status_code)
+
+
+class _ZipChunkSink(io.RawIOBase):
+    """Write-only sink that lets ZipFile emit an archive chunk by chunk."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = next((r.path for r in routes if r.matches(scope)[0] == Match.FULL), "unmatched")
+        start = time.perf_counter()
+        status = [500]
+        headers = dict(scope.get("headers") or [])
+        trace = tracing.start_trace(
+            f"HTTP {scope['method']} {route}",
+            headers.get(b"traceparent", b"").decode("latin-1") or None,
+            **{"http.method": scope["method"], "http.route": route}
+        )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                HTTP_DURATION.labels(route).observe(time.perf_counter() - start)
+            await send(message)
+
+        with HTTP_INFLIGHT.track_inprogress(), trace:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                HTTP_REQUESTS.labels(route, status[0]).inc()
+                trace.span.set_attribute("http.status_code", status[0])
+                if status[0] >= 500:
+                    trace.span.record_error(f"HTTP {status[0]}")
+
+
+class LoadSheddingMiddleware:
+    """Tags MCP calls with the client address and turns shed requests into 429s and quota refusals into 507s."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        context = {"client": (scope.get("client") or ("local",))[0]}
+        request_context.set(context)
+
+        async def send_wrapper(message):
+            overloaded = context.get("overloaded")
+            if message["type"] == "http.response.start" and overloaded is not None and message["status"] >= 400:
+                retry_after = str(math.ceil(overloaded.get("retry_after", 1)))
+                message = {**message, "status": 429, "headers": [*message.get("headers", []), (b"retry-after", retry_after.encode())]}
+            elif message["type"] == "http.response.start" and context.get("quota_exceeded") and message["status"] >= 400:
+                message = {**message, "status": 507}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+async def upload_files(request: Request):
+    try:
+        form = await request.form()
+        files = form.getlist('files')
+        if not files:
+            return error("No files provided", 400)
+        extract = str(form.get('extract', '')).lower() in ('1', 'true', 'on')
+        uploaded_files = []
+        skipped = []
+        for file in files:
+            if not file.filename:
+                continue
+            if not validate_file_extension(file.filename):
+                logger.warning(f"Invalid file extension for {file.filename}")
+                continue
+            if file.size is not None and file.size > MAX_FILE_SIZE:
+                return error(f"File {file.filename} exceeds maximum size of {MAX_FILE_SIZE} bytes", 400)
+            if extract and file.filename.lower().endswith(ARCHIVE_SUFFIXES):
+                # Unpacked next to where the archive would have been stored.
+                result = await mcp_client.call_tool("extract_archive", {
+                    "archive": base64.b64encode(await file.read()).decode('ascii'),
+                    "archive_name": file.filename,
+                    "destination": file.filename.rpartition('/')[0],
+                    "overwrite": True
+                })
+                if result.get("success"):
+                    for entry in result.get("result", {}).get("files", []):
+                        if entry["status"] in ("created", "modified"):
+                            uploaded_files.append(entry["path"])
+                        else:
+                            skipped.append(f"{entry['path']}: {entry.get('error', entry['status'])}")
+                    if result["result"].get("error"):
+                        skipped.append(f"{file.filename}: {result['result']['error']}")
+                    logger.info(f"Extracted archive via MCP: {file.filename}")
+                else:
+                    skipped.append(f"{file.filename}: {result.get('error')}")
+                    logger.error(f"MCP extraction failed for {file.filename}: {result.get('error')}")
+                continue
+            content = (await file.read()).decode('utf-8', errors='replace')
+            result = await mcp_client.call_tool("create_file", {
+                "filename": file.filename,
+                "content": content
+            })
+            if result.get("success"):
+                uploaded_files.append(file.filename)
+                logger.info(f"Uploaded file via MCP: {file.filename}")
+            else:
+                logger.error(f"MCP upload failed for {file.filename}: {result.get('error')}")
+        if not uploaded_files:
+            return JSONResponse({"success": False, "message": "No valid files uploaded", "skipped": skipped}, status_code=400)
+        return JSONResponse({
+            "success": True,
+            "message": f"Uploaded {len(uploaded_files)} files",
+            "files": uploaded_files,
+            "skipped": skipped
+        })
+    except Exception as e:
+        logger.error(f"Upload error: {e}")
+        return error(f"Upload failed: {str(e)}", 500)
+
+
+def local_not_modified(request: Request, filename: str):
+    """304 response if the client's copy of a stored file is current, checked without the MCP server."""
+    st = stat_stored_file(FILE_DIRECTORY, filename) if LOCAL_STORAGE else None
+    if st is None:
+        return None
+    etag = stat_etag(st.st_size, st.st_mtime_ns, st.st_ino)
+    if not_modified(request.headers, etag, st.st_mtime):
+        return Response(status_code=304, headers=validator_headers(etag, st.st_mtime))
+    return None
+
+
+async def list_files(request: Request):
+    try:
+        # The listing only changes with a change notification, so the feed
+        # position identifies it.
+        etag = change_feed.listing_etag()
+        if etag and not_modified(request.headers, etag):
+            return Response(status_code=304, headers=validator_headers(etag))
+        result = await mcp_client.call_tool("list_files", {})
+        if result.get("success"):
+            files = result.get("result", {}).get("files", [])
+            return JSONResponse({"success": True, "files": files}, headers=validator_headers(etag))
+        return error(result.get("error", "Failed to list files"), 500)
+    except Exception as e:
+        logger.error(f"List files error: {e}")
+        return error(f"Failed to list files: {str(e)}", 500)
+
+
+async def get_file_content(request: Request):
+    filename = request.path_params['filename']
+    try:
+        if not validate_file_extension(filename):
+            return error(f"Invalid file extension for {filename}", 400)
+        cached = local_not_modified(request, filename)
+        if cached is not None:
+            return cached
+        result = await mcp_client.call_tool("read_file", {"filename": filename})
+        if result.get("success"):
+            mcp_result = result.get("result", {})
+            return JSONResponse(
+                {"success": True, "content": mcp_result.get("file_content", ""), "hash": mcp_result.get("sha256")},
+                headers=result_validators(mcp_result)
+            )
+        return error(result.get("error", "File not found"), 404)
+    except Exception as e:
+        logger.error(f"Get file error: {e}")
+        return error(f"Failed to read file: {str(e)}", 500)
+
+
+async def create_file(request: Request):
+    try:
+        data = await request.json()
+        filename = data.get('filename')
+        content = data.get('content', '')
+        if not filename:
+            return error("Filename required", 400)
+        if not validate_file_extension(filename):
+            return error(f"Invalid file extension for {filename}", 400)
+        result = await mcp_client.call_tool("create_file", {
+            "filename": filename,
+            "content": content
+        })
+        if result.get("success"):
+            logger.info(f"Created file via MCP: {filename}")
+            return JSONResponse({"success": True, "message": "File created successfully", "hash": result.get("result", {}).get("sha256")})
+        return error(result.get("error", "Creation failed"), 500)
+    except Exception as e:
+        logger.error(f"Create file error: {e}")
+        return error(f"Create failed: {str(e)}", 500)
+
+
+async def edit_file(request: Request):
+    try:
+        data = await request.json()
+        filename = data.get('filename')
+        prompt = data.get('prompt')
+        new_content = data.get('content')
+        use_ai = data.get('use_ai', False)
+        if not filename:
+            return error("Filename required", 400)
+        if not validate_file_extension(filename):
+            return error(f"Invalid file extension for {filename}", 400)
+        if use_ai and prompt:
+            arguments = {"filename": filename, "prompt": prompt, "use_ai": True}
+        else:
+            arguments = {"filename": filename, "content": new_content or "", "use_ai": False}
+        result = await mcp_client.call_tool("edit_file", arguments)
+        if result.get("success"):
+            mcp_result = result.get("result", {})
+            response_data = {"success": True, "message": "File edited successfully", "hash": mcp_result.get("sha256")}
+            if "new_content" in mcp_result:
+                response_data["new_content"] = mcp_result["new_content"]
+            logger.info(f"Edited file via MCP: {filename}")
+            return JSONResponse(response_data)
+        if result.get("code") == PRECONDITION_FAILED:
+            return JSONResponse({
+                "success": False,
+                "message": result.get("error"),
+                "current_hash": result.get("data", {}).get("current_hash")
+            }, status_code=409)
+        return error(result.get("error", "Edit failed"), 500)
+    except Exception as e:
+        logger.error(f"Edit file error: {e}")
+        return error(f"Edit failed: {str(e)}", 500)
+
+
+async def patch_file(request: Request):
+    try:
+        data = await request.json()
+        filename = data.get('filename')
+        if not filename:
+            return error("Filename required", 400)
+        if not validate_file_extension(filename):
+            return error(f"Invalid file extension for {filename}", 400)
+        arguments = {key: data[key] for key in ('filename', 'base_hash', 'operations', 'diff') if data.get(key) is not None}
+        result = await mcp_client.call_tool("patch_file", arguments)
+        if result.get("success"):
+            logger.info(f"Patched file via MCP: {filename}")
+            return JSONResponse({"success": True, "message": "File patched successfully", "hash": result.get("result", {}).get("sha256")})
+        if result.get("code") == PRECONDITION_FAILED:
+            return JSONResponse({
+                "success": False,
+                "message": result.get("error"),
+                "current_hash": result.get("data", {}).get("current_hash")
+            }, status_code=409)
+        if result.get("code") == INVALID_PARAMS:
+            return error(result.get("error"), 422)
+        return error(result.get("error", "Patch failed"), 500)
+    except Exception as e:
+        logger.error(f"Patch file error: {e}")
+        return error(f"Patch failed: {str(e)}", 500)
+
+
+async def delete_file(request: Request):
+    try:
+        data = await request.json()
+        filename = data.get('filename')
+        if not filename:
+            return error("Filename required", 400)
+        if not validate_file_extension(filename):
+            return error(f"Invalid file extension for {filename}", 400)
+        result = await mcp_client.call_tool("delete_file", {"filename": filename})
+        if result.get("success"):
+            logger.info(f"Deleted file via MCP: {filename}")
+            return JSONResponse({"success": True, "message": "File deleted successfully"})
+        return error(result.get("error", "Delete failed"), 500)
+    except Exception as e:
+        logger.error(f"Delete file error: {e}")
+        return error(f"Delete failed: {str(e)}", 500)
+
+
+async def transfer_file(request: Request):
+    action = request.path_params['action']
+    if action not in ("copy", "move"):
+        return error(f"Unknown file action: {action}", 404)
+    try:
+        data = await request.json()
+        source = data.get('source')
+        destination = data.get('destination')
+        if not source or not destination:
+            return error("Source and destination required", 400)
+        if data.get('directory'):
+            result = await mcp_client.call_tool(f"{action}_directory", {"source": source, "destination": destination})
+        else:
+            for filename in (source, destination):
+                if not validate_file_extension(filename):
+                    return error(f"Invalid file extension for {filename}", 400)
+            result = await mcp_client.call_tool(f"{action}_file", {"source": source, "destination": destination,
+                                                                   "overwrite": bool(data.get('overwrite'))})
+        if result.get("success"):
+            logger.info(f"{action.capitalize()} via MCP: {source} -> {destination}")
+            return JSONResponse({"success": True, "message": result.get("result", {}).get("content", [{}])[0].get("text", "Done")})
+        return error(result.get("error", f"{action.capitalize()} failed"), 500)
+    except Exception as e:
+        logger.error(f"{action.capitalize()} file error: {e}")
+        return error(f"{action.capitalize()} failed: {str(e)}", 500)
+
+
+async def file_versions(request: Request):
+    filename = request.path_params['filename']
+    try:
+        if not validate_file_extension(filename):
+            return error(f"Invalid file extension for {filename}", 400)
+        version = request.query_params.get('version')
+        if version is None:
+            result = await mcp_client.call_tool("list_versions", {"filename": filename})
+            if result.get("success"):
+                return JSONResponse({"success": True, "versions": result.get("result", {}).get("versions", [])})
+        else:
+            result = await mcp_client.call_tool("read_version", {"filename": filename, "version": int(version)})
+            if result.get("success"):
+                return JSONResponse({"success": True, "content": result.get("result", {}).get("file_content", "")})
+        return error(result.get("error", "Version not found"), 404)
+    except Exception as e:
+        logger.error(f"Versions error: {e}")
+        return error(f"Failed to read versions: {str(e)}", 500)
+
+
+async def restore_version(request: Request):
+    try:
+        data = await request.json()
+        filename = data.get('filename')
+        version = data.get('version')
+        if not filename or version is None:
+            return error("Filename and version required", 400)
+        if not validate_file_extension(filename):
+            return error(f"Invalid file extension for {filename}", 400)
+        result = await mcp_client.call_tool("restore_version", {"filename": filename, "version": int(version)})
+        if result.get("success"):
+            logger.info(f"Restored version {version} of {filename} via MCP")
+            return JSONResponse({"success": True, "message": f"Restored version {version}"})
+        return error(result.get("error", "Restore failed"), 500)
+    except Exception as e:
+        logger.error(f"Restore version error: {e}")
+        return error(f"Restore failed: {str(e)}", 500)
+
+
+async def submit_ai_job(request: Request):
+    try:
+        data = await request.json()
+        filename = data.get('filename')
+        prompt = data.get('prompt')
+        if not filename or not prompt:
+            return error("Filename and prompt required", 400)
+        if not validate_file_extension(filename):
+            return error(f"Invalid file extension for {filename}", 400)
+        result = await mcp_client.call_tool("submit_ai_edit", {"filename": filename, "prompt": prompt})
+        if result.get("success"):
+            job = result.get("result", {}).get("job", {})
+            logger.info(f"Submitted AI job {job.get('id')} for {filename} via MCP")
+            return JSONResponse({"success": True, "job": job}, status_code=202)
+        return error(result.get("error", "Submit failed"), 500)
+    except Exception as e:
+        logger.error(f"Submit AI job error: {e}")
+        return error(f"Submit failed: {str(e)}", 500)
+
+
+async def ai_job(request: Request):
+    try:
+        tool = "cancel_ai_job" if request.method == 'DELETE' else "get_ai_job"
+        result = await mcp_client.call_tool(tool, {"job_id": request.path_params['job_id']})
+        if result.get("success"):
+            return JSONResponse({"success": True, "job": result.get("result", {}).get("job", {})})
+        return error(result.get("error", "Job not found"), 404)
+    except Exception as e:
+        logger.error(f"AI job error: {e}")
+        return error(f"AI job request failed: {str(e)}", 500)
+
+
+async def directory_tree(request: Request):
+    try:
+        depth = int(request.query_params.get('depth', 1))
+    except ValueError:
+        return error("depth must be an integer", 400)
+    try:
+        # Totals only change with a change notification, as the listing does.
+        etag = change_feed.listing_etag()
+        if etag and not_modified(request.headers, etag):
+            return Response(status_code=304, headers=validator_headers(etag))
+        result = await mcp_client.call_tool("tree", {"path": request.query_params.get('path', ''), "depth": depth})
+        if result.get("success"):
+            return JSONResponse({"success": True, "tree": result.get("result", {}).get("tree")}, headers=validator_headers(etag))
+        return error(result.get("error", "Directory not found"), 404)
+    except Exception as e:
+        logger.error(f"Directory tree error: {e}")
+        return error(f"Failed to list directory: {str(e)}", 500)
+
+
+async def sync_manifest(request: Request):
+    try:
+        # Like the listing, the manifest only changes with a change notification.
+        etag = change_feed.listing_etag()
+        if etag and not_modified(request.headers, etag):
+            return Response(status_code=304, headers=validator_headers(etag))
+        result = await mcp_client.call_tool("get_manifest", {"prefix": request.query_params.get('prefix', '')})
+        if result.get("success"):
+            return JSONResponse({"success": True, "files": result.get("result", {}).get("files", [])}, headers=validator_headers(etag))
+        return error(result.get("error", "Failed to build manifest"), 500)
+    except Exception as e:
+        logger.error(f"Sync manifest error: {e}")
+        return error(f"Failed to build manifest: {str(e)}", 500)
+
+
+async def sync_files(request: Request):
+    action = request.path_params['action']
+    tool = SYNC_TOOLS.get(action)
+    if tool is None:
+        return error(f"Unknown sync action: {action}", 404)
+    try:
+        result = await mcp_client.call_tool(tool, await request.json())
+        if result.get("success"):
+            return JSONResponse({"success": True, "files": result.get("result", {}).get("files", [])})
+        return error(result.get("error", "Sync failed"), 500)
+    except Exception as e:
+        logger.error(f"Sync {action} error: {e}")
+        return error(f"Sync failed: {str(e)}", 500)
+
+
+async def health_check(request: Request):
+    try:
+        tools = await mcp_client.list_tools()
+        ai_key = os.getenv('TOGETHER_AI_API_KEY')
+        ai_status = "available" if ai_key and ai_key != 'your_api_key_here' else "unavailable"
+        return JSONResponse({
+            "success": True,
+            "status": "healthy",
+            "mcp_server": "available" if tools else "unavailable",
+            "ai_service": ai_status,
+            "model": os.getenv('TOGETHER_AI_MODEL', 'meta-llama/Llama-3.3-70B-Instruct-Turbo') if ai_status == "available" else None
+        })
+    except Exception as e:
+        logger.error(f"Health check error: {e}")
+        return JSONResponse({
+            "success": False,
+            "status": "unhealthy",
+            "message": f"Health check failed: {str(e)}"
+        }, status_code=500)
+
+
+async def metrics(request: Request):
+    text = REGISTRY.render()
+    server_metrics = await mcp_client.get_metrics()
+    if server_metrics.get("success"):
+        text += server_metrics["text"]
+    else:
+        logger.warning(f"MCP server metrics unavailable: {server_metrics.get('error')}")
+    return Response(text, headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+
+async def slowest_traces(request: Request):
+    limit = int(request.query_params.get('limit', 10))
+    return JSONResponse({"success": True, "sample_rate": tracing.TRACE_SAMPLE_RATE, "traces": tracing.slowest(limit)})
+
+
+def admin_only(endpoint):
+    @functools.wraps(endpoint)
+    async def guarded(request: Request):
+        if not ADMIN_TOKEN:
+            return error("Diagnostics are disabled; set ADMIN_TOKEN to enable them", 404)
+        if not diagnostics.authorized(request.headers.get('authorization'), ADMIN_TOKEN):
+            return JSONResponse({"success": False, "message": "Admin token required"}, status_code=401,
+                                headers={"WWW-Authenticate": "Bearer"})
+        return await endpoint(request)
+    return guarded
+
+
+async def diagnose(request: Request, kind: str, local, params: dict):
+    """Run a capture in this bridge (?target=bridge) or in the MCP server, and send it as a download."""
+    target = request.query_params.get('target', 'server')
+    try:
+        if target == 'bridge':
+            artifact = await local()
+        elif target == 'server':
+            # The server asks socket clients for the same token.
+            result = await mcp_client.get_diagnostics(kind, {**params, "token": ADMIN_TOKEN})
+            if not result.get("success"):
+                return error(result.get("error", "Diagnostics failed"), 400 if result.get("code") else 500)
+            artifact = result["artifact"]
+        else:
+            return error(f"Unknown target: {target}", 400)
+    except ValueError as e:
+        return error(str(e), 400)
+    return Response(artifact.data, media_type=artifact.content_type, headers={
+        'Content-Disposition': f'attachment; filename="{artifact.filename}"',
+        'Cache-Control': 'no-store'
+    })
+
+
+@admin_only
+async def admin_profile(request: Request):
+    try:
+        seconds = float(request.query_params.get('seconds', 10))
+    except ValueError:
+        return error("seconds must be a number", 400)
+    mode = request.query_params.get('mode', 'sampling')
+    fmt = request.query_params.get('format', 'text')
+    return await diagnose(request, "profile", lambda: diagnostics.profile(seconds, mode, fmt, "bridge"),
+                          {"seconds": seconds, "mode": mode, "format": fmt})
+
+
+@admin_only
+async def admin_memory(request: Request):
+    action = request.path_params['action']
+    try:
+        limit = int(request.query_params.get('limit', 25))
+        frames = int(request.query_params.get('frames', 1))
+    except ValueError:
+        return error("limit and frames must be integers", 400)
+
+    async def local():
+        return diagnostics.memory(action, limit, frames, "bridge")
+    return await diagnose(request, "memory", local, {"action": action, "limit": limit, "frames": frames})
+
+
+@admin_only
+async def admin_stacks(request: Request):
+    async def local():
+        return diagnostics.stacks("bridge")
+    return await diagnose(request, "stacks", local, {})
+
+
+async def change_events(request: Request):
+    """Server-Sent Events stream of file changes; resumes from Last-Event-ID."""
+    last_event_id = request.headers.get('last-event-id') or request.query_params.get('last_event_id')
+
+    async def stream():
+        FEED_SUBSCRIBERS.inc()
+        cursor = last_event_id or change_feed.cursor()
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                events = await change_feed.wait_async(cursor, SSE_KEEPALIVE_INTERVAL)
+                if events == RESET:
+                    cursor = change_feed.cursor()
+                    yield format_reset(cursor)
+                elif events:
+                    yield "".join(format_event(params) for params in events)
+                    cursor = event_id(events[-1])
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            FEED_SUBSCRIBERS.dec()
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def download_file(request: Request):
+    filename = request.path_params['filename']
+    try:
+        if not validate_file_extension(filename):
+            return error(f"Invalid file extension for {filename}", 400)
+        cached = local_not_modified(request, filename)
+        if cached is not None:
+            return cached
+        byte_range = requested_range(request.headers)
+        if byte_range is not None:
+            return await download_range(filename, *byte_range)
+        result = await mcp_client.call_tool("read_file", {"filename": filename})
+        if not result.get("success"):
+            return error(result.get("error", "File not found"), 404)
+        content = result.get("result", {}).get("file_content", "").encode('utf-8')
+
+        async def chunks():
+            for offset in range(0, len(content), STREAM_CHUNK_SIZE):
+                yield content[offset:offset + STREAM_CHUNK_SIZE]
+
+        logger.info(f"Downloaded file: {filename}")
+        return StreamingResponse(
+            chunks(),
+            media_type='application/octet-stream',
+            headers={
+                'Content-Disposition': f'attachment; filename="{os.path.basename(filename)}"',
+                'Content-Length': str(len(content)),
+                'Accept-Ranges': 'bytes',
+                **result_validators(result.get("result", {}))
+            }
+        )
+    except Exception as e:
+        logger.error(f"Download file error: {e}")
+        return error(f"Download failed: {str(e)}", 500)
+
+
+async def download_range(filename: str, offset: int, length):
+    """206 response with part of a file, read from storage without the rest of it."""
+    arguments = {"filename": filename, "offset": offset}
+    if length is not None:
+        arguments["length"] = length
+    result = await mcp_client.call_tool("read_file", arguments)
+    if not result.get("success"):
+        return error(result.get("error", "File not found"), 404)
+    mcp_result = result.get("result", {})
+    data = base64.b64decode(mcp_result.get("data", ""))
+    headers = {'Content-Range': content_range(mcp_result.get("offset", 0), len(data), mcp_result["stat"]["size"]),
+               'Accept-Ranges': 'bytes'}
+    if not data:
+        return Response(status_code=416, headers=headers)
+    logger.info(f"Downloaded {len(data)} bytes of file: {filename}")
+    return Response(data, status_code=206, media_type='application/octet-stream', headers={
+        'Content-Disposition': f'attachment; filename="{os.path.basename(filename)}"',
+        **headers,
+        **result_validators(mcp_result)
+    })
+
+
+async def download_all_files(request: Request):
+    try:
+        files_result = await mcp_client.call_tool("list_files", {})
+        if not files_result.get("success"):
+            return error("Failed to list files", 500)
+        files = files_result.get("result", {}).get("files", [])
+        if not files:
+            return error("No files to download", 404)
+
+        async def archive():
+            # Each member is fetched and compressed just before it is sent, so
+            # memory stays bounded by the largest file rather than the archive.
+            sink = _ZipChunkSink()
+            with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+                for filename in files:
+                    if not validate_file_extension(filename):
+                        logger.warning(f"Skipped file due to invalid extension: {filename}")
+                        continue
+                    file_result = await mcp_client.call_tool("read_file", {"filename": filename})
+                    if file_result.get("success"):
+                        zf.writestr(filename, file_result.get("result", {}).get("file_content", ""))
+                        logger.info(f"Added to ZIP: {filename}")
+                    else:
+                        logger.warning(f"Skipped file due to read error: {filename}")
+                    yield sink.drain()
+            yield sink.drain()
+            logger.info(f"Created ZIP download with {len(files)} files")
+
+        return StreamingResponse(
+            archive(),
+            media_type='application/zip',
+            headers={'Content-Disposition': 'attachment; filename="filesystem-files.zip"'}
+        )
+    except Exception as e:
+        logger.error(f"Download all files error: {e}")
+        return error(f"Download failed: {str(e)}", 500)
+
+
+def send_frontend_file(request: Request, path: Path):
+    suffix, encoding = precompressed_variant(str(path), request.headers.get('accept-encoding'))
+    headers = {'Cache-Control': static_cache_control(path.name), 'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return FileResponse(
+        f"{path}{suffix}",
+        media_type=mimetypes.guess_type(path.name)[0] or 'application/octet-stream',
+        headers=headers
+    )
+
+
+async def serve_frontend(request: Request):
+    return send_frontend_file(request, FRONTEND_DIRECTORY / 'index.html')
+
+
+async def serve_static(request: Request):
+    path = (FRONTEND_DIRECTORY / request.path_params['path']).resolve()
+    if not path.is_relative_to(FRONTEND_DIRECTORY) or not path.is_file():
+        return JSONResponse({"error": "File not found", "message": "Requested resource not found"}, status_code=404)
+    return send_frontend_file(request, path)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if not await mcp_client.start_server():
+        raise RuntimeError("Failed to start MCP server")
+    change_feed.prime(mcp_client.server_state.get("changes"))
+    logger.info("MCP ASGI bridge ready")
+    try:
+        yield
+    finally:
+        await mcp_client.stop_server()
+
+
+routes = [
+    Route('/api/upload', upload_files, methods=['POST']),
+    Route('/api/files', list_files, methods=['GET']),
+    Route('/api/files/create', create_file, methods=['POST']),
+    Route('/api/files/edit', edit_file, methods=['PUT']),
+    Route('/api/files/patch', patch_file, methods=['PATCH']),
+    Route('/api/files/delete', delete_file, methods=['DELETE']),
+    Route('/api/files/{action}', transfer_file, methods=['POST']),
+    Route('/api/files/{filename:path}', get_file_content, methods=['GET']),
+    Route('/api/versions/restore', restore_version, methods=['POST']),
+    Route('/api/versions/{filename:path}', file_versions, methods=['GET']),
+    Route('/api/ai/jobs', submit_ai_job, methods=['POST']),
+    Route('/api/ai/jobs/{job_id}', ai_job, methods=['GET', 'DELETE']),
+    Route('/api/tree', directory_tree, methods=['GET']),
+    Route('/api/sync/manifest', sync_manifest, methods=['GET']),
+    Route('/api/sync/{action}', sync_files, methods=['POST']),
+    Route('/api/events', change_events, methods=['GET']),
+    Route('/api/health', health_check, methods=['GET']),
+    Route('/api/metrics', metrics, methods=['GET']),
+    Route('/api/traces/slowest', slowest_traces, methods=['GET']),
+    Route('/api/admin/profile', admin_profile, methods=['POST']),
+    Route('/api/admin/memory/{action}', admin_memory, methods=['POST']),
+    Route('/api/admin/stacks', admin_stacks, methods=['GET']),
+    Route('/api/download/all', download_all_files, methods=['GET']),
+    Route('/api/download/{filename:path}', download_file, methods=['GET']),
+    Route('/', serve_frontend),
+    Route('/{path:path}', serve_static),
+]
+
+cors_origins = os.getenv('CORS_ORIGINS', 'http://localhost:5000').split(',')
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[
+        Middleware(MetricsMiddleware),
+        Middleware(LoadSheddingMiddleware),
+        Middleware(CompressionMiddleware),
+        Middleware(CORSMiddleware, allow_origins=cors_origins, allow_methods=['*'], allow_headers=['*'])
+    ]
+)
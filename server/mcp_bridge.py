@@ -1,6 +1,6 @@
 # server/mcp_bridge.py
 
-from flask import Flask, request, jsonify, send_from_directory, send_file, Response
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response, g, has_request_context
 from flask_cors import CORS
 import os
 import logging
@@ -14,11 +14,28 @@ import queue
 import time
 import zipfile
 import io
-import requests
-from retrying import retry
+import base64
+import socket
+import mimetypes
+import math
+import functools
+
+import diagnostics
+import tracing
+import transport
+from compression import (
+    COMPRESSION_MIN_SIZE, compress, negotiate, precompressed_variant, record as record_compression,
+    should_compress, static_cache_control, weak_etag
+)
+from http_cache import (
+    content_range, not_modified, requested_range, result_validators, stat_etag, stat_stored_file, validator_headers
+)
+from change_feed import ChangeFeed, FEED_SUBSCRIBERS, RESET, event_id, format_event, format_reset
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Gauge, Histogram
 
 # Load environment variables
 load_dotenv()
+os.environ['MCP_DOTENV_LOADED'] = '1'  # spawned MCP servers can skip re-reading .env
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,7 +49,14 @@ CORS(app, origins=cors_origins)
 
 # Configuration
 FILE_DIRECTORY = os.getenv('FILE_STORAGE_PATH', 'uploaded_files')
+# Conditional GETs are answered from a local stat() only when the MCP server
+# stores files on this disk.
+LOCAL_STORAGE = os.getenv('STORAGE_BACKEND', 'local').lower() == 'local'
 MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 10 * 1024 * 1024))
+# Uploads sent with extract=true unpack these on the MCP server.
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.gz')
+# Bearer token for the /api/admin diagnostics endpoints; they are off without one.
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
 ALLOWED_EXTENSIONS = [
     'txt', 'md', 'js', 'ts', 'jsx', 'tsx', 'py', 'java', 'cpp', 'c', 'cs',
     'php', 'rb', 'go', 'rs', 'swift', 'kt', 'html', 'htm', 'css', 'scss',
@@ -41,31 +65,79 @@ ALLOWED_EXTENSIONS = [
     'zip', 'rar', '7z', 'tar', 'gz', 'env', 'config', 'ini', 'toml'
 ]
 
+MCP_STARTUP_TIMEOUT = float(os.getenv('MCP_STARTUP_TIMEOUT', 10))
+PRECONDITION_FAILED = -32001  # JSON-RPC error code for a stale base_hash
+OVERLOADED = -32002  # ... and for a request shed by the server's admission control
+QUOTA_EXCEEDED = -32003  # ... and for a write refused by a directory quota
+INVALID_PARAMS = -32602
+CHANGE_FEED_SIZE = int(os.getenv('CHANGE_FEED_SIZE', 1000))
+SSE_KEEPALIVE_INTERVAL = 15.0
+# POST /api/sync/<action> -> MCP tool
+SYNC_TOOLS = {"signatures": "get_block_signatures", "pull": "pull_files", "push": "push_files"}
+# Serve the output of build_frontend.py (hashed, precompressed assets) when present.
+FRONTEND_SOURCE = os.path.join(app.root_path, '..', 'frontend')
+FRONTEND_DIRECTORY = os.path.join(FRONTEND_SOURCE, 'dist')
+if not os.path.isfile(os.path.join(FRONTEND_DIRECTORY, 'index.html')):
+    FRONTEND_DIRECTORY = FRONTEND_SOURCE
+
 # Ensure directory exists
 Path(FILE_DIRECTORY).mkdir(exist_ok=True)
 
+HTTP_REQUESTS = Counter('mcp_bridge_http_requests_total', 'HTTP requests served, by route and status', ['route', 'status'])
+HTTP_DURATION = Histogram('mcp_bridge_http_request_duration_seconds', 'HTTP request latency, by route', ['route'])
+HTTP_INFLIGHT = Gauge('mcp_bridge_http_inflight_requests', 'HTTP requests currently being served')
+RPC_DURATION = Histogram('mcp_bridge_rpc_duration_seconds', 'MCP round-trip time including lock wait, by method', ['method'])
+RPC_LOCK_WAIT = Histogram('mcp_bridge_lock_wait_seconds', 'Time spent waiting to write a request to the MCP pipe')
+PIPE_BYTES_SENT = Counter('mcp_bridge_pipe_bytes_sent_total', 'Bytes written to the MCP server')
+PIPE_BYTES_RECEIVED = Counter('mcp_bridge_pipe_bytes_received_total', 'Bytes read from the MCP server')
+PENDING_REQUESTS = Gauge('mcp_bridge_pending_requests', 'Requests sent to the MCP server and awaiting a response')
+
+change_feed = ChangeFeed(CHANGE_FEED_SIZE)
+
 class MCPBridge:
-    def __init__(self):
+    def __init__(self, address: str = None):
+        # With MCP_SERVER_ADDRESS set, the bridge attaches to a shared socket
+        # server (see `mcp_server.py --listen`) instead of spawning a child.
+        self.address = address or os.getenv('MCP_SERVER_ADDRESS')
         self.process = None
+        self.sock = None
+        self._stdin = None
+        self._stdout = None
         self.request_id = 0
-        self.response_queue = queue.Queue()
+        # Requests are multiplexed: each waits on its own queue for the
+        # response with its id, and the lock is only held while writing.
+        self._pending = {}
         self.initialized = False
         self._lock = threading.Lock()
+        self._ready = threading.Event()
+        PENDING_REQUESTS.set_function(lambda: len(self._pending))
 
     def start_mcp_server(self):
         try:
-            server_script = Path(__file__).parent / "mcp_server.py"
-            self.process = subprocess.Popen(
-                [sys.executable, str(server_script)],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=0
-            )
+            if self.address:
+                self.sock = transport.connect(self.address)
+                self._stdin = self.sock.makefile('w', encoding='utf-8', newline='\n')
+                self._stdout = self.sock.makefile('r', encoding='utf-8', newline='\n')
+                logger.info(f"Connected to MCP server at {self.address}")
+            else:
+                self.process = subprocess.Popen(
+                    transport.server_command(),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    bufsize=0
+                )
+                self._stdin = self.process.stdin
+                self._stdout = self.process.stdout
+                # The child logs to stderr; keep draining it so a full pipe
+                # buffer can never block the server mid-request.
+                threading.Thread(target=self._forward_stderr, args=(self.process.stderr,), daemon=True).start()
             reader_thread = threading.Thread(target=self._read_responses, daemon=True)
             reader_thread.start()
-            time.sleep(0.5)
+            if self.process and not self._wait_until_ready(MCP_STARTUP_TIMEOUT):
+                logger.error("MCP server did not signal readiness")
+                return False
             success = self._send_initialize()
             if success:
                 self.initialized = True
@@ -78,50 +150,106 @@ class MCPBridge:
             logger.error(f"Failed to start MCP server: {e}")
             return False
 
+    def is_running(self):
+        if self.process is not None:
+            return self.process.poll() is None
+        return self.sock is not None
+
+    def _wait_until_ready(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self._ready.wait(0.01):
+            if not self.is_running() or time.monotonic() > deadline:
+                return False
+        return True
+
+    def _handle_notification(self, message: dict):
+        if message.get("method") == "notifications/ready":
+            self._ready.set()
+        elif message.get("method") == "notifications/file_changed":
+            change_feed.publish(message.get("params") or {})
+
+    def _forward_stderr(self, stream):
+        for line in iter(stream.readline, ''):
+            line = line.rstrip()
+            if line:
+                logger.debug(f"[mcp_server] {line}")
+
     def _read_responses(self):
-        while self.process and self.process.poll() is None:
+        while self.is_running():
             try:
-                line = self.process.stdout.readline()
+                line = self._stdout.readline()
+                if not line:
+                    break
+                PIPE_BYTES_RECEIVED.inc(len(line))
+                line = line.strip()
                 if line:
-                    line = line.strip()
-                    if line:
-                        response = json.loads(line)
-                        self.response_queue.put(response)
+                    response = json.loads(line)
+                    if "id" not in response and "method" in response:
+                        self._handle_notification(response)
+                    else:
+                        waiter = self._pending.pop(response.get("id"), None)
+                        if waiter is not None:
+                            waiter.put(response)
             except json.JSONDecodeError as e:
                 logger.error(f"Invalid JSON from MCP server: {line}, error: {e}")
             except Exception as e:
                 logger.error(f"Error reading MCP response: {e}")
                 break
+        for request_id in list(self._pending):
+            waiter = self._pending.pop(request_id, None)
+            if waiter is not None:
+                waiter.put(None)
 
     def _send_request(self, method: str, params: dict = None, timeout: float = 30.0):
-        with self._lock:
-            if not self.process or self.process.poll() is not None:
-                raise RuntimeError("MCP server not running")
-            self.request_id += 1
-            request = {
-                "jsonrpc": "2.0",
-                "id": self.request_id,
-                "method": method,
-                "params": params or {}
-            }
+        start_time = time.time()
+        with tracing.span(f"mcp.rpc {method}", **{"rpc.method": method}):
             try:
-                request_json = json.dumps(request) + "\n"
-                self.process.stdin.write(request_json)
-                self.process.stdin.flush()
-                start_time = time.time()
-                while time.time() - start_time < timeout:
-                    try:
-                        response = self.response_queue.get(timeout=0.1)
-                        if response.get("id") == self.request_id:
-                            return response
-                        else:
-                            self.response_queue.put(response)
-                    except queue.Empty:
-                        continue
+                response = self._round_trip(method, tracing.inject(params or {}), timeout)
+            finally:
+                RPC_DURATION.labels(method).observe(time.time() - start_time)
+            tracing.absorb(response.get("result") or (response.get("error") or {}).get("data"))
+            return response
+
+    def _round_trip(self, method: str, params: dict, timeout: float):
+        if not self.is_running():
+            raise RuntimeError("MCP server not running")
+        waiter = queue.Queue(maxsize=1)
+        start_time = time.time()
+        try:
+            with tracing.span("bridge.lock_wait"):
+                self._lock.acquire()
+            try:
+                RPC_LOCK_WAIT.observe(time.time() - start_time)
+                self.request_id += 1
+                request_id = self.request_id
+                request_json = json.dumps({
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "method": method,
+                    "params": params or {}
+                }) + "\n"
+                self._pending[request_id] = waiter
+                try:
+                    self._stdin.write(request_json)
+                    self._stdin.flush()
+                except Exception:
+                    self._pending.pop(request_id, None)
+                    raise
+                PIPE_BYTES_SENT.inc(len(request_json))
+            finally:
+                self._lock.release()
+            try:
+                response = waiter.get(timeout=timeout)
+            except queue.Empty:
                 raise TimeoutError(f"No response from MCP server for method {method}")
-            except Exception as e:
-                logger.error(f"Error sending request {method}: {e}")
-                raise
+            finally:
+                self._pending.pop(request_id, None)
+            if response is None:
+                raise RuntimeError("MCP server connection closed")
+            return response
+        except Exception as e:
+            logger.error(f"Error sending request {method}: {e}")
+            raise
 
     def _send_initialize(self):
         try:
@@ -131,6 +259,8 @@ class MCPBridge:
                 "clientInfo": {"name": "flask-bridge", "version": "1.0.0"}
             }
             response = self._send_request("initialize", params)
+            if "result" in response:
+                change_feed.prime(response["result"].get("changes"))
             return "result" in response
         except Exception as e:
             logger.error(f"Initialization failed: {e}")
@@ -141,9 +271,17 @@ class MCPBridge:
             if not self.initialized:
                 return {"success": False, "error": "MCP server not initialized"}
             params = {"name": tool_name, "arguments": arguments}
+            if has_request_context():
+                # Lets the server apply per-client limits to browser users.
+                params["_meta"] = {"client": request.remote_addr}
             response = self._send_request("tools/call", params)
             if "error" in response:
-                return {"success": False, "error": response["error"]["message"]}
+                error = response["error"]
+                if error.get("code") == OVERLOADED and has_request_context():
+                    g.overloaded = error.get("data") or {}
+                elif error.get("code") == QUOTA_EXCEEDED and has_request_context():
+                    g.quota_exceeded = True
+                return {"success": False, "error": error["message"], "code": error.get("code"), "data": error.get("data") or {}}
             else:
                 return {"success": True, "result": response.get("result", {})}
         except Exception as e:
@@ -163,6 +301,30 @@ class MCPBridge:
             logger.error(f"List tools failed: {e}")
             return {"success": False, "error": str(e)}
 
+    def get_metrics(self):
+        try:
+            if not self.initialized:
+                return {"success": False, "error": "MCP server not initialized"}
+            response = self._send_request("metrics/get")
+            if "error" in response:
+                return {"success": False, "error": response["error"]["message"]}
+            return {"success": True, "text": response.get("result", {}).get("text", "")}
+        except Exception as e:
+            logger.error(f"Get metrics failed: {e}")
+            return {"success": False, "error": str(e)}
+
+    def get_diagnostics(self, kind: str, params: dict, timeout: float = 30.0):
+        try:
+            if not self.initialized:
+                return {"success": False, "error": "MCP server not initialized"}
+            response = self._send_request(f"diagnostics/{kind}", params, timeout)
+            if "error" in response:
+                return {"success": False, "error": response["error"]["message"], "code": response["error"].get("code")}
+            return {"success": True, "artifact": diagnostics.Artifact.from_result(response["result"])}
+        except Exception as e:
+            logger.error(f"Diagnostics failed: {e}")
+            return {"success": False, "error": str(e)}
+
     def stop_server(self):
         if self.process:
             try:
@@ -173,6 +335,14 @@ class MCPBridge:
                 self.process.wait()
             self.process = None
             logger.info("MCP server stopped")
+        elif self.sock:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+            logger.info("Disconnected from MCP server")
 
 mcp_bridge = MCPBridge()
 
@@ -183,13 +353,78 @@ def validate_file_extension(filename):
         return False
     return True
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    HTTP_INFLIGHT.inc()
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.trace_scope = tracing.start_trace(
+        f"HTTP {request.method} {route}",
+        request.headers.get('traceparent'),
+        **{"http.method": request.method, "http.route": route}
+    ).open()
+
+@app.teardown_request
+def finish_trace(exc):
+    scope = g.pop('trace_scope', None)
+    if scope is not None:
+        scope.close(exc)
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        HTTP_INFLIGHT.dec()
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_DURATION.labels(route).observe(time.perf_counter() - start)
+        HTTP_REQUESTS.labels(route, response.status_code).inc()
+    scope = g.get('trace_scope')
+    if scope is not None:
+        scope.span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            scope.span.record_error(f"HTTP {response.status_code}")
+    return response
+
+@app.after_request
+def shed_overloaded(response):
+    # Routes report a failed tool call as an error of their own choosing; when
+    # the cause was the server shedding load, tell the client to back off.
+    overloaded = g.get('overloaded')
+    if overloaded is not None and response.status_code >= 400:
+        response.status_code = 429
+        response.headers['Retry-After'] = str(math.ceil(overloaded.get("retry_after", 1)))
+    elif g.get('quota_exceeded') and response.status_code >= 400:
+        response.status_code = 507
+    return response
+
+@app.after_request
+def compress_response(response):
+    if response.direct_passthrough or response.is_streamed:
+        return response  # files and event streams
+    if not should_compress(response.status_code, response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None or (response.content_length or 0) < COMPRESSION_MIN_SIZE:
+        return response
+    data = response.get_data()
+    compressed = compress(data, encoding)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if 'ETag' in response.headers:
+        response.headers['ETag'] = weak_etag(response.headers['ETag'])
+    record_compression(encoding, len(data), len(compressed))
+    return response
+
 @app.route('/api/upload', methods=['POST'])
 def upload_files():
     try:
         if 'files' not in request.files:
             return jsonify({"success": False, "message": "No files provided"}), 400
         files = request.files.getlist('files')
+        extract = request.form.get('extract', '').lower() in ('1', 'true', 'on')
         uploaded_files = []
+        skipped = []
         Path(FILE_DIRECTORY).mkdir(exist_ok=True)
         for file in files:
             if not file.filename:
@@ -205,6 +440,27 @@ def upload_files():
                     "success": False,
                     "message": f"File {file.filename} exceeds maximum size of {MAX_FILE_SIZE} bytes"
                 }), 400
+            if extract and file.filename.lower().endswith(ARCHIVE_SUFFIXES):
+                # Unpacked next to where the archive would have been stored.
+                result = mcp_bridge.call_tool("extract_archive", {
+                    "archive": base64.b64encode(file.read()).decode('ascii'),
+                    "archive_name": file.filename,
+                    "destination": file.filename.rpartition('/')[0],
+                    "overwrite": True
+                })
+                if result.get("success"):
+                    for entry in result.get("result", {}).get("files", []):
+                        if entry["status"] in ("created", "modified"):
+                            uploaded_files.append(entry["path"])
+                        else:
+                            skipped.append(f"{entry['path']}: {entry.get('error', entry['status'])}")
+                    if result["result"].get("error"):
+                        skipped.append(f"{file.filename}: {result['result']['error']}")
+                    logger.info(f"Extracted archive via MCP: {file.filename}")
+                else:
+                    skipped.append(f"{file.filename}: {result.get('error')}")
+                    logger.error(f"MCP extraction failed for {file.filename}: {result.get('error')}")
+                continue
             content = file.read().decode('utf-8', errors='replace')
             result = mcp_bridge.call_tool("create_file", {
                 "filename": file.filename,
@@ -216,38 +472,79 @@ def upload_files():
             else:
                 logger.error(f"MCP upload failed for {file.filename}: {result.get('error')}")
         if not uploaded_files:
-            return jsonify({"success": False, "message": "No valid files uploaded"}), 400
+            return jsonify({"success": False, "message": "No valid files uploaded", "skipped": skipped}), 400
         return jsonify({
             "success": True,
             "message": f"Uploaded {len(uploaded_files)} files",
-            "files": uploaded_files
+            "files": uploaded_files,
+            "skipped": skipped
         })
     except Exception as e:
         logger.error(f"Upload error: {e}")
         return jsonify({"success": False, "message": f"Upload failed: {str(e)}"}), 500
 
+def local_not_modified(filename):
+    """304 response if the client's copy of a stored file is current, checked without the MCP server."""
+    st = stat_stored_file(FILE_DIRECTORY, filename) if LOCAL_STORAGE else None
+    if st is None:
+        return None
+    etag = stat_etag(st.st_size, st.st_mtime_ns, st.st_ino)
+    if not_modified(request.headers, etag, st.st_mtime):
+        return Response(status=304, headers=validator_headers(etag, st.st_mtime))
+    return None
+
 @app.route('/api/files', methods=['GET'])
 def list_files():
     try:
+        # The listing only changes with a change notification, so the feed
+        # position identifies it.
+        etag = change_feed.listing_etag()
+        if etag and not_modified(request.headers, etag):
+            return Response(status=304, headers=validator_headers(etag))
         result = mcp_bridge.call_tool("list_files", {})
         if result.get("success"):
             files = result.get("result", {}).get("files", [])
-            return jsonify({"success": True, "files": files})
+            return jsonify({"success": True, "files": files}), 200, validator_headers(etag)
         else:
             return jsonify({"success": False, "message": result.get("error", "Failed to list files")}), 500
     except Exception as e:
         logger.error(f"List files error: {e}")
         return jsonify({"success": False, "message": f"Failed to list files: {str(e)}"}), 500
 
+@app.route('/api/tree', methods=['GET'])
+def directory_tree():
+    try:
+        depth = int(request.args.get('depth', 1))
+    except ValueError:
+        return jsonify({"success": False, "message": "depth must be an integer"}), 400
+    try:
+        # Totals only change with a change notification, as the listing does.
+        etag = change_feed.listing_etag()
+        if etag and not_modified(request.headers, etag):
+            return Response(status=304, headers=validator_headers(etag))
+        result = mcp_bridge.call_tool("tree", {"path": request.args.get('path', ''), "depth": depth})
+        if result.get("success"):
+            return jsonify({"success": True, "tree": result.get("result", {}).get("tree")}), 200, validator_headers(etag)
+        else:
+            return jsonify({"success": False, "message": result.get("error", "Directory not found")}), 404
+    except Exception as e:
+        logger.error(f"Directory tree error: {e}")
+        return jsonify({"success": False, "message": f"Failed to list directory: {str(e)}"}), 500
+
 @app.route('/api/files/<path:filename>', methods=['GET'])
 def get_file_content(filename):
     try:
         if not validate_file_extension(filename):
             return jsonify({"success": False, "message": f"Invalid file extension for {filename}"}), 400
+        cached = local_not_modified(filename)
+        if cached is not None:
+            return cached
         result = mcp_bridge.call_tool("read_file", {"filename": filename})
         if result.get("success"):
-            content = result.get("result", {}).get("file_content", "")
-            return jsonify({"success": True, "content": content})
+            mcp_result = result.get("result", {})
+            response = jsonify({"success": True, "content": mcp_result.get("file_content", ""), "hash": mcp_result.get("sha256")})
+            response.headers.update(result_validators(mcp_result))
+            return response
         else:
             return jsonify({"success": False, "message": result.get("error", "File not found")}), 404
     except Exception as e:
@@ -270,7 +567,7 @@ def create_file():
         })
         if result.get("success"):
             logger.info(f"Created file via MCP: {filename}")
-            return jsonify({"success": True, "message": "File created successfully"})
+            return jsonify({"success": True, "message": "File created successfully", "hash": result.get("result", {}).get("sha256")})
         else:
             return jsonify({"success": False, "message": result.get("error", "Creation failed")}), 500
     except Exception as e:
@@ -302,18 +599,52 @@ def edit_file():
                 "use_ai": False
             })
         if result.get("success"):
-            response_data = {"success": True, "message": "File edited successfully"}
             mcp_result = result.get("result", {})
+            response_data = {"success": True, "message": "File edited successfully", "hash": mcp_result.get("sha256")}
             if "new_content" in mcp_result:
                 response_data["new_content"] = mcp_result["new_content"]
             logger.info(f"Edited file via MCP: {filename}")
             return jsonify(response_data)
+        elif result.get("code") == PRECONDITION_FAILED:
+            return jsonify({
+                "success": False,
+                "message": result.get("error"),
+                "current_hash": result.get("data", {}).get("current_hash")
+            }), 409
         else:
             return jsonify({"success": False, "message": result.get("error", "Edit failed")}), 500
     except Exception as e:
         logger.error(f"Edit file error: {e}")
         return jsonify({"success": False, "message": f"Edit failed: {str(e)}"}), 500
 
+@app.route('/api/files/patch', methods=['PATCH'])
+def patch_file():
+    try:
+        data = request.json
+        filename = data.get('filename')
+        if not filename:
+            return jsonify({"success": False, "message": "Filename required"}), 400
+        if not validate_file_extension(filename):
+            return jsonify({"success": False, "message": f"Invalid file extension for {filename}"}), 400
+        arguments = {key: data[key] for key in ('filename', 'base_hash', 'operations', 'diff') if data.get(key) is not None}
+        result = mcp_bridge.call_tool("patch_file", arguments)
+        if result.get("success"):
+            logger.info(f"Patched file via MCP: {filename}")
+            return jsonify({"success": True, "message": "File patched successfully", "hash": result.get("result", {}).get("sha256")})
+        elif result.get("code") == PRECONDITION_FAILED:
+            return jsonify({
+                "success": False,
+                "message": result.get("error"),
+                "current_hash": result.get("data", {}).get("current_hash")
+            }), 409
+        elif result.get("code") == INVALID_PARAMS:
+            return jsonify({"success": False, "message": result.get("error")}), 422
+        else:
+            return jsonify({"success": False, "message": result.get("error", "Patch failed")}), 500
+    except Exception as e:
+        logger.error(f"Patch file error: {e}")
+        return jsonify({"success": False, "message": f"Patch failed: {str(e)}"}), 500
+
 @app.route('/api/files/delete', methods=['DELETE'])
 def delete_file():
     try:
@@ -333,6 +664,162 @@ def delete_file():
         logger.error(f"Delete file error: {e}")
         return jsonify({"success": False, "message": f"Delete failed: {str(e)}"}), 500
 
+@app.route('/api/files/<action>', methods=['POST'])
+def transfer_file(action):
+    if action not in ("copy", "move"):
+        return jsonify({"success": False, "message": f"Unknown file action: {action}"}), 404
+    try:
+        data = request.json or {}
+        source = data.get('source')
+        destination = data.get('destination')
+        if not source or not destination:
+            return jsonify({"success": False, "message": "Source and destination required"}), 400
+        if data.get('directory'):
+            result = mcp_bridge.call_tool(f"{action}_directory", {"source": source, "destination": destination})
+        else:
+            for filename in (source, destination):
+                if not validate_file_extension(filename):
+                    return jsonify({"success": False, "message": f"Invalid file extension for {filename}"}), 400
+            result = mcp_bridge.call_tool(f"{action}_file", {"source": source, "destination": destination,
+                                                             "overwrite": bool(data.get('overwrite'))})
+        if result.get("success"):
+            logger.info(f"{action.capitalize()} via MCP: {source} -> {destination}")
+            return jsonify({"success": True, "message": result.get("result", {}).get("content", [{}])[0].get("text", "Done")})
+        else:
+            return jsonify({"success": False, "message": result.get("error", f"{action.capitalize()} failed")}), 500
+    except Exception as e:
+        logger.error(f"{action.capitalize()} file error: {e}")
+        return jsonify({"success": False, "message": f"{action.capitalize()} failed: {str(e)}"}), 500
+
+@app.route('/api/versions/<path:filename>', methods=['GET'])
+def file_versions(filename):
+    try:
+        if not validate_file_extension(filename):
+            return jsonify({"success": False, "message": f"Invalid file extension for {filename}"}), 400
+        version = request.args.get('version', type=int)
+        if version is None:
+            result = mcp_bridge.call_tool("list_versions", {"filename": filename})
+            if result.get("success"):
+                return jsonify({"success": True, "versions": result.get("result", {}).get("versions", [])})
+        else:
+            result = mcp_bridge.call_tool("read_version", {"filename": filename, "version": version})
+            if result.get("success"):
+                return jsonify({"success": True, "content": result.get("result", {}).get("file_content", "")})
+        return jsonify({"success": False, "message": result.get("error", "Version not found")}), 404
+    except Exception as e:
+        logger.error(f"Versions error: {e}")
+        return jsonify({"success": False, "message": f"Failed to read versions: {str(e)}"}), 500
+
+@app.route('/api/versions/restore', methods=['POST'])
+def restore_version():
+    try:
+        data = request.json
+        filename = data.get('filename')
+        version = data.get('version')
+        if not filename or version is None:
+            return jsonify({"success": False, "message": "Filename and version required"}), 400
+        if not validate_file_extension(filename):
+            return jsonify({"success": False, "message": f"Invalid file extension for {filename}"}), 400
+        result = mcp_bridge.call_tool("restore_version", {"filename": filename, "version": int(version)})
+        if result.get("success"):
+            logger.info(f"Restored version {version} of {filename} via MCP")
+            return jsonify({"success": True, "message": f"Restored version {version}"})
+        else:
+            return jsonify({"success": False, "message": result.get("error", "Restore failed")}), 500
+    except Exception as e:
+        logger.error(f"Restore version error: {e}")
+        return jsonify({"success": False, "message": f"Restore failed: {str(e)}"}), 500
+
+@app.route('/api/ai/jobs', methods=['POST'])
+def submit_ai_job():
+    try:
+        data = request.json
+        filename = data.get('filename')
+        prompt = data.get('prompt')
+        if not filename or not prompt:
+            return jsonify({"success": False, "message": "Filename and prompt required"}), 400
+        if not validate_file_extension(filename):
+            return jsonify({"success": False, "message": f"Invalid file extension for {filename}"}), 400
+        result = mcp_bridge.call_tool("submit_ai_edit", {"filename": filename, "prompt": prompt})
+        if result.get("success"):
+            job = result.get("result", {}).get("job", {})
+            logger.info(f"Submitted AI job {job.get('id')} for {filename} via MCP")
+            return jsonify({"success": True, "job": job}), 202
+        else:
+            return jsonify({"success": False, "message": result.get("error", "Submit failed")}), 500
+    except Exception as e:
+        logger.error(f"Submit AI job error: {e}")
+        return jsonify({"success": False, "message": f"Submit failed: {str(e)}"}), 500
+
+@app.route('/api/ai/jobs/<job_id>', methods=['GET', 'DELETE'])
+def ai_job(job_id):
+    try:
+        tool = "cancel_ai_job" if request.method == 'DELETE' else "get_ai_job"
+        result = mcp_bridge.call_tool(tool, {"job_id": job_id})
+        if result.get("success"):
+            return jsonify({"success": True, "job": result.get("result", {}).get("job", {})})
+        else:
+            return jsonify({"success": False, "message": result.get("error", "Job not found")}), 404
+    except Exception as e:
+        logger.error(f"AI job error: {e}")
+        return jsonify({"success": False, "message": f"AI job request failed: {str(e)}"}), 500
+
+@app.route('/api/sync/manifest', methods=['GET'])
+def sync_manifest():
+    try:
+        # Like the listing, the manifest only changes with a change notification.
+        etag = change_feed.listing_etag()
+        if etag and not_modified(request.headers, etag):
+            return Response(status=304, headers=validator_headers(etag))
+        result = mcp_bridge.call_tool("get_manifest", {"prefix": request.args.get('prefix', '')})
+        if result.get("success"):
+            return jsonify({"success": True, "files": result.get("result", {}).get("files", [])}), 200, validator_headers(etag)
+        else:
+            return jsonify({"success": False, "message": result.get("error", "Failed to build manifest")}), 500
+    except Exception as e:
+        logger.error(f"Sync manifest error: {e}")
+        return jsonify({"success": False, "message": f"Failed to build manifest: {str(e)}"}), 500
+
+@app.route('/api/sync/<action>', methods=['POST'])
+def sync_files(action):
+    tool = SYNC_TOOLS.get(action)
+    if tool is None:
+        return jsonify({"success": False, "message": f"Unknown sync action: {action}"}), 404
+    try:
+        result = mcp_bridge.call_tool(tool, request.json or {})
+        if result.get("success"):
+            return jsonify({"success": True, "files": result.get("result", {}).get("files", [])})
+        else:
+            return jsonify({"success": False, "message": result.get("error", "Sync failed")}), 500
+    except Exception as e:
+        logger.error(f"Sync {action} error: {e}")
+        return jsonify({"success": False, "message": f"Sync failed: {str(e)}"}), 500
+
+@app.route('/api/events', methods=['GET'])
+def change_events():
+    """Server-Sent Events stream of file changes; resumes from Last-Event-ID."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    def stream():
+        FEED_SUBSCRIBERS.inc()
+        cursor = last_event_id or change_feed.cursor()
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                events = change_feed.wait(cursor, SSE_KEEPALIVE_INTERVAL)
+                if events == RESET:
+                    cursor = change_feed.cursor()
+                    yield format_reset(cursor)
+                elif events:
+                    yield "".join(format_event(params) for params in events)
+                    cursor = event_id(events[-1])
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            FEED_SUBSCRIBERS.dec()
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     try:
@@ -355,18 +842,101 @@ def health_check():
             "message": f"Health check failed: {str(e)}"
         }), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    text = REGISTRY.render()
+    server_metrics = mcp_bridge.get_metrics()
+    if server_metrics.get("success"):
+        text += server_metrics["text"]
+    else:
+        logger.warning(f"MCP server metrics unavailable: {server_metrics.get('error')}")
+    return Response(text, mimetype='text/plain', headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+@app.route('/api/traces/slowest', methods=['GET'])
+def slowest_traces():
+    limit = request.args.get('limit', 10, type=int)
+    return jsonify({"success": True, "sample_rate": tracing.TRACE_SAMPLE_RATE, "traces": tracing.slowest(limit)})
+
+def admin_only(view):
+    @functools.wraps(view)
+    def guarded(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"success": False, "message": "Diagnostics are disabled; set ADMIN_TOKEN to enable them"}), 404
+        if not diagnostics.authorized(request.headers.get('Authorization'), ADMIN_TOKEN):
+            return jsonify({"success": False, "message": "Admin token required"}), 401, {'WWW-Authenticate': 'Bearer'}
+        return view(*args, **kwargs)
+    return guarded
+
+def diagnose(kind, local, params, timeout=30.0):
+    """Run a capture in this bridge (?target=bridge) or in the MCP server, and send it as a download."""
+    target = request.args.get('target', 'server')
+    try:
+        if target == 'bridge':
+            artifact = local()
+        elif target == 'server':
+            # The server asks socket clients for the same token.
+            result = mcp_bridge.get_diagnostics(kind, {**params, "token": ADMIN_TOKEN}, timeout)
+            if not result.get("success"):
+                return jsonify({"success": False, "message": result.get("error", "Diagnostics failed")}), 400 if result.get("code") else 500
+            artifact = result["artifact"]
+        else:
+            return jsonify({"success": False, "message": f"Unknown target: {target}"}), 400
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    return Response(artifact.data, content_type=artifact.content_type, headers={
+        'Content-Disposition': f'attachment; filename="{artifact.filename}"',
+        'Cache-Control': 'no-store'
+    })
+
+@app.route('/api/admin/profile', methods=['POST'])
+@admin_only
+def admin_profile():
+    seconds = request.args.get('seconds', 10, type=float)
+    mode = request.args.get('mode', 'sampling')
+
+    def local():
+        # Each request runs on its own thread, which cProfile cannot follow.
+        if mode != 'sampling':
+            raise ValueError("The Flask bridge can only be profiled with mode=sampling")
+        return diagnostics.sample(seconds, "bridge")
+    params = {"seconds": seconds, "mode": mode, "format": request.args.get('format', 'text')}
+    return diagnose("profile", local, params, timeout=seconds + 30)
+
+@app.route('/api/admin/memory/<action>', methods=['POST'])
+@admin_only
+def admin_memory(action):
+    limit = request.args.get('limit', 25, type=int)
+    frames = request.args.get('frames', 1, type=int)
+    return diagnose("memory", lambda: diagnostics.memory(action, limit, frames, "bridge"),
+                    {"action": action, "limit": limit, "frames": frames})
+
+@app.route('/api/admin/stacks', methods=['GET'])
+@admin_only
+def admin_stacks():
+    return diagnose("stacks", lambda: diagnostics.stacks("bridge"), {})
+
 @app.route('/api/download/<path:filename>', methods=['GET'])
 def download_file(filename):
     try:
         if not validate_file_extension(filename):
             return jsonify({"success": False, "message": f"Invalid file extension for {filename}"}), 400
+        cached = local_not_modified(filename)
+        if cached is not None:
+            return cached
+        byte_range = requested_range(request.headers)
+        if byte_range is not None:
+            return download_range(filename, *byte_range)
         result = mcp_bridge.call_tool("read_file", {"filename": filename})
         if result.get("success"):
             content = result.get("result", {}).get("file_content", "")
             response = Response(
                 content,
                 mimetype='application/octet-stream',
-                headers={'Content-Disposition': f'attachment; filename="{os.path.basename(filename)}"'}
+                headers={
+                    'Content-Disposition': f'attachment; filename="{os.path.basename(filename)}"',
+                    'Accept-Ranges': 'bytes',
+                    **result_validators(result.get("result", {}))
+                }
             )
             logger.info(f"Downloaded file: {filename}")
             return response
@@ -376,6 +946,27 @@ def download_file(filename):
         logger.error(f"Download file error: {e}")
         return jsonify({"success": False, "message": f"Download failed: {str(e)}"}), 500
 
+def download_range(filename, offset, length):
+    """206 response with part of a file, read from storage without the rest of it."""
+    arguments = {"filename": filename, "offset": offset}
+    if length is not None:
+        arguments["length"] = length
+    result = mcp_bridge.call_tool("read_file", arguments)
+    if not result.get("success"):
+        return jsonify({"success": False, "message": result.get("error", "File not found")}), 404
+    mcp_result = result.get("result", {})
+    data = base64.b64decode(mcp_result.get("data", ""))
+    headers = {'Content-Range': content_range(mcp_result.get("offset", 0), len(data), mcp_result["stat"]["size"]),
+               'Accept-Ranges': 'bytes'}
+    if not data:
+        return Response(status=416, headers=headers)
+    logger.info(f"Downloaded {len(data)} bytes of file: {filename}")
+    return Response(data, status=206, mimetype='application/octet-stream', headers={
+        'Content-Disposition': f'attachment; filename="{os.path.basename(filename)}"',
+        **headers,
+        **result_validators(mcp_result)
+    })
+
 @app.route('/api/download/all', methods=['GET'])
 def download_all_files():
     try:
@@ -413,14 +1004,26 @@ def download_all_files():
         logger.error(f"Download all files error: {e}")
         return jsonify({"success": False, "message": f"Download failed: {str(e)}"}), 500
 
+def send_frontend_file(path):
+    suffix, encoding = precompressed_variant(os.path.join(FRONTEND_DIRECTORY, path), request.headers.get('Accept-Encoding'))
+    response = send_from_directory(
+        FRONTEND_DIRECTORY, path + suffix,
+        mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = static_cache_control(path)
+    return response
+
 @app.route('/')
 def serve_frontend():
-    return send_from_directory('../frontend', 'index.html')
+    return send_frontend_file('index.html')
 
 @app.route('/<path:path>')
 def serve_static(path):
     try:
-        return send_from_directory('../frontend', path)
+        return send_frontend_file(path)
     except Exception:
         return jsonify({"error": "File not found", "message": "Requested resource not found"}), 404
 
@@ -440,7 +1043,9 @@ if __name__ == '__main__':
     logger.info("Starting MCP Flask Bridge Server...")
     logger.info("This server uses MCP protocol internally for all filesystem operations")
     try:
-        app.run(debug=debug, host='0.0.0.0', port=port)
+        # The reloader would re-run this module in a second process and spawn
+        # a second MCP server; restart manually instead.
+        app.run(debug=debug, use_reloader=False, host='0.0.0.0', port=port)
     except KeyboardInterrupt:
         logger.info("Server interrupted by user")
     finally:
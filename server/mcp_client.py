@@ -2,11 +2,15 @@
 
 import asyncio
 import json
+from contextvars import ContextVar
 import subprocess
-import sys
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 import logging
-from pathlib import Path
+import os
+
+import diagnostics
+import tracing
+import transport
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,56 +23,178 @@ ALLOWED_EXTENSIONS = [
     'zip', 'rar', '7z', 'tar', 'gz', 'env', 'config', 'ini', 'toml'
 ]
 
+MCP_STARTUP_TIMEOUT = float(os.getenv('MCP_STARTUP_TIMEOUT', 10))
+
+# JSON-RPC error code the server uses when a base_hash precondition fails.
+PRECONDITION_FAILED = -32001
+# ... and when admission control sheds a request (error.data.retry_after).
+OVERLOADED = -32002
+# ... and when a directory quota refuses a write (error.data.directory).
+QUOTA_EXCEEDED = -32003
+INVALID_PARAMS = -32602
+
+# Per-HTTP-request state set up by the ASGI bridge: "client" is forwarded to
+# the server for per-client limits, "overloaded" is filled in with the error
+# data when the server sheds one of the request's calls, and "quota_exceeded"
+# is set when a directory quota refuses one.
+request_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar('mcp_request_context', default=None)
+
+class MCPError(RuntimeError):
+    """A JSON-RPC error response from the MCP server."""
+
+    def __init__(self, message: str, code: Optional[int] = None, data: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.code = code
+        self.data = data or {}
+
 class MCPClient:
-    def __init__(self):
+    def __init__(self, address: Optional[str] = None):
+        # When an address is given (or MCP_SERVER_ADDRESS is set) the client
+        # attaches to a long-lived socket server instead of forking its own.
+        self.address = address or os.getenv('MCP_SERVER_ADDRESS')
         self.process = None
         self.request_id = 0
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._stderr_task = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ready: Optional[asyncio.Event] = None
+        # Called with every server notification other than notifications/ready.
+        self.on_notification: Optional[Callable[[Dict[str, Any]], None]] = None
+        self.server_state: Dict[str, Any] = {}
 
     async def start_server(self):
         try:
-            server_script = Path(__file__).parent / "mcp_server.py"
-            self.process = await asyncio.create_subprocess_exec(
-                sys.executable, str(server_script),
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            logger.info("MCP server started")
-            await self._send_initialize()
+            if self.address:
+                self._reader, self._writer = await transport.open_connection(self.address)
+                logger.info(f"Connected to MCP server at {self.address}")
+            else:
+                self.process = await asyncio.create_subprocess_exec(
+                    *transport.server_command(),
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    limit=transport.MAX_MESSAGE_SIZE
+                )
+                self._reader, self._writer = self.process.stdout, self.process.stdin
+                # Unread, the pipe would buffer all server logging and then block the server.
+                self._stderr_task = asyncio.create_task(self._forward_stderr(self.process.stderr))
+                logger.info("MCP server started")
+            self._ready = asyncio.Event()
+            self._reader_task = asyncio.create_task(self._read_responses())
+            if self.process:
+                # Wait for the server's readiness notification rather than a fixed delay.
+                await asyncio.wait_for(self._ready.wait(), MCP_STARTUP_TIMEOUT)
+            self.server_state = await self._send_initialize()
             return True
         except Exception as e:
             logger.error(f"Failed to start MCP server: {e}")
             return False
 
     async def stop_server(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
         if self.process:
-            self.process.terminate()
+            try:
+                self.process.terminate()
+            except ProcessLookupError:
+                pass  # already gone, e.g. the signal reached the whole process group
             await self.process.wait()
+            self.process = None
+            if self._stderr_task:
+                await self._stderr_task  # ends at EOF, once the server has exited
+                self._stderr_task = None
             logger.info("MCP server stopped")
+        elif self._writer:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+            logger.info("Disconnected from MCP server")
+        self._writer = None
+        self._reader = None
+
+    async def _forward_stderr(self, stream: asyncio.StreamReader):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                continue  # a line over the buffer limit; the reader skips it
+            if not line:
+                break
+            line = line.decode(errors='replace').rstrip()
+            if line:
+                logger.debug(f"[mcp_server] {line}")
+
+    async def _read_responses(self):
+        # Responses are matched by id, so several requests can be in flight on
+        # one connection and the server may answer them out of order.
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                try:
+                    response = json.loads(line.decode())
+                except json.JSONDecodeError as e:
+                    logger.error(f"Invalid JSON response: {str(e)}")
+                    continue
+                if "id" not in response:
+                    if response.get("method") == "notifications/ready":
+                        self._ready.set()
+                    elif self.on_notification is not None:
+                        self.on_notification(response)
+                    continue
+                future = self._pending.pop(response.get("id"), None)
+                if future and not future.done():
+                    future.set_result(response)
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(RuntimeError("No response from MCP server"))
+            self._pending.clear()
 
     async def _send_request(self, method: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
-        if not self.process:
+        if not self._writer:
             raise RuntimeError("MCP server not started")
+        if self._reader_task is None or self._reader_task.done():
+            raise RuntimeError("MCP server connection closed")
         self.request_id += 1
-        request = {
-            "jsonrpc": "2.0",
-            "id": self.request_id,
-            "method": method,
-            "params": params or {}
-        }
-        request_json = json.dumps(request) + "\n"
-        self.process.stdin.write(request_json.encode())
-        await self.process.stdin.drain()
-        response_line = await self.process.stdout.readline()
-        if not response_line:
-            raise RuntimeError("No response from MCP server")
-        try:
-            response = json.loads(response_line.decode())
-            if "error" in response:
-                raise RuntimeError(f"MCP server error: {response['error']['message']}")
-            return response.get("result", {})
-        except json.JSONDecodeError as e:
-            raise RuntimeError(f"Invalid JSON response: {str(e)}")
+        request_id = self.request_id
+        context = request_context.get()
+        with tracing.span(f"mcp.rpc {method}", **{"rpc.method": method}):
+            params = tracing.inject(params or {})
+            if context and context.get("client"):
+                params = dict(params, _meta=dict(params.get("_meta") or {}, client=context["client"]))
+            request = {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "method": method,
+                "params": params
+            }
+            future = asyncio.get_running_loop().create_future()
+            self._pending[request_id] = future
+            request_json = json.dumps(request) + "\n"
+            try:
+                self._writer.write(request_json.encode())
+                await self._writer.drain()
+                response = await future
+            finally:
+                self._pending.pop(request_id, None)
+            tracing.absorb(response.get("result") or (response.get("error") or {}).get("data"))
+        if "error" in response:
+            error = response["error"]
+            if error.get("code") == OVERLOADED and context is not None:
+                context["overloaded"] = error.get("data") or {}
+            elif error.get("code") == QUOTA_EXCEEDED and context is not None:
+                context["quota_exceeded"] = True
+            raise MCPError(f"MCP server error: {error['message']}", error.get("code"), error.get("data"))
+        return response.get("result", {})
 
     async def _send_initialize(self):
         params = {
@@ -95,10 +221,32 @@ class MCPClient:
                 "result": result,
                 "content": result.get("content", [])
             }
+        except MCPError as e:
+            logger.error(f"Failed to call tool {name}: {e}")
+            return {"success": False, "error": f"Tool call failed: {str(e)}", "code": e.code, "data": e.data}
         except Exception as e:
             logger.error(f"Failed to call tool {name}: {e}")
             return {"success": False, "error": f"Tool call failed: {str(e)}"}
 
+    async def get_metrics(self) -> Dict[str, Any]:
+        try:
+            result = await self._send_request("metrics/get")
+            return {"success": True, "text": result.get("text", ""), "metrics": result.get("metrics", {})}
+        except Exception as e:
+            logger.error(f"Failed to get metrics: {e}")
+            return {"success": False, "error": str(e)}
+
+    async def get_diagnostics(self, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            result = await self._send_request(f"diagnostics/{kind}", params)
+            return {"success": True, "artifact": diagnostics.Artifact.from_result(result)}
+        except MCPError as e:
+            logger.error(f"Diagnostics failed: {e}")
+            return {"success": False, "error": str(e), "code": e.code}
+        except Exception as e:
+            logger.error(f"Diagnostics failed: {e}")
+            return {"success": False, "error": str(e)}
+
     @staticmethod
     def validate_file_extension(filename: str) -> bool:
         extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
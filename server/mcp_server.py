@@ -1,18 +1,41 @@
 # server/mcp_server.py
 
+import argparse
 import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
 import json
 import os
+import signal
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 import logging
-import requests
-from dotenv import load_dotenv
-from filelock import FileLock
-from retrying import retry
 
-load_dotenv()
+import tracing
+import transport
+import block_delta
+import usage
+from admission import AdmissionController, Lane, Overloaded
+from blob_store import BlobStore
+from patching import PatchError, PreconditionFailed, apply_operations, apply_unified_diff
+from file_index import FileIndex
+from storage import LocalStorage, S3Storage
+from versions import VersionStore
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+# Startup stays cheap: the bridges load .env before spawning us (and say so via
+# MCP_DOTENV_LOADED), and requests/filelock are imported on first use.
+if not os.getenv('MCP_DOTENV_LOADED'):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,7 +43,80 @@ logger = logging.getLogger(__name__)
 FILE_DIRECTORY = os.getenv('FILE_STORAGE_PATH', 'uploaded_files')
 TOGETHER_AI_API_KEY = os.getenv('TOGETHER_AI_API_KEY')
 TOGETHER_AI_MODEL = os.getenv('TOGETHER_AI_MODEL', 'meta-llama/Llama-3.3-70B-Instruct-Turbo')
-TOGETHER_AI_BASE_URL = 'https://api.together.xyz/v1/chat/completions'
+TOGETHER_AI_BASE_URL = os.getenv('TOGETHER_AI_BASE_URL', 'https://api.together.xyz/v1/chat/completions')
+MCP_LISTEN_ADDRESS = os.getenv('MCP_LISTEN_ADDRESS')
+# Socket clients must pass this as "token" to the diagnostics/* methods; the
+# process that spawned the server over stdio needs none.
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+MAX_INFLIGHT_PER_CONNECTION = int(os.getenv('MCP_MAX_INFLIGHT_PER_CONNECTION', 64))
+# Admission control: tool calls run in lanes (read > write > ai) with their own
+# concurrency limits and bounded queues, sharing MAX_CONCURRENCY slots. Keep
+# the AI lane's concurrency plus queue well below MAX_INFLIGHT_PER_CONNECTION
+# so slow AI calls cannot fill a bridge connection's window.
+MAX_CONCURRENCY = int(os.getenv('MCP_MAX_CONCURRENCY', 32))
+READ_CONCURRENCY = int(os.getenv('MCP_READ_CONCURRENCY', 32))
+READ_QUEUE = int(os.getenv('MCP_READ_QUEUE', 256))
+WRITE_CONCURRENCY = int(os.getenv('MCP_WRITE_CONCURRENCY', 8))
+WRITE_QUEUE = int(os.getenv('MCP_WRITE_QUEUE', 128))
+AI_CONCURRENCY = int(os.getenv('MCP_AI_CONCURRENCY', 4))
+AI_QUEUE = int(os.getenv('MCP_AI_QUEUE', 8))
+AI_PER_CLIENT = int(os.getenv('MCP_AI_PER_CLIENT', 2))
+AI_RATE_PER_MINUTE = float(os.getenv('MCP_AI_RATE_PER_MINUTE', 10))
+AI_BURST = float(os.getenv('MCP_AI_BURST', 3))
+# Background AI edit jobs: queued jobs in total and per client, and how long
+# finished jobs stay available for polling.
+AI_JOB_QUEUE = int(os.getenv('MCP_AI_JOB_QUEUE', 100))
+AI_JOBS_PER_CLIENT = int(os.getenv('MCP_AI_JOBS_PER_CLIENT', 5))
+AI_JOB_RETENTION_HOURS = float(os.getenv('MCP_AI_JOB_RETENTION_HOURS', 24))
+# Server-owned state (index snapshot, versions, ...). It defaults to a
+# directory inside the storage root, so it follows the root rather than the
+# working directory; the tools can neither list nor address it there.
+MCP_STATE_DIR = os.getenv('MCP_STATE_DIR', os.path.join(FILE_DIRECTORY, '.mcp_state'))
+_state_in_root = os.path.relpath(os.path.realpath(MCP_STATE_DIR), os.path.realpath(FILE_DIRECTORY)).replace(os.sep, '/')
+STATE_SUBDIR = None if _state_in_root.startswith('..') else _state_in_root
+INDEX_SNAPSHOT_INTERVAL = float(os.getenv('MCP_INDEX_SNAPSHOT_INTERVAL', 60))
+# Where stored files live: "local" (FILE_STORAGE_PATH) or "s3", an
+# S3-compatible bucket that several servers can share (needs boto3).
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local').lower()
+S3_BUCKET = os.getenv('S3_BUCKET')
+S3_PREFIX = os.getenv('S3_PREFIX', '')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+S3_REGION = os.getenv('S3_REGION')
+S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', 32))
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv('S3_MULTIPART_THRESHOLD_MB', 8))
+# "plain" stores each file as-is; "cas" makes files and versions hard links
+# into a sha256-keyed blob store, one copy per distinct content.
+STORAGE_MODE = os.getenv('STORAGE_MODE', 'plain').lower()
+BLOB_STORE_PATH = os.getenv('BLOB_STORE_PATH', os.path.join(MCP_STATE_DIR, 'blobs'))
+# Seconds between scans for changes made outside the server; 0 disables.
+WATCH_INTERVAL = float(os.getenv('MCP_WATCH_INTERVAL', 2))
+# The same for the s3 backend, where each scan LISTs the whole bucket: our own
+# writes keep the listing current, so only other servers' changes wait for it.
+S3_WATCH_INTERVAL = float(os.getenv('S3_WATCH_INTERVAL', 300))
+# Clients whose unsent output exceeds this many bytes skip notifications
+# (and resync from the sequence gap) rather than buffering without bound.
+MAX_NOTIFICATION_BACKLOG = 1024 * 1024
+# Version history kept for each file; 0 days disables age-based expiry.
+VERSION_RETENTION_COUNT = int(os.getenv('VERSION_RETENTION_COUNT', 20))
+VERSION_RETENTION_DAYS = float(os.getenv('VERSION_RETENTION_DAYS', 30))
+# How often unreferenced blobs are collected and old versions expired.
+STORAGE_MAINTENANCE_INTERVAL = float(os.getenv('STORAGE_MAINTENANCE_INTERVAL', 300))
+# move_directory holds the lock of every file it moves at once (an open file
+# each with the local backend), so it refuses larger directories.
+MAX_DIRECTORY_MOVE_FILES = int(os.getenv('MCP_MAX_DIRECTORY_MOVE_FILES', 1000))
+# What one archive may expand to, and how many of its entries are written at once.
+ARCHIVE_MAX_ENTRIES = int(os.getenv('MCP_ARCHIVE_MAX_ENTRIES', 5000))
+ARCHIVE_MAX_MB = int(os.getenv('MCP_ARCHIVE_MAX_MB', 200))
+ARCHIVE_WORKERS = int(os.getenv('MCP_ARCHIVE_WORKERS', 8))
+# Per-directory limits, "dir=SIZE[:FILES],...", e.g. "projects=500MB:10000,/=2GB".
+DIRECTORY_QUOTAS = usage.parse_quotas(os.getenv('MCP_DIRECTORY_QUOTAS', ''))
+
+
+def storage_root_key() -> str:
+    """Short stable name of the storage root, so roots sharing one MCP_STATE_DIR keep their state apart."""
+    root = f"s3://{S3_BUCKET}/{S3_PREFIX}" if STORAGE_BACKEND == 's3' else os.path.realpath(FILE_DIRECTORY)
+    return hashlib.sha256(root.encode('utf-8')).hexdigest()[:16]
+
 
 ALLOWED_EXTENSIONS = [
     'txt', 'md', 'js', 'ts', 'jsx', 'tsx', 'py', 'java', 'cpp', 'c', 'cs',
@@ -32,10 +128,113 @@ ALLOWED_EXTENSIONS = [
 
 Path(FILE_DIRECTORY).mkdir(exist_ok=True)
 
+AI_MAX_ATTEMPTS = 3
+AI_RETRY_WAIT_BASE = 1.0
+AI_RETRY_WAIT_MAX = 10.0
+
+# JSON-RPC error code for a failed base_hash precondition; error.data carries
+# the file's current hash.
+PRECONDITION_FAILED = -32001
+# Request shed by admission control; error.data carries retry_after seconds.
+OVERLOADED = -32002
+# A write refused by a directory quota; error.data carries the directory.
+QUOTA_EXCEEDED = -32003
+# A diagnostics/* call without the admin token.
+UNAUTHORIZED = -32004
+INVALID_PARAMS = -32602
+READ_TOOLS = {"read_file", "list_files", "list_versions", "read_version", "get_ai_job",
+              "get_manifest", "get_block_signatures", "pull_files", "tree"}
+
+KNOWN_METHODS = {"initialize", "tools/list", "tools/call", "metrics/get", "traces/slowest",
+                 "diagnostics/profile", "diagnostics/memory", "diagnostics/stacks"}
+
+REQUESTS = Counter('mcp_server_requests_total', 'JSON-RPC requests handled, by method and outcome', ['method', 'outcome'])
+REQUEST_DURATION = Histogram('mcp_server_request_duration_seconds', 'JSON-RPC request handling time, by method', ['method'])
+TOOL_CALLS = Counter('mcp_server_tool_calls_total', 'Tool invocations, by tool and outcome', ['tool', 'outcome'])
+TOOL_DURATION = Histogram('mcp_server_tool_duration_seconds', 'Tool execution time, by tool', ['tool'])
+INFLIGHT = Gauge('mcp_server_inflight_requests', 'Requests currently being handled')
+CONNECTIONS = Gauge('mcp_server_connections', 'Open socket client connections')
+BYTES_RECEIVED = Counter('mcp_server_bytes_received_total', 'Bytes of JSON-RPC requests read from clients')
+BYTES_SENT = Counter('mcp_server_bytes_sent_total', 'Bytes of JSON-RPC responses written to clients')
+LOCK_WAIT = Histogram('mcp_server_lock_wait_seconds', 'Time spent waiting to acquire per-file locks')
+AI_REQUESTS = Counter('mcp_server_ai_requests_total', 'Upstream AI API attempts, by outcome', ['outcome'])
+AI_RETRIES = Counter('mcp_server_ai_retries_total', 'Upstream AI API attempts that were retried')
+AI_DURATION = Histogram('mcp_server_ai_request_duration_seconds', 'Upstream AI API latency per attempt')
+CHANGE_NOTIFICATIONS = Counter('mcp_server_change_notifications_total', 'File change notifications emitted, by type', ['type'])
+AI_TOKENS = Counter('mcp_server_ai_tokens_total', 'Tokens reported by the AI API, by kind', ['kind'])
+ARCHIVE_ENTRIES = Counter('mcp_server_archive_entries_total', 'Archive entries handled by extract_archive, by result', ['result'])
+AI_COALESCED = Counter('mcp_server_ai_coalesced_total', 'AI edits that shared an identical in-flight upstream call')
+
+# Who the request being handled came from, for per-client limits in tools.
+current_client: ContextVar[str] = ContextVar('current_client', default="local")
+
 class MCPServer:
     def __init__(self):
         self.tools = self._register_tools()
         self.initialized = False
+        # Change notifications carry (epoch, seq) so subscribers can detect
+        # missed events and server restarts.
+        self.epoch = os.urandom(6).hex()
+        self.change_seq = 0
+        self._stdio = False
+        self._connections = set()
+        self.admission = AdmissionController(MAX_CONCURRENCY, [
+            Lane("read", 0, READ_CONCURRENCY, READ_QUEUE),
+            Lane("write", 1, WRITE_CONCURRENCY, WRITE_QUEUE),
+            Lane("ai", 2, AI_CONCURRENCY, AI_QUEUE, per_client=AI_PER_CLIENT, rate=AI_RATE_PER_MINUTE / 60, burst=AI_BURST),
+        ])
+        self.storage = self._create_storage()
+        self.watch_interval = S3_WATCH_INTERVAL if self.storage.remote else WATCH_INTERVAL
+        # Whether the watcher is running and reconciles for the tools.
+        self._watching = False
+        # Built from a full listing on first use, then kept current by _notify_change.
+        self.usage = usage.DirectoryUsage(DIRECTORY_QUOTAS)
+        # Opened on first use; most servers never run a background AI job.
+        self._jobs = None
+        # Jobs name files by relative path: keep them with the root they belong to.
+        self._jobs_path = os.path.join(MCP_STATE_DIR, f'ai_jobs-{storage_root_key()}.sqlite3')
+        # Identical in-flight AI requests, keyed by (base hash, prompt, model).
+        self._ai_flights: Dict[tuple, asyncio.Future] = {}
+        self._job_tasks: Dict[str, asyncio.Task] = {}
+        self._job_signal = asyncio.Event()
+
+    @property
+    def jobs(self):
+        if self._jobs is None:
+            import ai_jobs
+            self._jobs = ai_jobs.JobStore(self._jobs_path)
+            recovered = self._jobs.recover()
+            if recovered:
+                logger.info(f"Requeued {recovered} AI jobs interrupted by the last shutdown")
+        return self._jobs
+
+    @staticmethod
+    def _create_storage():
+        max_age = VERSION_RETENTION_DAYS * 86400 if VERSION_RETENTION_DAYS > 0 else None
+        if STORAGE_BACKEND == 's3':
+            if not S3_BUCKET:
+                raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+            logger.info(f"Storing files in s3://{S3_BUCKET}/{S3_PREFIX}files/")
+            return S3Storage(
+                S3_BUCKET, S3_PREFIX, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION,
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                multipart_threshold=S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+                max_versions=VERSION_RETENTION_COUNT, max_version_age_seconds=max_age
+            )
+        if STORAGE_BACKEND != 'local':
+            raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+        # Warm start: the previous run's metadata is loaded here and list_files
+        # only re-lists directories whose mtime changed since.
+        index = FileIndex(FILE_DIRECTORY, os.path.join(MCP_STATE_DIR, 'index.snapshot'),
+                          ignore_dirs=(STATE_SUBDIR,) if STATE_SUBDIR else ())
+        index.load()
+        return LocalStorage(
+            FILE_DIRECTORY, index,
+            VersionStore(os.path.join(MCP_STATE_DIR, 'versions', storage_root_key()),
+                         max_count=VERSION_RETENTION_COUNT, max_age_seconds=max_age),
+            BlobStore(BLOB_STORE_PATH) if STORAGE_MODE == 'cas' else None,
+            lock_dir=os.path.join(MCP_STATE_DIR, 'locks', storage_root_key())
+        )
 
     def _register_tools(self):
         return {
@@ -78,7 +277,9 @@ class MCPServer:
                 "inputSchema": {
                     "type": "object",
                     "properties": {
-                        "filename": {"type": "string", "description": "Name of the file to read"}
+                        "filename": {"type": "string", "description": "Name of the file to read"},
+                        "offset": {"type": "integer", "description": "Read bytes from this offset only, counted from the end if negative; they come back base64-encoded in 'data'"},
+                        "length": {"type": "integer", "description": "With or without 'offset', read at most this many bytes", "minimum": 0}
                     },
                     "required": ["filename"]
                 }
@@ -86,6 +287,249 @@ class MCPServer:
             "list_files": {
                 "description": "List all files in the filesystem",
                 "inputSchema": {"type": "object", "properties": {}, "additionalProperties": False}
+            },
+            "tree": {
+                "description": "A directory with the number of files and bytes under it, and its entries a few levels down; deeper directories come with their totals only and can be expanded with another call",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "path": {"type": "string", "description": "Directory to list; the storage root if omitted", "default": ""},
+                        "depth": {"type": "integer", "description": "How many levels of entries to include", "default": 1}
+                    }
+                }
+            },
+            "patch_file": {
+                "description": "Change part of a file with (offset, delete, insert) operations or a unified diff, optionally only if it still has the given sha256",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "filename": {"type": "string", "description": "Name of the file to patch"},
+                        "base_hash": {"type": "string", "description": "sha256 of the content the patch was made against; the patch is rejected if the file changed"},
+                        "operations": {
+                            "type": "array",
+                            "description": "Edits sorted by offset; offsets and delete counts are in characters of the base content",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "offset": {"type": "integer"},
+                                    "delete": {"type": "integer", "default": 0},
+                                    "insert": {"type": "string", "default": ""}
+                                },
+                                "required": ["offset"]
+                            }
+                        },
+                        "diff": {"type": "string", "description": "Unified diff against the base content"}
+                    },
+                    "required": ["filename"]
+                }
+            },
+            "copy_file": {
+                "description": "Copy a file on the server, without sending its content",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "source": {"type": "string"},
+                        "destination": {"type": "string"},
+                        "overwrite": {"type": "boolean", "default": False, "description": "Replace an existing destination (kept as a version)"}
+                    },
+                    "required": ["source", "destination"]
+                }
+            },
+            "move_file": {
+                "description": "Move a file to another path; its version history moves along",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "source": {"type": "string"},
+                        "destination": {"type": "string"},
+                        "overwrite": {"type": "boolean", "default": False, "description": "Replace an existing destination (kept as a version)"}
+                    },
+                    "required": ["source", "destination"]
+                }
+            },
+            "rename_file": {
+                "description": "Rename a file within its directory",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "filename": {"type": "string"},
+                        "new_name": {"type": "string", "description": "New file name, without a directory"}
+                    },
+                    "required": ["filename", "new_name"]
+                }
+            },
+            "copy_directory": {
+                "description": "Copy every file under a directory to the same places under another one",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "source": {"type": "string"},
+                        "destination": {"type": "string"}
+                    },
+                    "required": ["source", "destination"]
+                }
+            },
+            "move_directory": {
+                "description": "Move or rename a directory with everything under it",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "source": {"type": "string"},
+                        "destination": {"type": "string"}
+                    },
+                    "required": ["source", "destination"]
+                }
+            },
+            "extract_archive": {
+                "description": "Unpack a zip, tar (.tar.gz, .tar.bz2, .tar.xz) or .gz archive into stored files; reports what happened to each entry",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "archive": {"type": "string", "description": "Base64-encoded archive"},
+                        "archive_name": {"type": "string", "description": "Archive file name; names the content of a plain .gz"},
+                        "destination": {"type": "string", "description": "Directory to unpack into", "default": ""},
+                        "overwrite": {"type": "boolean", "default": False, "description": "Replace existing files (kept as versions)"}
+                    },
+                    "required": ["archive"]
+                }
+            },
+            "list_versions": {
+                "description": "List earlier versions of a file kept before edits, overwrites and deletion",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "filename": {"type": "string", "description": "Name of the file"}
+                    },
+                    "required": ["filename"]
+                }
+            },
+            "read_version": {
+                "description": "Read the content of an earlier version of a file",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "filename": {"type": "string", "description": "Name of the file"},
+                        "version": {"type": "integer", "description": "Version number from list_versions"}
+                    },
+                    "required": ["filename", "version"]
+                }
+            },
+            "restore_version": {
+                "description": "Make an earlier version the current content of a file (the current content becomes a new version)",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "filename": {"type": "string", "description": "Name of the file"},
+                        "version": {"type": "integer", "description": "Version number from list_versions"}
+                    },
+                    "required": ["filename", "version"]
+                }
+            },
+            "submit_ai_edit": {
+                "description": "Queue an AI edit of a file as a background job and return its id without waiting for the result",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "filename": {"type": "string", "description": "Name of the file to edit"},
+                        "prompt": {"type": "string", "description": "Natural language prompt for AI editing"}
+                    },
+                    "required": ["filename", "prompt"]
+                }
+            },
+            "get_ai_job": {
+                "description": "Status of an AI edit job, with the new content once it has succeeded",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "job_id": {"type": "string", "description": "Id returned by submit_ai_edit"}
+                    },
+                    "required": ["job_id"]
+                }
+            },
+            "cancel_ai_job": {
+                "description": "Cancel a queued or running AI edit job",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "job_id": {"type": "string", "description": "Id returned by submit_ai_edit"}
+                    },
+                    "required": ["job_id"]
+                }
+            },
+            "get_manifest": {
+                "description": "Path, size, mtime and sha256 of every stored file, or of those under a prefix, for syncing a local copy",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "prefix": {"type": "string", "description": "Only list files whose path starts with this", "default": ""}
+                    }
+                }
+            },
+            "get_block_signatures": {
+                "description": "Block checksums of stored files, to push changes to them as block deltas",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "filenames": {"type": "array", "items": {"type": "string"}},
+                        "block_size": {"type": "integer", "description": "Bytes per block; chosen from the file size if omitted"}
+                    },
+                    "required": ["filenames"]
+                }
+            },
+            "pull_files": {
+                "description": "Read several files at once; a file given with the block signatures of a local copy comes back as a delta against that copy",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "filename": {"type": "string"},
+                                    "signatures": {"type": "object", "description": "Block signatures of the local copy"}
+                                },
+                                "required": ["filename"]
+                            }
+                        }
+                    },
+                    "required": ["files"]
+                }
+            },
+            "push_files": {
+                "description": "Write and delete several files at once, each only if it still has base_hash when given; content is sent whole or as a block delta against base_hash",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "filename": {"type": "string"},
+                                    "sha256": {"type": "string", "description": "sha256 of the new content"},
+                                    "base_hash": {"type": "string", "description": "sha256 the file must still have"},
+                                    "content": {"type": "string"},
+                                    "delta": {"type": "object", "description": "{block_size, ops} against the base_hash content"}
+                                },
+                                "required": ["filename"]
+                            },
+                            "default": []
+                        },
+                        "delete": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "filename": {"type": "string"},
+                                    "base_hash": {"type": "string"}
+                                },
+                                "required": ["filename"]
+                            },
+                            "default": []
+                        }
+                    }
+                }
             }
         }
 
@@ -98,15 +542,137 @@ class MCPServer:
         base_path = Path(FILE_DIRECTORY).resolve()
         if not str(resolved_path).startswith(str(base_path)):
             raise ValueError(f"Path traversal detected: {filename}")
+        rel_path = resolved_path.relative_to(base_path).as_posix()
+        if STATE_SUBDIR and (rel_path == STATE_SUBDIR or rel_path.startswith(STATE_SUBDIR + '/')):
+            raise ValueError(f"Reserved for server state: {filename}")
         return str(resolved_path)
 
+    @staticmethod
+    def index_key(file_path: str) -> str:
+        return os.path.relpath(file_path, Path(FILE_DIRECTORY).resolve()).replace(os.sep, '/')
+
     @staticmethod
     def validate_file_extension(filename: str) -> bool:
         extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
         return extension in ALLOWED_EXTENSIONS
 
-    @retry(stop_max_attempt_number=3, wait_exponential_multiplier=1000, wait_exponential_max=10000)
+    async def _io(self, fn, *args):
+        """Run a blocking storage operation; remote backends wait on the network, so off the loop."""
+        if self.storage.remote:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def _locked(self, rel_path: str, fn):
+        """Run ``fn()`` holding the file's lock."""
+        return await self._locked_all([rel_path], fn)
+
+    async def _locked_all(self, rel_paths: List[str], fn):
+        """Run ``fn()`` holding the locks of all ``rel_paths``."""
+        def run():
+            with self._file_lock(*rel_paths):
+                return fn()
+        return await self._io(run)
+
+    async def _read_range(self, filename: str, rel_path: str, offset: int, length: Optional[int]) -> Dict[str, Any]:
+        """read_file of the bytes from ``offset``; an empty ``data`` means the range is past the end."""
+        if length is not None and int(length) < 0:
+            raise ValueError("length must not be negative")
+
+        def read():
+            st = self.storage.stat(rel_path)
+            if st is None:
+                raise ValueError(f"File '{filename}' not found")
+            start = max(0, st.size + offset) if offset < 0 else offset
+            end = st.size if length is None else min(st.size, start + int(length))
+            try:
+                data = self.storage.read_range(rel_path, start, end - start) if start < end else b""
+            except FileNotFoundError:
+                raise ValueError(f"File '{filename}' not found")
+            return st, start, data
+        st, start, data = await self._locked(rel_path, read)
+        return {
+            "content": [{"type": "text", "text": f"{len(data)} of {st.size} bytes of '{filename}' from offset {start}"}],
+            "data": base64.b64encode(data).decode('ascii'),
+            "offset": start,
+            "stat": st._asdict()
+        }
+
+    async def _write_file(self, rel_path: str, content: str, reason: str, must_exist: bool = False) -> str:
+        def write():
+            if must_exist and self.storage.stat(rel_path) is None:
+                raise ValueError(f"File '{rel_path}' not found")
+            data = content.encode('utf-8')
+            with self.usage.reserve(rel_path, len(data)):
+                return self.storage.write(rel_path, data, reason)
+        digest, existed = await self._locked(rel_path, write)
+        self._notify_change("modified" if existed else "created", rel_path)
+        return digest
+
+    def _notify_change(self, kind: str, rel_path: str):
+        """Tell connected clients that a stored file was created, modified or deleted."""
+        st = self.storage.cached_stat(rel_path)
+        self.usage.set(rel_path, st.size if kind != "deleted" and st is not None else None)
+        if not self.validate_file_extension(rel_path):
+            return
+        self.change_seq += 1
+        params = {"epoch": self.epoch, "seq": self.change_seq, "type": kind, "path": rel_path}
+        if kind != "deleted" and st is not None:
+            params.update(size=st.size, mtime=st.mtime_ns / 1e9)
+        CHANGE_NOTIFICATIONS.labels(kind).inc()
+        self._broadcast({"jsonrpc": "2.0", "method": "notifications/file_changed", "params": params})
+
+    def _broadcast(self, message: Dict[str, Any]):
+        data = json.dumps(message)
+        if self._stdio:
+            BYTES_SENT.inc(len(data) + 1)
+            print(data, flush=True)
+        for writer in list(self._connections):
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > MAX_NOTIFICATION_BACKLOG:
+                continue
+            BYTES_SENT.inc(len(data) + 1)
+            writer.write((data + "\n").encode("utf-8"))
+
+    async def _reconcile(self):
+        # A stat of every directory locally, a full LIST on S3: never on the loop.
+        for kind, rel_path in await asyncio.to_thread(self.storage.changes):
+            self._notify_change(kind, rel_path)
+
+    async def _track_usage(self):
+        """Build the per-directory totals from a full listing, once."""
+        if self.usage.built:
+            return
+        await self._reconcile()
+
+        def listing():
+            for rel_path in self.storage.paths():
+                st = self.storage.cached_stat(rel_path)
+                if st is not None:
+                    yield rel_path, st.size
+        await self._io(lambda: self.usage.build(listing()))
+        logger.info(f"Tracking usage of {self.usage.totals[''][0]} files")
+
+    @contextmanager
+    def _file_lock(self, *rel_paths: str):
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            with tracing.span("file_lock.wait", path=rel_paths[0].rsplit('/', 1)[-1]):
+                stack.enter_context(self.storage.lock(*rel_paths))
+            LOCK_WAIT.observe(time.perf_counter() - start)
+            yield
+
     async def call_together_ai(self, prompt: str, file_content: str = "") -> Optional[str]:
+        # Exponential backoff between attempts: 1s, 2s, ... capped at 10s.
+        for attempt in range(1, AI_MAX_ATTEMPTS + 1):
+            try:
+                with tracing.span("ai.request", attempt=attempt, model=TOGETHER_AI_MODEL):
+                    return await self._request_together_ai(prompt, file_content)
+            except Exception:
+                if attempt == AI_MAX_ATTEMPTS:
+                    raise
+                AI_RETRIES.inc()
+                await asyncio.sleep(min(AI_RETRY_WAIT_BASE * 2 ** (attempt - 1), AI_RETRY_WAIT_MAX))
+
+    async def _request_together_ai(self, prompt: str, file_content: str = "") -> Optional[str]:
         if not TOGETHER_AI_API_KEY or TOGETHER_AI_API_KEY == 'your_api_key_here':
             logger.error("Together AI API key not configured")
             return None
@@ -129,17 +695,388 @@ class MCPServer:
             "max_tokens": 4096,
             "temperature": 0.7
         }
+        import requests
+        start = time.perf_counter()
         try:
             logger.info(f"Making request to Together AI with model: {TOGETHER_AI_MODEL}")
-            response = requests.post(TOGETHER_AI_BASE_URL, headers=headers, json=payload, timeout=30)
+            # In a thread, so the event loop keeps serving other requests.
+            response = await asyncio.to_thread(requests.post, TOGETHER_AI_BASE_URL, headers=headers, json=payload, timeout=30)
             response.raise_for_status()
             result = response.json()
-            return result['choices'][0]['message']['content']
+            content = result['choices'][0]['message']['content']
         except Exception as e:
+            AI_REQUESTS.labels("error").inc()
             logger.error(f"Error calling Together AI API: {e}")
             raise
+        finally:
+            AI_DURATION.observe(time.perf_counter() - start)
+        AI_REQUESTS.labels("success").inc()
+        usage = result.get('usage') or {}
+        for kind in ('prompt_tokens', 'completion_tokens'):
+            if usage.get(kind):
+                AI_TOKENS.labels(kind.split('_')[0]).inc(usage[kind])
+        return content
+
+    @staticmethod
+    def lane_for(method: str, params: Any) -> Optional[str]:
+        """Admission lane of a request; None for control requests that always run."""
+        if method != "tools/call" or not isinstance(params, dict):
+            return None
+        name = params.get("name")
+        if name in READ_TOOLS:
+            return "read"
+        arguments = params.get("arguments") or {}
+        if name == "edit_file" and arguments.get("use_ai", True) and arguments.get("prompt"):
+            return "ai"
+        return "write"
+
+    async def _coalesced_ai_edit(self, base_hash: str, prompt: str, content: str):
+        """AI result for ``content``, sharing one upstream call among identical requests.
+
+        Returns the new content (None if AI is unavailable) and whether an
+        already running call was reused.
+        """
+        key = (base_hash, prompt, TOGETHER_AI_MODEL)
+        entry = self._ai_flights.get(key)
+        shared = entry is not None
+        if shared:
+            AI_COALESCED.inc()
+        else:
+            entry = self._ai_flights[key] = [asyncio.ensure_future(self.call_together_ai(prompt, content)), 0]
 
-    async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+            def forget(_):
+                if self._ai_flights.get(key) is entry:
+                    del self._ai_flights[key]
+            entry[0].add_done_callback(forget)
+        flight = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(flight), shared
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not flight.done():
+                flight.cancel()  # every requester gave up
+
+    async def _apply_ai_edit(self, rel_path: str, filename: str, base_hash: str, content: str) -> str:
+        """Write an AI result if the file still has the content it was made from."""
+        data = content.encode('utf-8')
+
+        def apply():
+            current_hash = self.storage.digest(rel_path)
+            if current_hash != base_hash:
+                if current_hash == hashlib.sha256(data).hexdigest():
+                    return current_hash, None  # a coalesced request already wrote this result
+                raise PreconditionFailed(f"File '{filename}' changed while the AI edit was running", current_hash)
+            with self.usage.reserve(rel_path, len(data)):
+                return self.storage.write(rel_path, data, "ai_edit")
+        digest, existed = await self._locked(rel_path, apply)
+        if existed is not None:
+            self._notify_change("modified" if existed else "created", rel_path)
+        return digest
+
+    async def _read_current(self, rel_path: str, filename: str):
+        """Text content and sha256 of a stored file."""
+        try:
+            stored = await self._locked(rel_path, lambda: self.storage.read(rel_path))
+        except FileNotFoundError:
+            raise ValueError(f"File '{filename}' not found")
+        return stored.data.decode('utf-8'), stored.sha256
+
+    @staticmethod
+    def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+        import ai_jobs
+        view = {key: job[key] for key in ("id", "filename", "status", "created", "updated", "error", "sha256")}
+        view["coalesced"] = bool(job["coalesced"])
+        if job["status"] == ai_jobs.SUCCEEDED:
+            view["new_content"] = job["result"]
+        return view
+
+    async def _run_ai_job(self, job: Dict[str, Any]):
+        import ai_jobs
+        filename = job["filename"]
+        try:
+            rel_path = self.index_key(self.validate_path(filename))
+            async with self.admission.admit("ai", job["client"], enforce_limits=False):
+                current_content, current_hash = await self._read_current(rel_path, filename)
+                if current_hash != job["base_hash"]:
+                    raise PreconditionFailed(f"File '{filename}' changed after the job was submitted", current_hash)
+                modified_content, shared = await self._coalesced_ai_edit(job["base_hash"], job["prompt"], current_content)
+                if modified_content is None:
+                    raise ValueError("AI service unavailable")
+                digest = await self._apply_ai_edit(rel_path, filename, job["base_hash"], modified_content)
+            self.jobs.finish(job["id"], ai_jobs.SUCCEEDED, sha256=digest, result=modified_content, coalesced=shared)
+            logger.info(f"AI job {job['id']} edited file: {filename}")
+        except PreconditionFailed as e:
+            self.jobs.finish(job["id"], ai_jobs.CONFLICT, error=str(e))
+        except asyncio.CancelledError:
+            # Cancelled by cancel_ai_job (already recorded) or by shutdown, in
+            # which case the job is still "running" and is requeued on start.
+            raise
+        except Exception as e:
+            logger.error(f"AI job {job['id']} failed: {e}")
+            self.jobs.finish(job["id"], ai_jobs.FAILED, error=str(e))
+
+    async def _ai_job_worker(self):
+        while True:
+            await self._job_signal.wait()
+            job = self.jobs.claim_next()
+            if job is None:
+                self._job_signal.clear()
+                continue
+            task = self._job_tasks[job["id"]] = asyncio.create_task(self._run_ai_job(job))
+            try:
+                await asyncio.wait([task])
+            finally:
+                self._job_tasks.pop(job["id"], None)
+
+    def _checked_path(self, filename: str) -> str:
+        """Validated relative path of a stored file."""
+        if not self.validate_file_extension(filename):
+            raise ValueError(f"Invalid file extension for {filename}")
+        return self.index_key(self.validate_path(filename))
+
+    async def _pull_file(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        filename = entry["filename"]
+        try:
+            rel_path = self._checked_path(filename)
+            stored = await self._locked(rel_path, lambda: self.storage.read(rel_path))
+        except FileNotFoundError:
+            return {"filename": filename, "status": "missing"}
+        except ValueError as e:
+            return {"filename": filename, "status": "error", "error": str(e)}
+        result = {"filename": filename, "sha256": stored.sha256, "size": stored.stat.size, "mtime": stored.stat.mtime_ns / 1e9}
+        signatures = entry.get("signatures")
+        if signatures:
+            # Pure-Python checksumming; in a thread so other requests keep
+            # being served. Past half the file in literals, send it whole.
+            try:
+                ops = await asyncio.to_thread(block_delta.delta, stored.data, signatures, len(stored.data) // 2)
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                # Malformed signatures only fail their own entry.
+                return {"filename": filename, "status": "error", "error": f"Invalid signatures: {e!r}"}
+            if ops is not None:
+                return dict(result, status="delta", delta={"block_size": signatures["block_size"], "ops": ops})
+        try:
+            return dict(result, status="content", content=stored.data.decode('utf-8'))
+        except UnicodeDecodeError as e:
+            return {"filename": filename, "status": "error", "error": f"Not UTF-8 text: {e}"}
+
+    async def _push_file(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        filename = entry["filename"]
+        base_hash = entry.get("base_hash")
+        target_hash = entry.get("sha256")
+        delta = entry.get("delta")
+        try:
+            rel_path = self._checked_path(filename)
+            if delta is not None and not base_hash:
+                raise ValueError("A delta requires base_hash")
+            if delta is None and entry.get("content") is None:
+                raise ValueError("Either 'content' or 'delta' required")
+
+            def push():
+                current_hash = self.storage.digest(rel_path)
+                if target_hash and current_hash == target_hash:
+                    return {"status": "unchanged", "sha256": current_hash}, None
+                if base_hash and current_hash != base_hash:
+                    raise PreconditionFailed(f"File '{filename}' has changed", current_hash)
+                if delta is not None:
+                    data = block_delta.apply(self.storage.read(rel_path).data, delta["ops"], int(delta["block_size"]))
+                    data.decode('utf-8')  # stored files are text, as with every other tool
+                else:
+                    data = entry["content"].encode('utf-8')
+                if target_hash and hashlib.sha256(data).hexdigest() != target_hash:
+                    raise ValueError("Pushed content does not match its sha256")
+                with self.usage.reserve(rel_path, len(data)):
+                    digest, existed = self.storage.write(rel_path, data, "sync")
+                return {"status": "written", "sha256": digest}, existed
+            result, existed = await self._locked(rel_path, push)
+        except PreconditionFailed as e:
+            return {"filename": filename, "status": "conflict", "current_hash": e.current_hash}
+        except (ValueError, KeyError, IndexError, TypeError, OSError) as e:
+            return {"filename": filename, "status": "error", "error": str(e)}
+        if existed is not None:
+            self._notify_change("modified" if existed else "created", rel_path)
+        return dict(result, filename=filename)
+
+    async def _push_delete(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        filename = entry["filename"]
+        base_hash = entry.get("base_hash")
+        try:
+            rel_path = self._checked_path(filename)
+
+            def delete():
+                if base_hash:
+                    current_hash = self.storage.digest(rel_path)
+                    if current_hash is not None and current_hash != base_hash:
+                        raise PreconditionFailed(f"File '{filename}' has changed", current_hash)
+                return self.storage.delete(rel_path)
+            deleted = await self._locked(rel_path, delete)
+        except PreconditionFailed as e:
+            return {"filename": filename, "status": "conflict", "current_hash": e.current_hash}
+        except (ValueError, OSError) as e:
+            return {"filename": filename, "status": "error", "error": str(e)}
+        if not deleted:
+            return {"filename": filename, "status": "missing"}
+        self._notify_change("deleted", rel_path)
+        return {"filename": filename, "status": "deleted"}
+
+    async def _transfer(self, src: str, dst: str, move: bool, overwrite: bool):
+        """Copy or move a stored file under both paths' locks; returns (sha256, dst existed)."""
+        if src == dst:
+            raise ValueError("Source and destination are the same file")
+
+        def run():
+            if not overwrite and self.storage.stat(dst) is not None:
+                raise ValueError(f"File '{dst}' already exists")
+            st = self.storage.stat(src)
+            if st is None:
+                raise ValueError(f"File '{src}' not found")
+            try:
+                with self.usage.reserve(dst, st.size, moved_from=src if move else None):
+                    return self.storage.move(src, dst) if move else self.storage.copy(src, dst)
+            except FileNotFoundError:
+                raise ValueError(f"File '{src}' not found")
+        digest, existed = await self._locked_all([src, dst], run)
+        self._notify_change("modified" if existed else "created", dst)
+        if move:
+            self._notify_change("deleted", src)
+        return digest, existed
+
+    async def _directory_pairs(self, source: str, destination: str):
+        """``(src_dir, dst_dir, [(src, dst), ...])`` for every stored file under ``source``."""
+        src_dir = self.index_key(self.validate_path(source))
+        dst_dir = self.index_key(self.validate_path(destination))
+        if src_dir == "." or dst_dir == ".":
+            raise ValueError("The storage root cannot be copied or moved")
+        if dst_dir == src_dir or dst_dir.startswith(src_dir + "/"):
+            raise ValueError(f"Cannot copy or move '{source}' into itself")
+        await self._reconcile()
+        stored = await self._io(self.storage.paths)
+        pairs = [(p, dst_dir + p[len(src_dir):]) for p in stored if p.startswith(src_dir + "/")]
+        if not pairs:
+            raise ValueError(f"Directory '{source}' not found or empty")
+        existing = set(stored)
+        taken = next((dst for _, dst in pairs if dst in existing), None)
+        if taken:
+            raise ValueError(f"File '{taken}' already exists")
+        return src_dir, dst_dir, pairs
+
+    def _extract(self, archive: str, name: str, prefix: str, overwrite: bool):
+        """Unpack an archive into storage; returns (per-entry results, why it stopped early or None).
+
+        Runs in a worker thread: entries are decompressed one at a time here
+        while a pool writes the previous ones, each under its file's lock.
+        """
+        import archives  # tarfile, gzip and zipfile are only needed here
+        try:
+            data = base64.b64decode(archive, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError("The archive is not valid base64")
+        results: List[Dict[str, Any]] = []
+        seen = set()
+        # Bounds the entries read but not yet written.
+        pending = threading.BoundedSemaphore(ARCHIVE_WORKERS * 2)
+
+        def write(rel_path: str, content: bytes, result: Dict[str, Any]):
+            try:
+                with self._file_lock(rel_path):
+                    if not overwrite and self.storage.stat(rel_path) is not None:
+                        result.update(status="skipped", error="File exists")
+                        return
+                    # Entries written at the same time are checked against each other.
+                    with self.usage.reserve(rel_path, len(content)):
+                        digest, existed = self.storage.write(rel_path, content, "extract")
+                result.update(status="modified" if existed else "created", size=len(content), sha256=digest)
+            except Exception as e:
+                result.update(status="error", error=str(e))
+            finally:
+                pending.release()
+
+        stop_error = None
+        with ThreadPoolExecutor(max_workers=ARCHIVE_WORKERS) as pool:
+            try:
+                for entry in archives.entries(data, name, ARCHIVE_MAX_ENTRIES, ARCHIVE_MAX_MB * 1024 * 1024):
+                    result = {"path": prefix + entry.name}
+                    results.append(result)
+                    if entry.error:
+                        result.update(status="skipped", error=entry.error)
+                        continue
+                    try:
+                        rel_path = self._checked_path(prefix + entry.name)
+                        entry.data.decode('utf-8')  # stored files are text
+                    except UnicodeDecodeError:
+                        result.update(status="skipped", error="Not UTF-8 text")
+                        continue
+                    except ValueError as e:
+                        result.update(status="skipped", error=str(e))
+                        continue
+                    if rel_path in seen:
+                        result.update(status="skipped", error="Duplicate entry")
+                        continue
+                    seen.add(rel_path)
+                    result["path"] = rel_path
+                    pending.acquire()
+                    pool.submit(write, rel_path, entry.data, result)
+            except ValueError as e:
+                # A limit or a corrupt entry part-way through: keep what was written.
+                if not results:
+                    raise
+                stop_error = str(e)
+        return results, stop_error
+
+    async def handle_request(self, request: Dict[str, Any], client: str = "local") -> Dict[str, Any]:
+        method = request.get("method")
+        label = method if method in KNOWN_METHODS else "unknown"
+        params = request.get("params") or {}
+        meta = (params.get("_meta") or {}) if isinstance(params, dict) else {}
+        traceparent = meta.get("traceparent")
+        lane = self.lane_for(method, params)
+        # A caller that propagated its trace context gets our spans back in the
+        # response; otherwise this process is the trace root and exports it.
+        scope = tracing.start_trace(f"mcp {label}", traceparent, export=traceparent is None, **{"rpc.method": label})
+        start = time.perf_counter()
+        with INFLIGHT.track_inprogress(), scope:
+            try:
+                if lane is None:
+                    response = await self._dispatch(request, client)
+                else:
+                    # Bridges pass the end user's address; other clients are
+                    # told apart by their connection.
+                    current_client.set(str(meta.get("client") or client))
+                    async with self.admission.admit(lane, current_client.get()):
+                        response = await self._dispatch(request, client)
+            except Overloaded as e:
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": request.get("id"),
+                    "error": {
+                        "code": OVERLOADED,
+                        "message": f"Server busy: {str(e)}",
+                        "data": {"lane": e.lane, "reason": e.reason, "retry_after": round(e.retry_after, 1)}
+                    }
+                }
+            if "error" in response:
+                scope.span.record_error(response["error"]["message"])
+        REQUEST_DURATION.labels(label).observe(time.perf_counter() - start)
+        REQUESTS.labels(label, "error" if "error" in response else "success").inc()
+        if scope.sampled and scope.remote_parent:
+            meta = {"_meta": {"spans": scope.spans()}}
+            if isinstance(response.get("result"), dict):
+                response["result"].update(meta)
+            elif "error" in response:
+                response["error"].setdefault("data", {}).update(meta)
+        return response
+
+    @staticmethod
+    def _may_diagnose(params: Dict[str, Any], client: str) -> bool:
+        # "local" is an in-process caller and "stdio" the parent process;
+        # socket clients are named after their connection.
+        if client in ("local", "stdio"):
+            return True
+        token = params.get("token")
+        return bool(ADMIN_TOKEN) and isinstance(token, str) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+    async def _dispatch(self, request: Dict[str, Any], client: str = "local") -> Dict[str, Any]:
         method = request.get("method")
         params = request.get("params", {})
         request_id = request.get("id")
@@ -152,7 +1089,10 @@ class MCPServer:
                     "result": {
                         "protocolVersion": "2024-11-05",
                         "capabilities": {"tools": {"listChanged": True}},
-                        "serverInfo": {"name": "filesystem-server", "version": "1.0.0"}
+                        "serverInfo": {"name": "filesystem-server", "version": "1.0.0"},
+                        # Where this server's change notifications start; with
+                        # the watcher on, clients can use it to validate listings.
+                        "changes": {"epoch": self.epoch, "seq": self.change_seq, "watching": self.watch_interval > 0}
                     }
                 }
             elif method == "tools/list":
@@ -166,10 +1106,70 @@ class MCPServer:
                 arguments = params.get("arguments", {})
                 if tool_name not in self.tools:
                     raise ValueError(f"Unknown tool: {tool_name}")
-                result = await self.execute_tool(tool_name, arguments)
+                start = time.perf_counter()
+                try:
+                    with tracing.span(f"tool {tool_name}", tool=tool_name):
+                        result = await self.execute_tool(tool_name, arguments)
+                except Exception:
+                    TOOL_CALLS.labels(tool_name, "error").inc()
+                    raise
+                finally:
+                    TOOL_DURATION.labels(tool_name).observe(time.perf_counter() - start)
+                TOOL_CALLS.labels(tool_name, "success").inc()
                 return {"jsonrpc": "2.0", "id": request_id, "result": result}
+            elif method == "metrics/get":
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {"text": REGISTRY.render(), "metrics": REGISTRY.snapshot()}
+                }
+            elif method == "traces/slowest":
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {"traces": tracing.slowest(int(params.get("limit", 10)))}
+                }
+            elif method in ("diagnostics/profile", "diagnostics/memory", "diagnostics/stacks") and not self._may_diagnose(params, client):
+                logger.warning(f"Refused {method} from {client} without the admin token")
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "error": {"code": UNAUTHORIZED, "message": "Diagnostics need the admin token (ADMIN_TOKEN) on socket connections"}
+                }
+            elif method == "diagnostics/profile":
+                import diagnostics
+                artifact = await diagnostics.profile(params.get("seconds", 10), params.get("mode", "sampling"), params.get("format", "text"))
+                logger.info(f"Captured profile {artifact.filename}")
+                return {"jsonrpc": "2.0", "id": request_id, "result": artifact.to_result()}
+            elif method == "diagnostics/memory":
+                import diagnostics
+                artifact = diagnostics.memory(params.get("action", "snapshot"), params.get("limit", 25), params.get("frames", 1))
+                return {"jsonrpc": "2.0", "id": request_id, "result": artifact.to_result()}
+            elif method == "diagnostics/stacks":
+                import diagnostics
+                return {"jsonrpc": "2.0", "id": request_id, "result": diagnostics.stacks().to_result()}
             else:
                 raise ValueError(f"Unknown method: {method}")
+        except Overloaded:
+            raise
+        except PatchError as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": INVALID_PARAMS, "message": f"Request failed: {str(e)}"}
+            }
+        except PreconditionFailed as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": PRECONDITION_FAILED, "message": f"Request failed: {str(e)}", "data": {"current_hash": e.current_hash}}
+            }
+        except usage.QuotaExceeded as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": QUOTA_EXCEEDED, "message": f"Request failed: {str(e)}", "data": {"directory": e.directory}}
+            }
         except Exception as e:
             logger.error(f"Request handling error: {e}")
             return {
@@ -179,19 +1179,17 @@ class MCPServer:
             }
 
     async def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        if self.usage.quotas and tool_name not in READ_TOOLS:
+            await self._track_usage()
         if tool_name == "create_file":
             filename = arguments["filename"]
             content = arguments.get("content", "")
             if not self.validate_file_extension(filename):
                 raise ValueError(f"Invalid file extension for {filename}")
-            file_path = self.validate_path(filename)
-            lock_file = f"{file_path}.lock"
-            with FileLock(lock_file):
-                Path(file_path).parent.mkdir(parents=True, exist_ok=True)
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+            rel_path = self.index_key(self.validate_path(filename))
+            digest = await self._write_file(rel_path, content, "overwrite")
             logger.info(f"Created file: {filename}")
-            return {"content": [{"type": "text", "text": f"File '{filename}' created successfully"}]}
+            return {"content": [{"type": "text", "text": f"File '{filename}' created successfully"}], "sha256": digest}
 
         elif tool_name == "edit_file":
             filename = arguments["filename"]
@@ -200,45 +1198,39 @@ class MCPServer:
             use_ai = arguments.get("use_ai", True)
             if not self.validate_file_extension(filename):
                 raise ValueError(f"Invalid file extension for {filename}")
-            file_path = self.validate_path(filename)
-            lock_file = f"{file_path}.lock"
-            with FileLock(lock_file):
-                if not Path(file_path).exists():
-                    raise ValueError(f"File '{filename}' not found")
-                if use_ai and prompt:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        current_content = f.read()
-                    try:
-                        modified_content = await self.call_together_ai(prompt, current_content)
-                        if modified_content is None:
-                            raise ValueError("AI service unavailable")
-                        with open(file_path, 'w', encoding='utf-8') as f:
-                            f.write(modified_content)
-                        logger.info(f"AI-edited file: {filename}")
-                        return {
-                            "content": [{"type": "text", "text": f"File '{filename}' edited with AI assistance"}],
-                            "new_content": modified_content
-                        }
-                    except Exception as e:
-                        raise ValueError(f"AI edit failed: {str(e)}")
-                elif new_content is not None:
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(new_content)
-                    logger.info(f"Manually edited file: {filename}")
-                    return {"content": [{"type": "text", "text": f"File '{filename}' content updated"}]}
-                else:
-                    raise ValueError("Either 'prompt' or 'content' required")
+            rel_path = self.index_key(self.validate_path(filename))
+            if use_ai and prompt:
+                current_content, base_hash = await self._read_current(rel_path, filename)
+                # The AI call can take many seconds; the lock is not held across
+                # it; the write below only goes ahead if nobody changed the file.
+                try:
+                    modified_content, _ = await self._coalesced_ai_edit(base_hash, prompt, current_content)
+                except Exception as e:
+                    raise ValueError(f"AI edit failed: {str(e)}")
+                if modified_content is None:
+                    raise ValueError("AI edit failed: AI service unavailable")
+                digest = await self._apply_ai_edit(rel_path, filename, base_hash, modified_content)
+                logger.info(f"AI-edited file: {filename}")
+                return {
+                    "content": [{"type": "text", "text": f"File '{filename}' edited with AI assistance"}],
+                    "new_content": modified_content,
+                    "sha256": digest
+                }
+            elif new_content is not None:
+                digest = await self._write_file(rel_path, new_content, "edit", must_exist=True)
+                logger.info(f"Manually edited file: {filename}")
+                return {"content": [{"type": "text", "text": f"File '{filename}' content updated"}], "sha256": digest}
+            else:
+                raise ValueError("Either 'prompt' or 'content' required")
 
         elif tool_name == "delete_file":
             filename = arguments["filename"]
             if not self.validate_file_extension(filename):
                 raise ValueError(f"Invalid file extension for {filename}")
-            file_path = self.validate_path(filename)
-            lock_file = f"{file_path}.lock"
-            with FileLock(lock_file):
-                if not Path(file_path).exists():
-                    raise ValueError(f"File '{filename}' not found")
-                Path(file_path).unlink()
+            rel_path = self.index_key(self.validate_path(filename))
+            if not await self._locked(rel_path, lambda: self.storage.delete(rel_path)):
+                raise ValueError(f"File '{filename}' not found")
+            self._notify_change("deleted", rel_path)
             logger.info(f"Deleted file: {filename}")
             return {"content": [{"type": "text", "text": f"File '{filename}' deleted successfully"}]}
 
@@ -246,59 +1238,511 @@ class MCPServer:
             filename = arguments["filename"]
             if not self.validate_file_extension(filename):
                 raise ValueError(f"Invalid file extension for {filename}")
-            file_path = self.validate_path(filename)
-            lock_file = f"{file_path}.lock"
-            with FileLock(lock_file):
-                if not Path(file_path).exists():
+            rel_path = self.index_key(self.validate_path(filename))
+            offset, length = arguments.get("offset"), arguments.get("length")
+            if offset is not None or length is not None:
+                return await self._read_range(filename, rel_path, int(offset or 0), length)
+            try:
+                stored = await self._locked(rel_path, lambda: self.storage.read(rel_path))
+            except FileNotFoundError:
+                raise ValueError(f"File '{filename}' not found")
+            content = stored.data.decode('utf-8')
+            return {
+                "content": [{"type": "text", "text": content}],
+                "file_content": content,
+                "sha256": stored.sha256,
+                "stat": stored.stat._asdict()
+            }
+
+        elif tool_name == "patch_file":
+            filename = arguments["filename"]
+            operations = arguments.get("operations")
+            diff = arguments.get("diff")
+            base_hash = arguments.get("base_hash")
+            if not self.validate_file_extension(filename):
+                raise ValueError(f"Invalid file extension for {filename}")
+            if (operations is None) == (diff is None):
+                raise ValueError("Exactly one of 'operations' or 'diff' required")
+            rel_path = self.index_key(self.validate_path(filename))
+
+            def patch():
+                try:
+                    stored = self.storage.read(rel_path)
+                except FileNotFoundError:
                     raise ValueError(f"File '{filename}' not found")
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            return {"content": [{"type": "text", "text": content}], "file_content": content}
+                if base_hash and stored.sha256 != base_hash:
+                    raise PreconditionFailed(f"File '{filename}' has changed since the patched version", stored.sha256)
+                content = stored.data.decode('utf-8')
+                if operations is not None:
+                    content = apply_operations(content, operations)
+                else:
+                    content = apply_unified_diff(content, diff)
+                data = content.encode('utf-8')
+                with self.usage.reserve(rel_path, len(data)):
+                    return self.storage.write(rel_path, data, "edit")
+            digest, _ = await self._locked(rel_path, patch)
+            self._notify_change("modified", rel_path)
+            logger.info(f"Patched file: {filename}")
+            return {"content": [{"type": "text", "text": f"File '{filename}' patched"}], "sha256": digest}
 
         elif tool_name == "list_files":
             files = []
-            for root, dirs, filenames in os.walk(FILE_DIRECTORY):
-                for filename in filenames:
-                    if not self.validate_file_extension(filename):
-                        logger.warning(f"Skipped file due to invalid extension: {filename}")
-                        continue
-                    rel_path = os.path.relpath(os.path.join(root, filename), FILE_DIRECTORY)
-                    files.append(rel_path.replace('\\', '/'))
+            if not self._watching:
+                await self._reconcile()
+            for rel_path in self.storage.paths():
+                if not self.validate_file_extension(rel_path):
+                    logger.warning(f"Skipped file due to invalid extension: {rel_path.rsplit('/', 1)[-1]}")
+                    continue
+                files.append(rel_path)
             files_list = files if files else []
             return {
                 "content": [{"type": "text", "text": f"Files: {', '.join(files_list) if files_list else 'No files found'}"}],
                 "files": files_list
             }
+
+        elif tool_name == "tree":
+            path = arguments.get("path") or ""
+            depth = max(0, int(arguments.get("depth", 1)))
+            rel_dir = self.index_key(self.validate_path(path)) if path else ""
+            if rel_dir == ".":
+                rel_dir = ""
+            # Totals are kept current by change notifications, including those of
+            # the watcher; reconciling here would re-list the store on every call.
+            await self._track_usage()
+
+            def describe(rel_path: str):
+                if not self.validate_file_extension(rel_path):
+                    return None
+                st = self.storage.cached_stat(rel_path)
+                return {"mtime": st.mtime_ns / 1e9} if st is not None else {}
+            node = self.usage.listing(rel_dir, depth, describe)
+            if node is None:
+                raise ValueError(f"Directory '{path}' not found")
+            return {
+                "content": [{"type": "text", "text": f"Directory '{rel_dir or '/'}': {node['files']} files, {node['bytes']} bytes"}],
+                "tree": node
+            }
+
+        elif tool_name in ("copy_file", "move_file"):
+            source, destination = arguments["source"], arguments["destination"]
+            move = tool_name == "move_file"
+            digest, _ = await self._transfer(self._checked_path(source), self._checked_path(destination),
+                                             move, bool(arguments.get("overwrite", False)))
+            verb = "moved" if move else "copied"
+            logger.info(f"{verb.capitalize()} file: {source} -> {destination}")
+            return {"content": [{"type": "text", "text": f"File '{source}' {verb} to '{destination}'"}], "sha256": digest}
+
+        elif tool_name == "rename_file":
+            filename, new_name = arguments["filename"], arguments["new_name"]
+            if not new_name or '/' in new_name or '\\' in new_name:
+                raise ValueError(f"Invalid new name: {new_name}")
+            directory = filename.rpartition('/')[0]
+            destination = f"{directory}/{new_name}" if directory else new_name
+            digest, _ = await self._transfer(self._checked_path(filename), self._checked_path(destination), True, False)
+            logger.info(f"Renamed file: {filename} -> {new_name}")
+            return {"content": [{"type": "text", "text": f"File '{filename}' renamed to '{new_name}'"}],
+                    "filename": destination, "sha256": digest}
+
+        elif tool_name == "copy_directory":
+            source, destination = arguments["source"], arguments["destination"]
+            src_dir, dst_dir, pairs = await self._directory_pairs(source, destination)
+            self.usage.check_tree(src_dir, dst_dir)
+            results = await asyncio.gather(*(self._transfer(src, dst, False, False) for src, dst in pairs),
+                                           return_exceptions=True)
+            failed = [(dst, r) for (_, dst), r in zip(pairs, results) if isinstance(r, Exception)]
+            if failed:
+                raise ValueError(f"Copied {len(pairs) - len(failed)} of {len(pairs)} files; '{failed[0][0]}': {failed[0][1]}")
+            logger.info(f"Copied directory: {source} -> {destination} ({len(pairs)} files)")
+            return {
+                "content": [{"type": "text", "text": f"Directory '{source}' copied to '{destination}' ({len(pairs)} files)"}],
+                "files": [dst for _, dst in pairs]
+            }
+
+        elif tool_name == "move_directory":
+            source, destination = arguments["source"], arguments["destination"]
+            src_dir, dst_dir, pairs = await self._directory_pairs(source, destination)
+            if len(pairs) > MAX_DIRECTORY_MOVE_FILES:
+                raise ValueError(f"Directory '{source}' has {len(pairs)} files; at most {MAX_DIRECTORY_MOVE_FILES} can be moved at once")
+            sources = [src for src, _ in pairs]
+
+            def move_tree():
+                with self.usage.reserve_moves(pairs):
+                    self.storage.move_tree(src_dir, dst_dir, sources)
+            try:
+                # The destinations too, or a concurrent write there would be
+                # renamed over; the storage lock takes them in sorted order.
+                await self._locked_all(sources + [dst for _, dst in pairs], move_tree)
+            except FileExistsError as e:
+                raise ValueError(str(e))
+            for src, dst in pairs:
+                self._notify_change("created", dst)
+                self._notify_change("deleted", src)
+            logger.info(f"Moved directory: {source} -> {destination} ({len(pairs)} files)")
+            return {
+                "content": [{"type": "text", "text": f"Directory '{source}' moved to '{destination}' ({len(pairs)} files)"}],
+                "files": [dst for _, dst in pairs]
+            }
+
+        elif tool_name == "extract_archive":
+            name = arguments.get("archive_name") or ""
+            destination = arguments.get("destination") or ""
+            prefix = self.index_key(self.validate_path(destination)) + "/" if destination else ""
+            if prefix == "./":
+                prefix = ""
+            results, stop_error = await asyncio.to_thread(
+                self._extract, arguments["archive"], name, prefix, bool(arguments.get("overwrite", False))
+            )
+            counts: Dict[str, int] = {}
+            for result in results:
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+                ARCHIVE_ENTRIES.labels(result["status"]).inc()
+                if result["status"] in ("created", "modified"):
+                    self._notify_change(result["status"], result["path"])
+            summary = ', '.join(f"{count} {status}" for status, count in sorted(counts.items())) or "no files"
+            if stop_error:
+                summary += f"; stopped early: {stop_error}"
+            logger.info(f"Extracted archive {name or '(unnamed)'}: {summary}")
+            response = {"content": [{"type": "text", "text": f"Archive extracted: {summary}"}], "files": results}
+            if stop_error:
+                response["error"] = stop_error
+            return response
+
+        elif tool_name == "list_versions":
+            filename = arguments["filename"]
+            if not self.validate_file_extension(filename):
+                raise ValueError(f"Invalid file extension for {filename}")
+            versions = await self._io(self.storage.list_versions, self.index_key(self.validate_path(filename)))
+            summary = ', '.join(f"v{v['version']} ({v['reason']}, {v['size']} bytes)" for v in versions)
+            return {
+                "content": [{"type": "text", "text": f"Versions of '{filename}': {summary or 'none'}"}],
+                "versions": versions
+            }
+
+        elif tool_name == "read_version":
+            filename = arguments["filename"]
+            if not self.validate_file_extension(filename):
+                raise ValueError(f"Invalid file extension for {filename}")
+            data = await self._io(self.storage.read_version, self.index_key(self.validate_path(filename)), int(arguments["version"]))
+            content = data.decode('utf-8')
+            return {"content": [{"type": "text", "text": content}], "file_content": content}
+
+        elif tool_name == "restore_version":
+            filename = arguments["filename"]
+            version = int(arguments["version"])
+            if not self.validate_file_extension(filename):
+                raise ValueError(f"Invalid file extension for {filename}")
+            rel_path = self.index_key(self.validate_path(filename))
+
+            def restore():
+                sizes = {v["version"]: v["size"] for v in self.storage.list_versions(rel_path)}
+                if version not in sizes:
+                    return self.storage.restore_version(rel_path, version)  # raises
+                with self.usage.reserve(rel_path, sizes[version]):
+                    return self.storage.restore_version(rel_path, version)
+            existed = await self._locked(rel_path, restore)
+            self._notify_change("modified" if existed else "created", rel_path)
+            logger.info(f"Restored version {version} of file: {filename}")
+            return {"content": [{"type": "text", "text": f"File '{filename}' restored to version {version}"}]}
+
+        elif tool_name == "get_manifest":
+            prefix = arguments.get("prefix") or ""
+            await self._reconcile()
+            entries = await self._io(self.storage.manifest, prefix)
+            files = [
+                {"path": rel_path, "size": st.size, "mtime": st.mtime_ns / 1e9, "sha256": digest}
+                for rel_path, st, digest in entries if self.validate_file_extension(rel_path)
+            ]
+            return {"content": [{"type": "text", "text": f"{len(files)} files under '{prefix}'"}], "files": files}
+
+        elif tool_name == "get_block_signatures":
+            block_size = arguments.get("block_size")
+            results = []
+            for filename in arguments["filenames"]:
+                try:
+                    rel_path = self._checked_path(filename)
+                    stored = await self._locked(rel_path, lambda: self.storage.read(rel_path))
+                except FileNotFoundError:
+                    results.append({"filename": filename, "status": "missing"})
+                    continue
+                except ValueError as e:
+                    results.append({"filename": filename, "status": "error", "error": str(e)})
+                    continue
+                signatures = await asyncio.to_thread(block_delta.signatures, stored.data, block_size)
+                results.append({"filename": filename, "status": "ok", "sha256": stored.sha256, "signatures": signatures})
+            return {"content": [{"type": "text", "text": f"Signatures of {len(results)} files"}], "files": results}
+
+        elif tool_name == "pull_files":
+            results = await asyncio.gather(*(self._pull_file(entry) for entry in arguments["files"]))
+            return {"content": [{"type": "text", "text": f"Pulled {len(results)} files"}], "files": results}
+
+        elif tool_name == "push_files":
+            # Files are independent: one conflict does not stop the rest.
+            written = await asyncio.gather(*(self._push_file(entry) for entry in arguments.get("files") or []))
+            deleted = await asyncio.gather(*(self._push_delete(entry) for entry in arguments.get("delete") or []))
+            results = [*written, *deleted]
+            counts: Dict[str, int] = {}
+            for result in results:
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+            summary = ', '.join(f"{count} {status}" for status, count in sorted(counts.items()))
+            logger.info(f"Sync push: {summary or 'nothing'}")
+            return {"content": [{"type": "text", "text": f"Pushed: {summary or 'nothing'}"}], "files": results}
+
+        elif tool_name == "submit_ai_edit":
+            filename = arguments["filename"]
+            prompt = arguments["prompt"]
+            if not self.validate_file_extension(filename):
+                raise ValueError(f"Invalid file extension for {filename}")
+            rel_path = self.index_key(self.validate_path(filename))
+            client = current_client.get()
+            lane = self.admission.lanes["ai"]
+            import ai_jobs
+            if self.jobs.count(ai_jobs.QUEUED) >= AI_JOB_QUEUE:
+                raise self.admission.shed(Overloaded("The AI job queue is full", "ai", "queue_full", lane.retry_after()))
+            if self.jobs.count(ai_jobs.QUEUED, client) + self.jobs.count(ai_jobs.RUNNING, client) >= AI_JOBS_PER_CLIENT:
+                raise self.admission.shed(Overloaded("Too many unfinished AI jobs from this client", "ai", "client_limit", lane.retry_after()))
+            try:
+                lane.throttle(client)
+            except Overloaded as e:
+                raise self.admission.shed(e)
+            base_hash = await self._locked(rel_path, lambda: self.storage.digest(rel_path))
+            if base_hash is None:
+                raise ValueError(f"File '{filename}' not found")
+            job = self.jobs.submit(rel_path, prompt, TOGETHER_AI_MODEL, base_hash, client)
+            self._job_signal.set()
+            logger.info(f"Queued AI edit job {job['id']} for file: {filename}")
+            return {"content": [{"type": "text", "text": f"AI edit of '{filename}' queued as job {job['id']}"}], "job": self._job_view(job)}
+
+        elif tool_name == "get_ai_job":
+            job = self.jobs.get(arguments["job_id"])
+            if job is None:
+                raise ValueError(f"AI job '{arguments['job_id']}' not found")
+            return {"content": [{"type": "text", "text": f"AI job {job['id']} is {job['status']}"}], "job": self._job_view(job)}
+
+        elif tool_name == "cancel_ai_job":
+            job_id = arguments["job_id"]
+            if self.jobs.get(job_id) is None:
+                raise ValueError(f"AI job '{job_id}' not found")
+            import ai_jobs
+            if self.jobs.finish(job_id, ai_jobs.CANCELLED, error="Cancelled by request"):
+                task = self._job_tasks.get(job_id)
+                if task is not None:
+                    task.cancel()
+                logger.info(f"Cancelled AI job {job_id}")
+            job = self.jobs.get(job_id)
+            return {"content": [{"type": "text", "text": f"AI job {job_id} is {job['status']}"}], "job": self._job_view(job)}
         else:
             raise ValueError(f"Unknown tool: {tool_name}")
 
+    async def _process_line(self, line: str, client: str = "local") -> Optional[Dict[str, Any]]:
+        BYTES_RECEIVED.inc(len(line))
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON received: {e}")
+            return {
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {"code": -32700, "message": f"Parse error: {str(e)}"}
+            }
+        return await self.handle_request(request, client)
+
+    @staticmethod
+    def ready_notification(**params) -> str:
+        """Readiness signal written once the server can accept requests."""
+        return json.dumps({"jsonrpc": "2.0", "method": "notifications/ready", "params": {"pid": os.getpid(), **params}})
+
+    def save_snapshot(self):
+        try:
+            self.storage.save_state()
+        except OSError as e:
+            logger.error(f"Failed to save index snapshot: {e}")
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(INDEX_SNAPSHOT_INTERVAL)
+            await asyncio.to_thread(self.save_snapshot)
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(STORAGE_MAINTENANCE_INTERVAL)
+            try:
+                # Pruning edits version manifests, which local tool calls also
+                # do on this loop, so it stays off the thread pool for them.
+                await self._io(self.storage.maintain)
+                if self._jobs is not None:
+                    self._jobs.prune(AI_JOB_RETENTION_HOURS * 3600)
+                await asyncio.to_thread(self.storage.collect_garbage)
+            except Exception as e:
+                logger.error(f"Storage maintenance failed: {e}")
+
+    async def _watch_loop(self):
+        # Picks up files added, replaced or removed by other processes. Writes
+        # that keep the inode and leave the directory untouched are only
+        # seen once something else in that directory changes.
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            try:
+                await self._reconcile()
+            except Exception as e:
+                logger.error(f"Change watcher failed: {e}")
+
+    def _start_background_tasks(self) -> List[asyncio.Task]:
+        tasks = [asyncio.create_task(self._snapshot_loop()), asyncio.create_task(self._maintenance_loop())]
+        if self.watch_interval > 0:
+            tasks.append(asyncio.create_task(self._watch_loop()))
+            self._watching = True
+        tasks.extend(asyncio.create_task(self._ai_job_worker()) for _ in range(AI_CONCURRENCY))
+        if os.path.exists(self._jobs_path):
+            self._job_signal.set()  # pick up jobs queued before a restart
+        return tasks
+
+    def _stop_background_tasks(self, tasks: List[asyncio.Task]):
+        for task in [*tasks, *self._job_tasks.values()]:
+            task.cancel()
+        self._watching = False
+        self.save_snapshot()
+
+    def _install_shutdown_handler(self):
+        # The bridges stop us with SIGTERM; persist the index, then die by the
+        # same signal so the exit status is unchanged.
+        def on_term():
+            self.save_snapshot()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, on_term)
+        except (NotImplementedError, RuntimeError):
+            pass  # no loop signal handlers on Windows
+
     async def run(self):
         logger.info("Starting MCP Filesystem Server...")
+        self._install_shutdown_handler()
+        background = self._start_background_tasks()
+        print(self.ready_notification(transport="stdio"), flush=True)
+        self._stdio = True
+        # Requests are handled concurrently, as on socket connections, so a
+        # slow AI edit does not hold up the reads behind it.
+        slots = asyncio.Semaphore(MAX_INFLIGHT_PER_CONNECTION)
+        pending = set()
         try:
             while True:
                 line = await asyncio.get_event_loop().run_in_executor(None, sys.stdin.readline)
                 if not line:
                     break
-                try:
-                    request = json.loads(line.strip())
-                    response = await self.handle_request(request)
-                    print(json.dumps(response), flush=True)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Invalid JSON received: {e}")
-                    error_response = {
-                        "jsonrpc": "2.0",
-                        "id": None,
-                        "error": {"code": -32700, "message": f"Parse error: {str(e)}"}
-                    }
-                    print(json.dumps(error_response), flush=True)
+                await slots.acquire()
+                task = asyncio.create_task(self._serve_stdio_line(line, slots))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
         except KeyboardInterrupt:
             logger.info("Server stopping...")
         except Exception as e:
             logger.error(f"Server error: {e}")
+        finally:
+            self._stop_background_tasks(background)
+
+    async def _serve_stdio_line(self, line: str, slots: asyncio.Semaphore):
+        try:
+            response = await self._process_line(line, "stdio")
+            if response is not None:
+                data = json.dumps(response)
+                BYTES_SENT.inc(len(data) + 1)
+                print(data, flush=True)
+        finally:
+            slots.release()
+
+    async def serve(self, address: str):
+        server = await transport.start_server(self._handle_connection, address)
+        logger.info(f"Starting MCP Filesystem Server on {address}...")
+        self._install_shutdown_handler()
+        background = self._start_background_tasks()
+        # Supervisors can wait for this line instead of polling the socket.
+        print(self.ready_notification(transport="socket", address=address), flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._stop_background_tasks(background)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername") or "local"
+        logger.info(f"Client connected: {peer}")
+        CONNECTIONS.inc()
+        self._connections.add(writer)
+        # Requests on one connection run concurrently, but at most
+        # MAX_INFLIGHT_PER_CONNECTION at a time: once the window is full we stop
+        # reading, so a fast producer is throttled by TCP/socket flow control.
+        slots = asyncio.Semaphore(MAX_INFLIGHT_PER_CONNECTION)
+        write_lock = asyncio.Lock()
+        pending = set()
+        client = f"{peer}#{id(writer):x}"
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError) as e:
+                    logger.error(f"Oversized message from {peer}: {e}")
+                    break
+                if not line:
+                    break
+                await slots.acquire()
+                task = asyncio.create_task(self._serve_line(line.decode("utf-8"), client, writer, write_lock, slots))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            CONNECTIONS.dec()
+            logger.info(f"Client disconnected: {peer}")
+
+    async def _serve_line(self, line: str, client: str, writer: asyncio.StreamWriter, write_lock: asyncio.Lock, slots: asyncio.Semaphore):
+        try:
+            response = await self._process_line(line, client)
+            if response is None or writer.is_closing():
+                return
+            data = (json.dumps(response) + "\n").encode("utf-8")
+            BYTES_SENT.inc(len(data))
+            async with write_lock:
+                writer.write(data)
+                # drain() blocks while the client isn't reading, which holds the
+                # slot and eventually pauses reading from this connection.
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            slots.release()
 
 async def main():
+    parser = argparse.ArgumentParser(description="MCP Filesystem Server")
+    parser.add_argument(
+        "--listen",
+        default=MCP_LISTEN_ADDRESS,
+        help="Serve many clients on a socket instead of stdio, e.g. unix:/tmp/mcp.sock or tcp://127.0.0.1:8765"
+    )
+    args = parser.parse_args()
     server = MCPServer()
-    await server.run()
+    if args.listen:
+        await server.serve(args.listen)
+    else:
+        await server.run()
+
+def cli():
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Server stopped")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    cli()
@@ -0,0 +1,253 @@
+# server/metrics.py
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets (seconds) spanning in-memory hits through long AI calls.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple = ()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric"):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {metric.name: metric.snapshot() for metric in list(self._metrics)}
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self.labels()  # unlabelled metrics are exported as 0 from the start
+        registry.register(self)
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        return sorted(self._children.items())
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"
+            for key, child in self._items()
+        ]
+
+    def snapshot(self) -> Dict:
+        return {
+            "type": self.type,
+            "values": [{"labels": dict(zip(self.labelnames, key)), "value": child.get()} for key, child in self._items()]
+        }
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ("_function",)
+
+    def __init__(self):
+        super().__init__()
+        self._function: Optional[Callable[[], float]] = None
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Evaluate ``function`` at scrape time instead of tracking a value."""
+        self._function = function
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+    def get(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return math.nan
+        return self._value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+    def track_inprogress(self):
+        return self.labels().track_inprogress()
+
+
+class _HistogramChild:
+    __slots__ = ("_upper_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self._upper_bounds = upper_bounds
+        self._counts = [0] * len(upper_bounds)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def get(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative, buckets = 0, []
+        for bound, count in zip(self._upper_bounds, counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return {"buckets": buckets, "count": cumulative, "sum": total}
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        self._upper_bounds = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self._upper_bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in self._items():
+            data = child.get()
+            for bound, count in data["buckets"]:
+                labels = _format_labels(self.labelnames, key, (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(data['sum'])}")
+            lines.append(f"{self.name}_count{labels} {data['count']}")
+        return lines
+
+    def snapshot(self) -> Dict:
+        values = []
+        for key, child in self._items():
+            data = child.get()
+            data["buckets"] = [[_format_value(bound), count] for bound, count in data["buckets"]]
+            values.append({"labels": dict(zip(self.labelnames, key)), "value": data})
+        return {"type": self.type, "values": values}
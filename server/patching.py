@@ -0,0 +1,100 @@
+# server/patching.py
+
+import re
+from typing import Any, Dict, List
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    """The patch is malformed or does not apply to the content."""
+
+
+class PreconditionFailed(ValueError):
+    """The file no longer has the content the change was based on."""
+
+    def __init__(self, message: str, current_hash: str):
+        super().__init__(message)
+        self.current_hash = current_hash
+
+
+def apply_operations(text: str, operations: List[Dict[str, Any]]) -> str:
+    """Apply ``{"offset", "delete", "insert"}`` edits to ``text``.
+
+    Offsets and delete counts are in characters (code points) of the original
+    text; operations must be sorted by offset and must not overlap.
+    """
+    pieces = []
+    position = 0
+    for op in operations:
+        offset = int(op.get("offset", 0))
+        delete = int(op.get("delete", 0))
+        insert = op.get("insert", "")
+        if offset < position or delete < 0 or offset + delete > len(text):
+            raise PatchError(f"Operation at offset {offset} is out of order or out of range")
+        if not isinstance(insert, str):
+            raise PatchError("Operation 'insert' must be a string")
+        pieces.append(text[position:offset])
+        pieces.append(insert)
+        position = offset + delete
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+def _strip_newline(line: str) -> str:
+    if line.endswith("\r\n"):
+        return line[:-2]
+    return line[:-1] if line.endswith("\n") else line
+
+
+def apply_unified_diff(text: str, diff: str) -> str:
+    """Apply a single-file unified diff (as produced by ``diff -u``/``git diff``)."""
+    lines = text.splitlines(keepends=True)
+    diff_lines = diff.splitlines(keepends=True)
+    out: List[str] = []
+    position = 0
+    hunks = 0
+    i = 0
+    while i < len(diff_lines):
+        header = _HUNK_HEADER.match(diff_lines[i])
+        i += 1
+        if not header:
+            continue  # file headers and anything between hunks
+        hunks += 1
+        old_start, old_count = int(header.group(1)), int(header.group(2) or 1)
+        new_count = int(header.group(4) or 1)
+        start = old_start - 1 if old_count else old_start
+        if start < position or start > len(lines):
+            raise PatchError(f"Hunk {hunks} starts at line {old_start}, outside the file or before the previous hunk")
+        out.extend(lines[position:start])
+        position = start
+        last_tag = None
+        while old_count > 0 or new_count > 0 or (i < len(diff_lines) and diff_lines[i].startswith("\\")):
+            if i >= len(diff_lines):
+                raise PatchError(f"Hunk {hunks} is truncated")
+            line = diff_lines[i]
+            i += 1
+            if line.startswith("\\"):
+                # "\ No newline at end of file" refers to the previous line.
+                if last_tag == "+":
+                    out[-1] = _strip_newline(out[-1])
+                continue
+            tag, body = (" ", line) if line in ("\n", "\r\n") else (line[:1], line[1:])
+            if tag in (" ", "-"):
+                if position >= len(lines) or _strip_newline(lines[position]) != _strip_newline(body):
+                    raise PatchError(f"Hunk {hunks} does not apply at line {position + 1}")
+                if tag == " ":
+                    out.append(lines[position])
+                    new_count -= 1
+                position += 1
+                old_count -= 1
+            elif tag == "+":
+                out.append(body)
+                new_count -= 1
+            else:
+                raise PatchError(f"Unexpected line in hunk {hunks}: {line.rstrip()!r}")
+            last_tag = tag
+    if not hunks:
+        raise PatchError("Diff contains no hunks")
+    out.extend(lines[position:])
+    return "".join(out)
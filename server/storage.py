@@ -0,0 +1,753 @@
+# server/storage.py
+"""Storage backends behind the MCP server's file tools.
+
+Tools address stored files by '/'-separated relative path and go through a
+``StorageBackend``: ``LocalStorage`` keeps them under a directory (with the
+file index, version history and optional blob store), ``S3Storage`` keeps
+them in an S3-compatible bucket that several servers can share. boto3 is only
+needed for the latter.
+"""
+
+import errno
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from blob_store import BlobStore
+from file_index import FileIndex
+from metrics import Counter, Histogram
+from versions import VersionStore
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+S3_REQUESTS = Counter('mcp_server_s3_requests_total', 'S3 API requests made by the storage backend, by operation', ['operation'])
+S3_DURATION = Histogram('mcp_server_s3_request_duration_seconds', 'S3 API request latency, by operation', ['operation'])
+FILE_COPIES = Counter('mcp_server_file_copies_total', 'Server-side file copies, by how the data was copied', ['method'])
+
+# ioctl(dest_fd, FICLONE, src_fd) shares the source's extents (linux/fs.h).
+FICLONE = 0x40049409
+# Errors meaning "this file system cannot do that", as opposed to real I/O errors.
+_NO_FAST_COPY = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EOPNOTSUPP, errno.EBADF, errno.EPERM}
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def clone_file(src_path: str, dst_path: str) -> str:
+    """Copy a file without its content passing through this process; returns the method used.
+
+    A reflink (btrfs, XFS, ...) shares the data blocks until either side is
+    rewritten. Otherwise ``copy_file_range`` copies inside the kernel, or on
+    the server for NFS. Plain reads and writes are the last resort.
+    """
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return "reflink"
+            except OSError as e:
+                if e.errno not in _NO_FAST_COPY:
+                    raise
+        if hasattr(os, 'copy_file_range'):
+            remaining = os.fstat(src.fileno()).st_size
+            try:
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), min(remaining, 1 << 30))
+                    if not copied:
+                        break
+                    remaining -= copied
+                return "copy_file_range"
+            except OSError as e:
+                if e.errno not in _NO_FAST_COPY:
+                    raise
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        return "userspace"
+
+
+class FileStat(NamedTuple):
+    size: int
+    mtime_ns: int
+    # Identifies this revision of the file: the inode locally (stored files
+    # are replaced, never rewritten), a number derived from the ETag on S3.
+    inode: int
+
+
+class StoredFile(NamedTuple):
+    data: bytes
+    stat: FileStat
+    sha256: str
+
+
+class StorageBackend:
+    """Operations the tools need; paths are relative and already validated.
+
+    Methods block. Callers serialize changes to one path with ``lock`` and,
+    for ``remote`` backends, call them off the event loop.
+    """
+
+    name = ""
+    remote = False
+
+    def lock(self, *rel_paths: str):
+        """Hold the locks of all ``rel_paths``, taken in a fixed order so multi-path callers cannot deadlock."""
+        raise NotImplementedError
+
+    def stat(self, rel_path: str) -> Optional[FileStat]:
+        raise NotImplementedError
+
+    def cached_stat(self, rel_path: str) -> Optional[FileStat]:
+        """Last known stat without touching storage, for change notifications."""
+        raise NotImplementedError
+
+    def read(self, rel_path: str) -> StoredFile:
+        """Content, stat and sha256; raises FileNotFoundError."""
+        raise NotImplementedError
+
+    def read_range(self, rel_path: str, offset: int, length: int) -> bytes:
+        raise NotImplementedError
+
+    def digest(self, rel_path: str) -> Optional[str]:
+        """sha256 of the content, or None if the file does not exist."""
+        raise NotImplementedError
+
+    def write(self, rel_path: str, data: bytes, reason: str) -> Tuple[str, bool]:
+        """Replace the content, keeping the old one as a version; returns (sha256, existed)."""
+        raise NotImplementedError
+
+    def delete(self, rel_path: str) -> bool:
+        raise NotImplementedError
+
+    def copy(self, src: str, dst: str) -> Tuple[str, bool]:
+        """Copy ``src`` over ``dst`` without reading it here; returns (sha256, dst existed).
+
+        Raises FileNotFoundError if ``src`` does not exist.
+        """
+        raise NotImplementedError
+
+    def move(self, src: str, dst: str) -> Tuple[str, bool]:
+        """Like ``copy``, but ``src`` goes away and its version history moves along."""
+        raise NotImplementedError
+
+    def move_tree(self, src_dir: str, dst_dir: str, rel_paths: List[str]):
+        """Move the files ``rel_paths`` under ``src_dir`` to the same places under ``dst_dir``."""
+        for rel_path in rel_paths:
+            self.move(rel_path, dst_dir + rel_path[len(src_dir):])
+
+    def changes(self) -> List[Tuple[str, str]]:
+        """``(kind, rel_path)`` changes made since the last call, by anyone."""
+        raise NotImplementedError
+
+    def paths(self) -> List[str]:
+        raise NotImplementedError
+
+    def manifest(self, prefix: str = "") -> List[Tuple[str, FileStat, str]]:
+        """``(rel_path, stat, sha256)`` of known files under ``prefix``, from cached digests where valid."""
+        raise NotImplementedError
+
+    def list_versions(self, rel_path: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def read_version(self, rel_path: str, version: int) -> bytes:
+        raise NotImplementedError
+
+    def restore_version(self, rel_path: str, version: int) -> bool:
+        """Make a version current again; returns whether the file existed."""
+        raise NotImplementedError
+
+    def maintain(self):
+        """Apply version retention."""
+
+    def collect_garbage(self):
+        pass
+
+    def save_state(self):
+        pass
+
+
+class LocalStorage(StorageBackend):
+    """Files under a local directory."""
+
+    name = "local"
+
+    def __init__(self, root: str, index: FileIndex, versions: VersionStore, blobs: Optional[BlobStore] = None,
+                 lock_dir: Optional[str] = None):
+        self.root = os.path.realpath(root)
+        self.index = index
+        self.versions = versions
+        self.blobs = blobs
+        # Lock files go here, keyed by path, rather than next to each file:
+        # locking a path then never creates its directory.
+        self.lock_dir = lock_dir
+
+    def _abs(self, rel_path: str) -> str:
+        return os.path.join(self.root, *rel_path.split("/"))
+
+    def _capture(self, rel_path: str, file_path: str, reason: str) -> bool:
+        """Keep the file's current content as a version; False if there is no file."""
+        blob = None
+        if self.blobs is not None:
+            try:
+                blob = self.blobs.put_file(file_path, self.index.digest(rel_path))
+            except FileNotFoundError:
+                return False
+        return self.versions.capture(rel_path, file_path, reason, blob) is not None
+
+    def _lock_path(self, rel_path: str) -> str:
+        if self.lock_dir is None:
+            return f"{self._abs(rel_path)}.lock"
+        key = hashlib.sha256(rel_path.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.lock_dir, key[:2], f"{key}.lock")
+
+    @contextmanager
+    def lock(self, *rel_paths: str):
+        from filelock import FileLock
+        with ExitStack() as stack:
+            for rel_path in sorted(set(rel_paths)):
+                stack.enter_context(FileLock(self._lock_path(rel_path)))
+            yield
+
+    def stat(self, rel_path: str) -> Optional[FileStat]:
+        try:
+            st = os.stat(self._abs(rel_path))
+        except FileNotFoundError:
+            return None
+        return FileStat(st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def cached_stat(self, rel_path: str) -> Optional[FileStat]:
+        entry = self.index.get(rel_path)
+        return FileStat(entry.size, entry.mtime_ns, entry.inode) if entry is not None else None
+
+    def read(self, rel_path: str) -> StoredFile:
+        with open(self._abs(rel_path), 'rb') as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        return StoredFile(data, FileStat(st.st_size, st.st_mtime_ns, st.st_ino), self.index.digest(rel_path))
+
+    def read_range(self, rel_path: str, offset: int, length: int) -> bytes:
+        with open(self._abs(rel_path), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def digest(self, rel_path: str) -> Optional[str]:
+        try:
+            return self.index.digest(rel_path)
+        except FileNotFoundError:
+            return None
+
+    def write(self, rel_path: str, data: bytes, reason: str) -> Tuple[str, bool]:
+        # Writes always replace the inode instead of modifying it, so the old
+        # inode can be kept as a version (and blobs stay immutable).
+        file_path = self._abs(rel_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        existed = self._capture(rel_path, file_path, reason)
+        if self.blobs is not None:
+            digest = self.blobs.store(data, file_path)
+        else:
+            digest = hashlib.sha256(data).hexdigest()
+            if existed and os.stat(file_path).st_nlink > 1:
+                # Still linked to a version; never write through it.
+                os.unlink(file_path)
+            with open(file_path, 'wb') as f:
+                f.write(data)
+        self.index.update(rel_path, bytes.fromhex(digest))
+        return digest, existed
+
+    def delete(self, rel_path: str) -> bool:
+        file_path = self._abs(rel_path)
+        if not self._capture(rel_path, file_path, "delete"):
+            return False
+        os.unlink(file_path)
+        self.index.remove(rel_path)
+        return True
+
+    def copy(self, src: str, dst: str) -> Tuple[str, bool]:
+        digest = self.index.digest(src)
+        dst_path = self._abs(dst)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        existed = self._capture(dst, dst_path, "copy")
+        if self.blobs is not None:
+            # The copy is one more link to the blob the source links to.
+            blob = self.blobs.put_file(self._abs(src), digest)
+            FILE_COPIES.labels(self.blobs.link(blob, dst_path)).inc()
+        else:
+            tmp_path = os.path.join(os.path.dirname(dst_path), f".{os.path.basename(dst_path)}.{uuid.uuid4().hex}.tmp")
+            try:
+                FILE_COPIES.labels(clone_file(self._abs(src), tmp_path)).inc()
+                os.replace(tmp_path, dst_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+        self.index.update(dst, bytes.fromhex(digest))
+        return digest, existed
+
+    def move(self, src: str, dst: str) -> Tuple[str, bool]:
+        src_path, dst_path = self._abs(src), self._abs(dst)
+        digest = self.index.digest(src)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        existed = self._capture(dst, dst_path, "move")
+        if existed and os.path.samefile(src_path, dst_path):
+            # Both names are one inode (linked outside the server); rename() would do nothing.
+            os.unlink(src_path)
+        else:
+            os.replace(src_path, dst_path)
+        self.versions.move(src, dst)
+        self.index.move(src, dst)
+        return digest, existed
+
+    def move_tree(self, src_dir: str, dst_dir: str, rel_paths: List[str]):
+        src_path, dst_path = self._abs(src_dir), self._abs(dst_dir)
+        targets = [dst_dir + rel_path[len(src_dir):] for rel_path in rel_paths]
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        try:
+            # One rename moves the whole directory, however many files it holds.
+            os.rename(src_path, dst_path)
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+            # The destination directory exists and is not empty: merge into it.
+            for target in targets:
+                if os.path.exists(self._abs(target)):
+                    raise FileExistsError(f"File '{target}' already exists")
+            for rel_path, target in zip(rel_paths, targets):
+                os.makedirs(os.path.dirname(self._abs(target)), exist_ok=True)
+                os.rename(self._abs(rel_path), self._abs(target))
+        for rel_path, target in zip(rel_paths, targets):
+            self.versions.move(rel_path, target)
+            self.index.move(rel_path, target)
+
+    def changes(self) -> List[Tuple[str, str]]:
+        return self.index.reconcile()
+
+    def paths(self) -> List[str]:
+        return self.index.paths()
+
+    def manifest(self, prefix: str = "") -> List[Tuple[str, FileStat, str]]:
+        entries = []
+        for rel_path in self.index.paths():
+            if not rel_path.startswith(prefix):
+                continue
+            digest = self.digest(rel_path)  # a stat, plus hashing only if the file changed
+            st = self.cached_stat(rel_path)
+            if digest is not None and st is not None:
+                entries.append((rel_path, st, digest))
+        return entries
+
+    def list_versions(self, rel_path: str) -> List[Dict[str, Any]]:
+        return self.versions.list(rel_path)
+
+    def read_version(self, rel_path: str, version: int) -> bytes:
+        with open(self.versions.path(rel_path, version), 'rb') as f:
+            return f.read()
+
+    def restore_version(self, rel_path: str, version: int) -> bool:
+        version_path = self.versions.path(rel_path, version)
+        file_path = self._abs(rel_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(file_path), f".{os.path.basename(file_path)}.restore.tmp")
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        # Link the old inode (in cas mode, its blob) back into place: no
+        # content is copied.
+        os.link(version_path, tmp_path)
+        existed = self._capture(rel_path, file_path, "restore")
+        os.replace(tmp_path, file_path)
+        self.index.update(rel_path)
+        return existed
+
+    def maintain(self):
+        self.versions.prune_all()
+
+    def collect_garbage(self):
+        if self.blobs is not None:
+            self.blobs.collect_garbage()
+
+    def save_state(self):
+        if self.index.dirty:
+            self.index.save()
+
+
+class S3Storage(StorageBackend):
+    """Files as objects in an S3-compatible bucket, under ``<prefix>files/``.
+
+    Large writes go up as multipart uploads, large reads come down as parallel
+    ranged GETs, and one pooled, thread-safe client serves every call. Each
+    object carries its sha256 as user metadata. Versions are server-side
+    copies under ``<prefix>versions/`` with a JSON manifest per file, so
+    recording and restoring one moves no data through this process.
+
+    Locks only serialize writers within this process; servers sharing a bucket
+    rely on ``base_hash`` preconditions, which are checked and then written
+    without a cross-node lock.
+    """
+
+    name = "s3"
+    remote = True
+    LOCK_STRIPES = 64
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 max_pool_connections: int = 32, multipart_threshold: int = 8 * 1024 * 1024,
+                 max_versions: int = 20, max_version_age_seconds: Optional[float] = None, client=None):
+        # boto3 takes longer to import than the rest of the server; only this backend pays for it.
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("The s3 storage backend needs the boto3 package (pip install boto3)")
+        self.ClientError = ClientError
+        if client is None:
+            client = boto3.client(
+                's3', endpoint_url=endpoint_url, region_name=region,
+                config=Config(max_pool_connections=max_pool_connections, retries={'max_attempts': 5, 'mode': 'standard'})
+            )
+        self.client = client
+        self.bucket = bucket
+        self.files_prefix = f"{prefix}files/"
+        self.versions_prefix = f"{prefix}versions/"
+        self.multipart_threshold = multipart_threshold
+        self.transfer_workers = min(10, max_pool_connections)
+        self.transfer = TransferConfig(
+            multipart_threshold=multipart_threshold, multipart_chunksize=multipart_threshold,
+            max_concurrency=self.transfer_workers
+        )
+        self.max_versions = max_versions
+        self.max_version_age_seconds = max_version_age_seconds
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        # Last listing (kept current by our own writes) and digests by revision.
+        self._listing: Dict[str, FileStat] = {}
+        self._listed = False
+        self._digests: Dict[str, Tuple[int, str]] = {}
+        self._state_lock = threading.Lock()
+
+    def _key(self, rel_path: str) -> str:
+        return self.files_prefix + rel_path
+
+    def _call(self, operation: str, **kwargs):
+        S3_REQUESTS.labels(operation).inc()
+        start = time.perf_counter()
+        try:
+            return getattr(self.client, operation)(Bucket=self.bucket, **kwargs)
+        finally:
+            S3_DURATION.labels(operation).observe(time.perf_counter() - start)
+
+    @staticmethod
+    def _missing(error: Exception) -> bool:
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    @staticmethod
+    def _stat(size: int, last_modified, etag: str) -> FileStat:
+        # A multipart ETag is "<md5 of part md5s>-<parts>"; either way the hex
+        # part changes with the content.
+        revision = int(etag.strip('"').split('-')[0][:15] or '0', 16)
+        return FileStat(size, int(last_modified.timestamp()) * 1_000_000_000, revision)
+
+    @contextmanager
+    def lock(self, *rel_paths: str):
+        with ExitStack() as stack:
+            for stripe in sorted({hash(rel_path) % self.LOCK_STRIPES for rel_path in rel_paths}):
+                stack.enter_context(self._locks[stripe])
+            yield
+
+    def _head(self, rel_path: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._call('head_object', Key=self._key(rel_path))
+        except self.ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+
+    def stat(self, rel_path: str) -> Optional[FileStat]:
+        head = self._head(rel_path)
+        return self._stat(head['ContentLength'], head['LastModified'], head['ETag']) if head else None
+
+    def cached_stat(self, rel_path: str) -> Optional[FileStat]:
+        return self._listing.get(rel_path)
+
+    def _remember(self, rel_path: str, st: FileStat, digest: Optional[str]):
+        with self._state_lock:
+            self._listing[rel_path] = st
+            if digest:
+                self._digests[rel_path] = (st.inode, digest)
+
+    def _forget(self, rel_path: str):
+        with self._state_lock:
+            self._listing.pop(rel_path, None)
+            self._digests.pop(rel_path, None)
+
+    def read(self, rel_path: str) -> StoredFile:
+        head = self._head(rel_path)
+        if head is None:
+            raise FileNotFoundError(rel_path)
+        st = self._stat(head['ContentLength'], head['LastModified'], head['ETag'])
+        if st.size >= self.multipart_threshold:
+            buffer = io.BytesIO()
+            S3_REQUESTS.labels('download_fileobj').inc()
+            # s3transfer pins the parts to one revision itself, but that may be
+            # newer than the one just looked at: then look again.
+            self.client.download_fileobj(self.bucket, self._key(rel_path), buffer, Config=self.transfer)
+            data = buffer.getvalue()
+            expected = head.get('Metadata', {}).get('sha256')
+            if len(data) != st.size or (expected and hashlib.sha256(data).hexdigest() != expected):
+                return self.read(rel_path)
+        else:
+            try:
+                response = self._call('get_object', Key=self._key(rel_path), IfMatch=head['ETag'])
+            except self.ClientError as e:
+                if self._missing(e):
+                    raise FileNotFoundError(rel_path)
+                raise
+            data = response['Body'].read()
+        digest = head.get('Metadata', {}).get('sha256') or hashlib.sha256(data).hexdigest()
+        self._remember(rel_path, st, digest)
+        return StoredFile(data, st, digest)
+
+    def read_range(self, rel_path: str, offset: int, length: int) -> bytes:
+        if length <= 0:
+            return b""
+        try:
+            response = self._call('get_object', Key=self._key(rel_path), Range=f"bytes={offset}-{offset + length - 1}")
+        except self.ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(rel_path)
+            if e.response.get('Error', {}).get('Code') == 'InvalidRange':
+                return b""
+            raise
+        return response['Body'].read()
+
+    def digest(self, rel_path: str) -> Optional[str]:
+        head = self._head(rel_path)
+        if head is None:
+            return None
+        st = self._stat(head['ContentLength'], head['LastModified'], head['ETag'])
+        digest = head.get('Metadata', {}).get('sha256')
+        if digest is None:
+            # Written by something other than this backend: hash it once per revision.
+            cached = self._digests.get(rel_path)
+            if cached and cached[0] == st.inode:
+                return cached[1]
+            return self.read(rel_path).sha256
+        self._remember(rel_path, st, digest)
+        return digest
+
+    def write(self, rel_path: str, data: bytes, reason: str) -> Tuple[str, bool]:
+        existed = self._capture(rel_path, reason) is not None
+        digest = hashlib.sha256(data).hexdigest()
+        extra = {'Metadata': {'sha256': digest}}
+        if len(data) >= self.multipart_threshold:
+            S3_REQUESTS.labels('upload_fileobj').inc()
+            self.client.upload_fileobj(io.BytesIO(data), self.bucket, self._key(rel_path), ExtraArgs=extra, Config=self.transfer)
+            st = self.stat(rel_path)
+        else:
+            response = self._call('put_object', Key=self._key(rel_path), Body=data, **extra)
+            st = self._stat(len(data), datetime.now(timezone.utc), response['ETag'])
+        self._remember(rel_path, st, digest)
+        return digest, existed
+
+    def delete(self, rel_path: str) -> bool:
+        if self._capture(rel_path, "delete") is None:
+            return False
+        self._call('delete_object', Key=self._key(rel_path))
+        self._forget(rel_path)
+        return True
+
+    def copy(self, src: str, dst: str, reason: str = "copy") -> Tuple[str, bool]:
+        head = self._head(src)
+        if head is None:
+            raise FileNotFoundError(src)
+        digest = head.get('Metadata', {}).get('sha256') or self.digest(src)
+        existed = self._capture(dst, reason) is not None
+        S3_REQUESTS.labels('copy').inc()
+        FILE_COPIES.labels("s3_copy").inc()
+        # Server-side; objects above the multipart threshold are copied as parallel parts.
+        self.client.copy({'Bucket': self.bucket, 'Key': self._key(src)}, self.bucket, self._key(dst),
+                         ExtraArgs={'CopySourceIfMatch': head['ETag'], 'Metadata': {'sha256': digest},
+                                    'MetadataDirective': 'REPLACE'},
+                         Config=self.transfer)
+        self._remember(dst, self.stat(dst), digest)
+        return digest, existed
+
+    def move(self, src: str, dst: str) -> Tuple[str, bool]:
+        # S3 has no rename: copy, then delete the source.
+        digest, existed = self.copy(src, dst, "move")
+        self._call('delete_object', Key=self._key(src))
+        self._forget(src)
+        self._move_versions(src, dst)
+        return digest, existed
+
+    def move_tree(self, src_dir: str, dst_dir: str, rel_paths: List[str]):
+        if not rel_paths:
+            return
+        with ThreadPoolExecutor(max_workers=min(len(rel_paths), self.transfer_workers)) as pool:
+            list(pool.map(lambda rel_path: self.move(rel_path, dst_dir + rel_path[len(src_dir):]), rel_paths))
+
+    def _list(self) -> Dict[str, FileStat]:
+        listing = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.files_prefix):
+            S3_REQUESTS.labels('list_objects_v2').inc()
+            for obj in page.get('Contents', ()):
+                rel_path = obj['Key'][len(self.files_prefix):]
+                if rel_path and not rel_path.endswith('/'):
+                    listing[rel_path] = self._stat(obj['Size'], obj['LastModified'], obj['ETag'])
+        return listing
+
+    def changes(self) -> List[Tuple[str, str]]:
+        listing = self._list()
+        changes: List[Tuple[str, str]] = []
+        with self._state_lock:
+            if self._listed:
+                for rel_path, st in listing.items():
+                    previous = self._listing.get(rel_path)
+                    if previous is None:
+                        changes.append(("created", rel_path))
+                    elif (previous.size, previous.inode) != (st.size, st.inode):
+                        changes.append(("modified", rel_path))
+                changes.extend(("deleted", rel_path) for rel_path in self._listing if rel_path not in listing)
+            # The first listing only establishes what exists.
+            self._listing, self._listed = listing, True
+        return changes
+
+    def paths(self) -> List[str]:
+        if not self._listed:
+            self.changes()
+        return sorted(self._listing)
+
+    def manifest(self, prefix: str = "") -> List[Tuple[str, FileStat, str]]:
+        if not self._listed:
+            self.changes()
+        listing = sorted((rel_path, st) for rel_path, st in self._listing.items() if rel_path.startswith(prefix))
+        digests = {}
+        for rel_path, st in listing:
+            cached = self._digests.get(rel_path)
+            if cached and cached[0] == st.inode:
+                digests[rel_path] = cached[1]
+        misses = [rel_path for rel_path, _ in listing if rel_path not in digests]
+        if misses:
+            # One HEAD per file not seen since it last changed, in parallel.
+            with ThreadPoolExecutor(max_workers=min(len(misses), self.transfer_workers)) as pool:
+                digests.update(zip(misses, pool.map(self.digest, misses)))
+        return [(rel_path, st, digests[rel_path]) for rel_path, st in listing if digests.get(rel_path)]
+
+    # -- versions -------------------------------------------------------------
+
+    def _version_dir(self, rel_path: str) -> str:
+        return self.versions_prefix + hashlib.sha256(rel_path.encode('utf-8')).hexdigest()[:32] + "/"
+
+    def _load_manifest(self, rel_path: str) -> Dict[str, Any]:
+        try:
+            response = self._call('get_object', Key=self._version_dir(rel_path) + "versions.json")
+        except self.ClientError as e:
+            if self._missing(e):
+                return {"filename": rel_path, "next": 1, "versions": []}
+            raise
+        return json.loads(response['Body'].read())
+
+    def _save_manifest(self, rel_path: str, manifest: Dict[str, Any]):
+        if not manifest["versions"]:
+            self._call('delete_object', Key=self._version_dir(rel_path) + "versions.json")
+            return
+        self._call('put_object', Key=self._version_dir(rel_path) + "versions.json",
+                   Body=json.dumps(manifest).encode('utf-8'), ContentType='application/json')
+
+    def _capture(self, rel_path: str, reason: str, prune: bool = True) -> Optional[int]:
+        head = self._head(rel_path)
+        if head is None:
+            return None
+        manifest = self._load_manifest(rel_path)
+        version = manifest["next"]
+        S3_REQUESTS.labels('copy').inc()
+        self.client.copy({'Bucket': self.bucket, 'Key': self._key(rel_path)}, self.bucket,
+                         self._version_dir(rel_path) + str(version), Config=self.transfer)
+        manifest["next"] = version + 1
+        manifest["versions"].append({"version": version, "created": time.time(), "size": head['ContentLength'], "reason": reason})
+        if prune:
+            self._prune(rel_path, manifest)
+        self._save_manifest(rel_path, manifest)
+        return version
+
+    def _prune(self, rel_path: str, manifest: Dict[str, Any]) -> bool:
+        versions = manifest["versions"]
+        keep = versions[-self.max_versions:] if self.max_versions > 0 else []
+        if self.max_version_age_seconds is not None:
+            cutoff = time.time() - self.max_version_age_seconds
+            keep = [v for v in keep if v["created"] >= cutoff]
+        if len(keep) == len(versions):
+            return False
+        kept = {v["version"] for v in keep}
+        dropped = [{'Key': self._version_dir(rel_path) + str(v["version"])} for v in versions if v["version"] not in kept]
+        self._call('delete_objects', Delete={'Objects': dropped, 'Quiet': True})
+        manifest["versions"] = keep
+        return True
+
+    def _move_versions(self, src: str, dst: str):
+        source = self._load_manifest(src)
+        if not source["versions"]:
+            return
+        manifest = self._load_manifest(dst)
+        for entry in source["versions"]:
+            version = manifest["next"]
+            S3_REQUESTS.labels('copy').inc()
+            self.client.copy({'Bucket': self.bucket, 'Key': self._version_dir(src) + str(entry["version"])}, self.bucket,
+                             self._version_dir(dst) + str(version), Config=self.transfer)
+            manifest["versions"].append(dict(entry, version=version))
+            manifest["next"] = version + 1
+        self._prune(dst, manifest)
+        self._save_manifest(dst, manifest)
+        dropped = [{'Key': self._version_dir(src) + str(entry["version"])} for entry in source["versions"]]
+        dropped.append({'Key': self._version_dir(src) + "versions.json"})
+        self._call('delete_objects', Delete={'Objects': dropped, 'Quiet': True})
+
+    def list_versions(self, rel_path: str) -> List[Dict[str, Any]]:
+        return list(reversed(self._load_manifest(rel_path)["versions"]))
+
+    def _version_key(self, rel_path: str, version: int) -> str:
+        if not any(v["version"] == version for v in self._load_manifest(rel_path)["versions"]):
+            raise ValueError(f"Version {version} of '{rel_path}' not found")
+        return self._version_dir(rel_path) + str(version)
+
+    def read_version(self, rel_path: str, version: int) -> bytes:
+        return self._call('get_object', Key=self._version_key(rel_path, version))['Body'].read()
+
+    def restore_version(self, rel_path: str, version: int) -> bool:
+        source = self._version_key(rel_path, version)
+        # Retention may drop the version being restored, so it runs after the copy.
+        existed = self._capture(rel_path, "restore", prune=False) is not None
+        S3_REQUESTS.labels('copy').inc()
+        self.client.copy({'Bucket': self.bucket, 'Key': source}, self.bucket, self._key(rel_path), Config=self.transfer)
+        manifest = self._load_manifest(rel_path)
+        if self._prune(rel_path, manifest):
+            self._save_manifest(rel_path, manifest)
+        st = self.stat(rel_path)
+        with self._state_lock:
+            self._listing[rel_path] = st
+            self._digests.pop(rel_path, None)
+        return existed
+
+    def maintain(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.versions_prefix):
+            S3_REQUESTS.labels('list_objects_v2').inc()
+            for obj in page.get('Contents', ()):
+                if not obj['Key'].endswith("/versions.json"):
+                    continue
+                manifest = json.loads(self._call('get_object', Key=obj['Key'])['Body'].read())
+                if self._prune(manifest["filename"], manifest):
+                    self._save_manifest(manifest["filename"], manifest)
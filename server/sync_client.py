@@ -0,0 +1,318 @@
+# server/sync_client.py
+"""
+Workspace sync
+
+Keeps a local directory in step with the MCP server's file store:
+
+    python server/sync_client.py status ./workspace
+    python server/sync_client.py pull ./workspace [--prefix docs/] [--delete]
+    python server/sync_client.py push ./workspace [--prefix docs/] [--delete]
+
+Only files whose sha256 differs from the server's manifest are transferred,
+and files of DELTA_MIN_SIZE bytes or more that exist on both sides go as
+block deltas. The sha256 each file had at the last sync is kept in
+``.mcp_sync.json`` in the directory, so a pull does not overwrite local edits
+and a push does not overwrite changes made on the server since (use --force
+to do so anyway). Connects to MCP_SERVER_ADDRESS / --server, or starts a
+server of its own.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+import block_delta
+from mcp_client import MCPClient
+
+STATE_FILE = '.mcp_sync.json'
+DELTA_MIN_SIZE = 64 * 1024
+# Files and bytes per pull_files/push_files call; well below the message limit.
+BATCH_FILES = 64
+BATCH_BYTES = 8 * 1024 * 1024
+
+
+class SyncError(Exception):
+    pass
+
+
+class Workspace:
+    """A local directory plus what was last synced into it."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.state_path = os.path.join(self.root, STATE_FILE)
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.state: Dict[str, Dict[str, Any]] = json.load(f)["files"]
+        except FileNotFoundError:
+            self.state = {}
+
+    def path(self, rel_path: str) -> str:
+        return os.path.join(self.root, *rel_path.split('/'))
+
+    def scan(self, prefix: str) -> Dict[str, str]:
+        """sha256 of every local file under ``prefix``, rehashing only files whose size or mtime changed."""
+        files = {}
+        for dirpath, dirnames, names in os.walk(self.root):
+            for name in names:
+                if name in (STATE_FILE, f"{STATE_FILE}.tmp") or name.endswith('.sync.tmp'):
+                    continue
+                rel_path = os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, '/')
+                if rel_path.startswith(prefix) and MCPClient.validate_file_extension(rel_path):
+                    files[rel_path] = self.digest(rel_path)
+        return files
+
+    def digest(self, rel_path: str) -> str:
+        st = os.stat(self.path(rel_path))
+        entry = self.state.get(rel_path)
+        if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            return entry["sha256"]
+        with open(self.path(rel_path), 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self.state[rel_path] = dict(entry or {}, size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=digest)
+        return digest
+
+    def read(self, rel_path: str) -> bytes:
+        with open(self.path(rel_path), 'rb') as f:
+            return f.read()
+
+    def write(self, rel_path: str, data: bytes, mtime: float):
+        path = self.path(rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.sync.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, path)
+        self.synced(rel_path, hashlib.sha256(data).hexdigest())
+
+    def remove(self, rel_path: str):
+        try:
+            os.unlink(self.path(rel_path))
+        except FileNotFoundError:
+            pass
+        self.state.pop(rel_path, None)
+
+    def synced(self, rel_path: str, digest: str):
+        st = os.stat(self.path(rel_path))
+        self.state[rel_path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest, "synced": digest}
+
+    def last_synced(self, rel_path: str) -> Optional[str]:
+        return (self.state.get(rel_path) or {}).get("synced")
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"files": self.state}, f)
+        os.replace(tmp_path, self.state_path)
+
+
+def plan(workspace: Workspace, local: Dict[str, str], remote: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Sort paths by which side changed since the last sync."""
+    result: Dict[str, List[str]] = {"push": [], "pull": [], "conflict": [], "local_deleted": [], "remote_deleted": []}
+    for rel_path in sorted(set(local) | set(remote)):
+        local_hash = local.get(rel_path)
+        remote_hash = remote[rel_path]["sha256"] if rel_path in remote else None
+        if local_hash == remote_hash:
+            continue
+        synced = workspace.last_synced(rel_path)
+        local_changed = local_hash != synced
+        remote_changed = remote_hash != synced
+        if local_changed and remote_changed:
+            result["conflict"].append(rel_path)
+        elif local_changed:
+            result["push" if local_hash else "local_deleted"].append(rel_path)
+        else:
+            result["pull" if remote_hash else "remote_deleted"].append(rel_path)
+    return result
+
+
+def batches(items: List[Any], size_of) -> List[List[Any]]:
+    batch, total, out = [], 0, []
+    for item in items:
+        size = size_of(item)
+        if batch and (len(batch) >= BATCH_FILES or total + size > BATCH_BYTES):
+            out.append(batch)
+            batch, total = [], 0
+        batch.append(item)
+        total += size
+    if batch:
+        out.append(batch)
+    return out
+
+
+class SyncClient:
+    def __init__(self, client: MCPClient, workspace: Workspace, prefix: str = ""):
+        self.client = client
+        self.workspace = workspace
+        self.prefix = prefix
+        self.stats = {"files": 0, "bytes": 0, "delta_files": 0}
+
+    async def call(self, tool: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        result = await self.client.call_tool(tool, arguments)
+        if not result.get("success"):
+            raise SyncError(result.get("error", f"{tool} failed"))
+        return result["result"]
+
+    async def manifest(self) -> Dict[str, Dict[str, Any]]:
+        result = await self.call("get_manifest", {"prefix": self.prefix})
+        return {entry["path"]: entry for entry in result["files"]}
+
+    async def status(self) -> Dict[str, List[str]]:
+        remote = await self.manifest()
+        return plan(self.workspace, self.workspace.scan(self.prefix), remote)
+
+    async def pull(self, delete: bool = False, force: bool = False, dry_run: bool = False) -> Dict[str, List[str]]:
+        remote = await self.manifest()
+        local = self.workspace.scan(self.prefix)
+        changes = plan(self.workspace, local, remote)
+        wanted = changes["pull"] + ([p for p in changes["conflict"] if p in remote] + changes["local_deleted"] if force else [])
+        removed = changes["remote_deleted"] if delete else []
+        if not dry_run:
+            self._adopt_identical(local, remote)
+            for batch in batches(wanted, lambda p: remote[p]["size"]):
+                await self._pull_batch(batch, local)
+            for rel_path in removed:
+                self.workspace.remove(rel_path)
+            self.workspace.save()
+        return {"pulled": wanted, "deleted": removed, "conflict": [] if force else changes["conflict"]}
+
+    def _adopt_identical(self, local: Dict[str, str], remote: Dict[str, Dict[str, Any]]):
+        # Files that already match (e.g. on the first sync) become the baseline.
+        for rel_path in set(local) & set(remote):
+            if local[rel_path] == remote[rel_path]["sha256"] and self.workspace.last_synced(rel_path) != local[rel_path]:
+                self.workspace.synced(rel_path, local[rel_path])
+
+    async def _pull_batch(self, batch: List[str], local: Dict[str, str], use_delta: bool = True):
+        files = []
+        for rel_path in batch:
+            entry: Dict[str, Any] = {"filename": rel_path}
+            if use_delta and rel_path in local and os.path.getsize(self.workspace.path(rel_path)) >= DELTA_MIN_SIZE:
+                entry["signatures"] = block_delta.signatures(self.workspace.read(rel_path))
+            files.append(entry)
+        result = await self.call("pull_files", {"files": files})
+        retry = []
+        for item in result["files"]:
+            rel_path = item["filename"]
+            if item["status"] == "content":
+                data = item["content"].encode('utf-8')
+            elif item["status"] == "delta":
+                data = block_delta.apply(self.workspace.read(rel_path), item["delta"]["ops"], item["delta"]["block_size"])
+                self.stats["delta_files"] += 1
+            else:
+                raise SyncError(f"Cannot pull {rel_path}: {item.get('error', item['status'])}")
+            if hashlib.sha256(data).hexdigest() != item["sha256"]:
+                # The local copy changed while the delta was built; fetch it whole.
+                retry.append(rel_path)
+                continue
+            self.stats["files"] += 1
+            self.stats["bytes"] += len(json.dumps(item))
+            self.workspace.write(rel_path, data, item["mtime"])
+        if retry and use_delta:
+            await self._pull_batch(retry, local, use_delta=False)
+
+    async def push(self, delete: bool = False, force: bool = False, dry_run: bool = False) -> Dict[str, List[str]]:
+        remote = await self.manifest()
+        local = self.workspace.scan(self.prefix)
+        changes = plan(self.workspace, local, remote)
+        wanted = changes["push"] + ([p for p in changes["conflict"] if p in local] if force else [])
+        removed = changes["local_deleted"] + ([p for p in changes["conflict"] if p not in local] if force else []) if delete else []
+        if dry_run:
+            return {"pushed": wanted, "deleted": removed, "conflict": [] if force else changes["conflict"]}
+        self._adopt_identical(local, remote)
+        pushed, conflicts = [], [] if force else list(changes["conflict"])
+        signatures = {}
+        delta_paths = [p for p in wanted if p in remote and os.path.getsize(self.workspace.path(p)) >= DELTA_MIN_SIZE]
+        for batch in batches(delta_paths, lambda p: 0):
+            result = await self.call("get_block_signatures", {"filenames": batch})
+            signatures.update({item["filename"]: item for item in result["files"] if item["status"] == "ok"})
+        files = []
+        for rel_path in wanted:
+            data = self.workspace.read(rel_path)
+            entry: Dict[str, Any] = {"filename": rel_path, "sha256": local[rel_path]}
+            if rel_path in remote:
+                entry["base_hash"] = remote[rel_path]["sha256"]
+            sig = signatures.get(rel_path)
+            ops = block_delta.delta(data, sig["signatures"], len(data) // 2) if sig and sig["sha256"] == entry.get("base_hash") else None
+            if ops is not None:
+                entry["delta"] = {"block_size": sig["signatures"]["block_size"], "ops": ops}
+                self.stats["delta_files"] += 1
+            else:
+                try:
+                    entry["content"] = data.decode('utf-8')
+                except UnicodeDecodeError:
+                    print(f"skipped (not UTF-8 text): {rel_path}", file=sys.stderr)
+                    continue
+            files.append(entry)
+        deletes = [{"filename": p, "base_hash": remote[p]["sha256"]} for p in removed]
+        for batch in batches(files, lambda e: len(json.dumps(e))):
+            self.stats["bytes"] += sum(len(json.dumps(e)) for e in batch)
+            result = await self.call("push_files", {"files": batch})
+            self._record_push(result["files"], pushed, conflicts)
+        if deletes:
+            result = await self.call("push_files", {"delete": deletes})
+            self._record_push(result["files"], pushed, conflicts)
+        self.workspace.save()
+        return {"pushed": pushed, "deleted": [d["filename"] for d in deletes], "conflict": conflicts}
+
+    def _record_push(self, results: List[Dict[str, Any]], pushed: List[str], conflicts: List[str]):
+        for item in results:
+            rel_path = item["filename"]
+            if item["status"] in ("written", "unchanged"):
+                self.workspace.synced(rel_path, item["sha256"])
+                pushed.append(rel_path)
+                self.stats["files"] += 1
+            elif item["status"] in ("deleted", "missing"):
+                self.workspace.state.pop(rel_path, None)
+            elif item["status"] == "conflict":
+                conflicts.append(rel_path)
+            else:
+                print(f"failed: {rel_path}: {item.get('error')}", file=sys.stderr)
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "pull", "push"])
+    parser.add_argument("directory", help="Local workspace directory")
+    parser.add_argument("--prefix", default="", help="Only sync paths starting with this, e.g. docs/")
+    parser.add_argument("--server", default=None, help="MCP server address, e.g. unix:/tmp/mcp.sock (default: MCP_SERVER_ADDRESS or a new server)")
+    parser.add_argument("--delete", action="store_true", help="Also propagate deletions")
+    parser.add_argument("--force", action="store_true", help="Overwrite the other side's changes on conflict")
+    parser.add_argument("--dry-run", action="store_true", help="Only show what would be transferred")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    client = MCPClient(args.server)
+    if not await client.start_server():
+        print("Could not reach the MCP server", file=sys.stderr)
+        return 2
+    try:
+        sync = SyncClient(client, Workspace(args.directory), args.prefix)
+        if args.command == "status":
+            result = await sync.status()
+        elif args.command == "pull":
+            result = await sync.pull(args.delete, args.force, args.dry_run)
+        else:
+            result = await sync.push(args.delete, args.force, args.dry_run)
+    except SyncError as e:
+        print(f"Sync failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        await client.stop_server()
+    for kind, paths in result.items():
+        for rel_path in paths:
+            print(f"{kind}: {rel_path}")
+    if args.command != "status" and not args.dry_run:
+        print(f"{sync.stats['files']} files, {sync.stats['delta_files']} as deltas, {sync.stats['bytes']} bytes sent/received")
+    return 1 if result.get("conflict") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
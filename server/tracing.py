@@ -0,0 +1,318 @@
+# server/tracing.py
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fraction of new traces that are recorded. Downstream processes follow the
+# sampling decision carried in the traceparent, so one knob controls the cost.
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.05))
+# Optional JSON-lines file; each line is one trace in OTLP/JSON "resourceSpans" form.
+TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH')
+TRACE_RECENT_WINDOW = int(os.getenv('TRACE_RECENT_WINDOW', 500))
+SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'mcp-filesystem')
+
+_current = contextvars.ContextVar('mcp_current_span', default=None)
+_recent = deque(maxlen=TRACE_RECENT_WINDOW)
+_recent_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+def _new_id(nbytes: int) -> str:
+    return f"{random.getrandbits(nbytes * 8):0{nbytes * 2}x}"
+
+
+def parse_traceparent(value: Optional[str]):
+    """Return (trace_id, parent_span_id, sampled) from a W3C traceparent header."""
+    if not value:
+        return None
+    parts = value.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class _Trace:
+    """Spans of one trace recorded in this process."""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self.remote_spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: "Span"):
+        with self._lock:
+            self.spans.append(span)
+
+    def add_remote(self, spans: List[Dict[str, Any]]):
+        with self._lock:
+            self.remote_spans.extend(spans)
+
+    def to_otlp(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [span.to_otlp() for span in self.spans] + list(self.remote_spans)
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, trace: _Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._token = None
+
+    @property
+    def sampled(self) -> bool:
+        return True
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, message: str):
+        self.error = message
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+        return False
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None and self.error is None:
+            self.error = str(error) or type(error).__name__
+        self.trace.add(self)
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                _current.set(None)  # ended from a different context
+            self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _UnsampledSpan:
+    """Placeholder that keeps the trace id and sampling decision but records nothing."""
+
+    sampled = False
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self._token = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-00"
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_error(self, message: str):
+        pass
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end()
+        return False
+
+    def end(self, error: Optional[BaseException] = None):
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                _current.set(None)
+            self._token = None
+
+
+class _NoopSpan:
+    sampled = False
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_error(self, message: str):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def end(self, error: Optional[BaseException] = None):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class TraceScope:
+    """Root span of the work done for one request in this process.
+
+    Usable as a context manager, or opened/closed explicitly from framework
+    hooks. On close the trace is exported unless ``export`` is False, in which
+    case the caller ships ``spans()`` back to whoever propagated the context.
+    """
+
+    def __init__(self, name: str, traceparent: Optional[str] = None, export: bool = True, **attributes):
+        parent = parse_traceparent(traceparent)
+        self.export = export
+        self.remote_parent = parent is not None
+        if parent:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = _new_id(16), None, random.random() < TRACE_SAMPLE_RATE
+        if sampled:
+            self.trace = _Trace(trace_id)
+            self.span = Span(self.trace, name, parent_id, attributes)
+        else:
+            self.trace = None
+            self.span = _UnsampledSpan(trace_id, _new_id(8))
+
+    @property
+    def sampled(self) -> bool:
+        return self.trace is not None
+
+    def open(self) -> "TraceScope":
+        self.span.__enter__()
+        return self
+
+    def close(self, error: Optional[BaseException] = None):
+        self.span.end(error)
+        if self.trace is not None and self.export:
+            _finish(self.trace, self.span)
+
+    def spans(self) -> List[Dict[str, Any]]:
+        return self.trace.to_otlp() if self.trace is not None else []
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(exc)
+        return False
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, export: bool = True, **attributes) -> TraceScope:
+    return TraceScope(name, traceparent, export, **attributes)
+
+
+def span(name: str, **attributes):
+    """Child span of the current span; a shared no-op when not sampled."""
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        return _NOOP
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def current_span():
+    return _current.get() or _NOOP
+
+
+def inject(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the current trace context to JSON-RPC params as ``_meta.traceparent``."""
+    parent = _current.get()
+    if parent is not None:
+        params = dict(params)
+        params["_meta"] = dict(params.get("_meta") or {}, traceparent=parent.traceparent)
+    return params
+
+
+def absorb(payload: Optional[Dict[str, Any]]):
+    """Merge spans returned by a downstream process into the current trace."""
+    if not isinstance(payload, dict):
+        return
+    meta = payload.pop("_meta", None)
+    parent = _current.get()
+    if meta and meta.get("spans") and parent is not None and parent.sampled:
+        parent.trace.add_remote(meta["spans"])
+
+
+def _finish(trace: _Trace, root: Span):
+    spans = trace.to_otlp()
+    summary = {
+        "trace_id": trace.trace_id,
+        "name": root.name,
+        "start_time": root.start_ns / 1e9,
+        "duration_ms": round(root.duration_ms, 3),
+        "error": root.error,
+        "spans": spans
+    }
+    with _recent_lock:
+        _recent.append(summary)
+    if TRACE_EXPORT_PATH:
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "mcp-filesystem"}, "spans": spans}]
+        }]})
+        try:
+            with _export_lock, open(TRACE_EXPORT_PATH, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.error(f"Failed to export trace {trace.trace_id}: {e}")
+
+
+def slowest(limit: int = 10) -> List[Dict[str, Any]]:
+    """The slowest traces among the last TRACE_RECENT_WINDOW finished here."""
+    with _recent_lock:
+        recent = list(_recent)
+    return sorted(recent, key=lambda t: t["duration_ms"], reverse=True)[:max(0, limit)]
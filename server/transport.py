@@ -0,0 +1,91 @@
+# server/transport.py
+
+import asyncio
+import errno
+import os
+import socket
+import stat
+import sys
+from typing import List, Tuple
+
+# Largest single JSON-RPC line accepted on a socket/pipe. File contents travel
+# inline, so this must comfortably exceed MAX_FILE_SIZE.
+MAX_MESSAGE_SIZE = int(os.getenv('MCP_MAX_MESSAGE_SIZE', 64 * 1024 * 1024))
+
+
+def server_command() -> List[str]:
+    """argv that starts mcp_server serving stdio.
+
+    The module is imported rather than run as a script: Python never caches
+    the bytecode of a script, and compiling mcp_server on every spawn costs
+    more than the rest of its startup.
+    """
+    server_dir = os.path.dirname(os.path.abspath(__file__))
+    return [sys.executable, "-c", f"import sys; sys.path.insert(0, {server_dir!r}); import mcp_server; mcp_server.cli()"]
+
+
+def parse_address(address: str) -> Tuple:
+    """Parse ``unix:/path/to.sock``, ``tcp://host:port`` or ``host:port``."""
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if path.startswith("//"):
+            path = path[2:]
+        if not path:
+            raise ValueError(f"Invalid unix socket address: {address}")
+        return ("unix", path)
+    if address.startswith("tcp://"):
+        address = address[len("tcp://"):]
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Invalid server address: {address}")
+    return ("tcp", host or "127.0.0.1", int(port))
+
+
+def connect(address: str, timeout: float = 5.0) -> socket.socket:
+    kind, *target = parse_address(address)
+    if kind == "unix":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(target[0])
+    else:
+        sock = socket.create_connection(tuple(target), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.settimeout(None)
+    return sock
+
+
+async def open_connection(address: str):
+    kind, *target = parse_address(address)
+    if kind == "unix":
+        return await asyncio.open_unix_connection(target[0], limit=MAX_MESSAGE_SIZE)
+    return await asyncio.open_connection(target[0], target[1], limit=MAX_MESSAGE_SIZE)
+
+
+async def start_server(client_connected_cb, address: str):
+    kind, *target = parse_address(address)
+    if kind == "unix":
+        path = target[0]
+        _remove_stale_socket(path)
+        return await asyncio.start_unix_server(client_connected_cb, path=path, limit=MAX_MESSAGE_SIZE)
+    return await asyncio.start_server(client_connected_cb, target[0], target[1], limit=MAX_MESSAGE_SIZE)
+
+
+def _remove_stale_socket(path: str):
+    """Unlink a socket left behind by a server that is gone; refuse anything else at ``path``."""
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode):
+        raise OSError(errno.EEXIST, f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)  # stale socket from a previous run
+        return
+    except FileNotFoundError:
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, f"Another server is listening on {path}")
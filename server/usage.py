@@ -0,0 +1,227 @@
+# server/usage.py
+"""File counts and bytes per directory, kept current as files change.
+
+Every directory's totals cover its whole subtree. A file changing size
+updates its ancestors only, so recording a change and checking it against
+the per-directory quotas are both O(depth).
+"""
+
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+_UNITS = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2,
+          "g": 1024 ** 3, "gb": 1024 ** 3, "t": 1024 ** 4, "tb": 1024 ** 4}
+
+
+class QuotaExceeded(ValueError):
+    def __init__(self, message: str, directory: str):
+        super().__init__(message)
+        self.directory = directory
+
+
+class Quota(NamedTuple):
+    bytes: Optional[int]
+    files: Optional[int]
+
+
+def parse_size(text: str) -> int:
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", text)
+    if not match or match.group(2).lower() not in _UNITS:
+        raise ValueError(f"Invalid size: {text!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).lower()])
+
+
+def parse_quotas(spec: str) -> Dict[str, Quota]:
+    """``dir=SIZE[:FILES],...``, e.g. ``projects=500MB:10000,/=2GB``.
+
+    SIZE takes K/M/G/T suffixes (powers of 1024) and may be left empty to
+    limit only the file count; ``/`` is the whole store.
+    """
+    quotas = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        directory, _, limits = item.partition("=")
+        size, _, files = limits.partition(":")
+        if not limits or not (size or files):
+            raise ValueError(f"Invalid quota: {item!r}")
+        quotas[directory.strip().strip("/")] = Quota(parse_size(size) if size.strip() else None,
+                                                     int(files) if files.strip() else None)
+    return quotas
+
+
+def _ancestors(rel_path: str) -> List[str]:
+    """Directories containing ``rel_path``, innermost first; "" is the root."""
+    dirs = []
+    while rel_path:
+        rel_path = rel_path.rpartition("/")[0]
+        dirs.append(rel_path)
+    return dirs
+
+
+class DirectoryUsage:
+    def __init__(self, quotas: Optional[Dict[str, Quota]] = None):
+        self.quotas = quotas or {}
+        self.sizes: Dict[str, int] = {}
+        # Directory -> [files, bytes] of its subtree, and its immediate entries.
+        self.totals: Dict[str, List[int]] = {"": [0, 0]}
+        self.children: Dict[str, Set[str]] = defaultdict(set)
+        self.built = False
+        self._lock = threading.Lock()
+
+    def build(self, files: Iterable[Tuple[str, int]]):
+        with self._lock:
+            self.sizes, self.totals, self.children = {}, {"": [0, 0]}, defaultdict(set)
+            for rel_path, size in files:
+                self._add(rel_path, size)
+            self.built = True
+
+    def set(self, rel_path: str, size: Optional[int]):
+        """Record a file's current size, or None once it is gone. Repeating a call changes nothing."""
+        if not self.built:
+            return
+        with self._lock:
+            self._set(rel_path, size)
+
+    def _set(self, rel_path: str, size: Optional[int]):
+        old = self.sizes.get(rel_path)
+        if old == size:
+            return
+        if old is not None:
+            self._remove(rel_path, old)
+        if size is not None:
+            self._add(rel_path, size)
+
+    def _add(self, rel_path: str, size: int):
+        self.sizes[rel_path] = size
+        child = rel_path
+        for directory in _ancestors(rel_path):
+            totals = self.totals.setdefault(directory, [0, 0])
+            totals[0] += 1
+            totals[1] += size
+            self.children[directory].add(child)
+            child = directory
+
+    def _remove(self, rel_path: str, size: int):
+        del self.sizes[rel_path]
+        child = rel_path
+        for directory in _ancestors(rel_path):
+            totals = self.totals[directory]
+            totals[0] -= 1
+            totals[1] -= size
+            if child == rel_path or child not in self.totals:
+                self.children[directory].discard(child)
+            if directory and not totals[0]:
+                del self.totals[directory]
+                self.children.pop(directory, None)
+            child = directory
+
+    # -- quotas -----------------------------------------------------------------
+
+    @contextmanager
+    def reserve(self, rel_path: str, size: int, moved_from: Optional[str] = None):
+        """Raise QuotaExceeded if ``rel_path`` becoming ``size`` bytes (moved from ``moved_from``) breaks a quota.
+
+        Otherwise the change counts from here on, so concurrent writes are
+        checked against each other, and is taken back if the block raises. The
+        ``set`` for the finished write then finds nothing to change.
+        """
+        changes = {rel_path: size}
+        if moved_from is not None:
+            changes = {moved_from: None, rel_path: size}
+        with self._apply(lambda: changes):
+            yield
+
+    @contextmanager
+    def reserve_moves(self, pairs: List[Tuple[str, str]]):
+        """Like ``reserve`` for moving each ``(src, dst)`` file, all or nothing."""
+        def changes():
+            moved: Dict[str, Optional[int]] = {src: None for src, _ in pairs}
+            moved.update((dst, self.sizes[src]) for src, dst in pairs if src in self.sizes)
+            return moved
+        with self._apply(changes):
+            yield
+
+    @contextmanager
+    def _apply(self, changes: Callable[[], Dict[str, Optional[int]]]):
+        if not self.quotas or not self.built:
+            yield
+            return
+        with self._lock:
+            new = changes()
+            gains: Dict[str, List[int]] = {}
+            for rel_path, size in new.items():
+                old = self.sizes.get(rel_path)
+                files = (size is not None) - (old is not None)
+                for directory in _ancestors(rel_path):
+                    if directory in self.quotas:
+                        gain = gains.setdefault(directory, [0, 0])
+                        gain[0] += files
+                        gain[1] += (size or 0) - (old or 0)
+            self._enforce(gains)
+            undo = [(rel_path, self.sizes.get(rel_path)) for rel_path in new]
+            for rel_path, size in new.items():
+                self._set(rel_path, size)
+        try:
+            yield
+        except BaseException:
+            with self._lock:
+                for rel_path, size in reversed(undo):
+                    self._set(rel_path, size)
+            raise
+
+    def check_tree(self, src_dir: str, dst_dir: str):
+        """Raise QuotaExceeded if copying everything under ``src_dir`` to ``dst_dir`` would break a quota.
+
+        Nothing is counted yet: each copied file is reserved as it is written.
+        """
+        if not self.quotas:
+            return
+        with self._lock:
+            files, size = self.totals.get(src_dir, (0, 0))
+            self._enforce({d: [files, size] for d in [dst_dir] + _ancestors(dst_dir) if d in self.quotas})
+
+    def _enforce(self, gains: Dict[str, List[int]]):
+        for directory, (files, size) in gains.items():
+            quota = self.quotas[directory]
+            used_files, used_bytes = self.totals.get(directory, (0, 0))
+            name = directory or "/"
+            if quota.bytes is not None and size > 0 and used_bytes + size > quota.bytes:
+                raise QuotaExceeded(f"Quota of '{name}' exceeded: {used_bytes + size} of {quota.bytes} bytes", directory)
+            if quota.files is not None and files > 0 and used_files + files > quota.files:
+                raise QuotaExceeded(f"Quota of '{name}' exceeded: {used_files + files} of {quota.files} files", directory)
+
+    # -- listings -----------------------------------------------------------------
+
+    def listing(self, rel_dir: str, depth: int, describe: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """``rel_dir`` with its totals and its entries ``depth`` levels down.
+
+        Directories below that carry only their totals, to be expanded with
+        another call. ``describe`` adds to a file's entry, or returns None to
+        leave the file out. Returns None for an unknown directory.
+        """
+        with self._lock:
+            if rel_dir not in self.totals:
+                return None
+            return self._node(rel_dir, depth, describe)
+
+    def _node(self, rel_dir: str, depth: int, describe) -> Dict[str, Any]:
+        files, size = self.totals[rel_dir]
+        node: Dict[str, Any] = {"type": "directory", "path": rel_dir, "name": rel_dir.rpartition("/")[2],
+                                "files": files, "bytes": size}
+        quota = self.quotas.get(rel_dir)
+        if quota is not None:
+            node["quota"] = quota._asdict()
+        if depth > 0:
+            directories, entries = [], []
+            for child in sorted(self.children.get(rel_dir, ())):
+                if child in self.totals:
+                    directories.append(self._node(child, depth - 1, describe))
+                    continue
+                extra = describe(child)
+                if extra is not None:
+                    entries.append({"type": "file", "path": child, "name": child.rpartition("/")[2],
+                                    "size": self.sizes[child], **extra})
+            node["children"] = directories + entries
+        return node
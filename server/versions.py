@@ -0,0 +1,146 @@
+# server/versions.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_CAPTURED = Counter('mcp_server_versions_captured_total', 'File versions recorded before a change, by reason', ['reason'])
+VERSIONS_PRUNED = Counter('mcp_server_versions_pruned_total', 'File versions dropped by the retention policy')
+
+
+class VersionStore:
+    """Per-file history of earlier contents.
+
+    A version is a hard link to the inode the file had before it was changed,
+    so recording and restoring one copies no data. This relies on stored files
+    never being rewritten in place (see ``MCPServer._write_file``). In cas mode
+    a version links the read-only blob with that content instead, so equal
+    versions share one copy and the blob stays until its last version goes.
+    """
+
+    MANIFEST = "versions.json"
+
+    def __init__(self, root: str, max_count: int = 20, max_age_seconds: Optional[float] = None):
+        self.root = root
+        self.max_count = max_count
+        self.max_age_seconds = max_age_seconds
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, rel_path: str) -> str:
+        key = hashlib.sha256(rel_path.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.root, key[:2], key)
+
+    def _load(self, rel_path: str) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self._dir(rel_path), self.MANIFEST), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"filename": rel_path, "next": 1, "versions": []}
+
+    def _save(self, rel_path: str, manifest: Dict[str, Any]):
+        directory = self._dir(rel_path)
+        if not manifest["versions"]:
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+        tmp_path = os.path.join(directory, f"{self.MANIFEST}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(directory, self.MANIFEST))
+
+    def capture(self, rel_path: str, file_path: str, reason: str, source: Optional[str] = None) -> Optional[int]:
+        """Record the current content of ``file_path`` as a new version, linking ``source`` (a blob) if given."""
+        try:
+            st = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        manifest = self._load(rel_path)
+        version = manifest["next"]
+        directory = self._dir(rel_path)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            os.link(source or file_path, os.path.join(directory, str(version)))
+        except OSError as e:
+            logger.warning(f"Cannot hard-link {rel_path} into version history ({e}); copying")
+            shutil.copyfile(file_path, os.path.join(directory, str(version)))
+        manifest["next"] = version + 1
+        manifest["versions"].append({"version": version, "created": time.time(), "size": st.st_size, "reason": reason})
+        self._prune(rel_path, manifest)
+        self._save(rel_path, manifest)
+        VERSIONS_CAPTURED.labels(reason).inc()
+        return version
+
+    def move(self, src: str, dst: str):
+        """Carry the history of ``src`` over to ``dst``, after the file was moved there."""
+        source = self._load(src)
+        if not source["versions"]:
+            return
+        manifest = self._load(dst)
+        src_dir, directory = self._dir(src), self._dir(dst)
+        if not manifest["versions"]:
+            # Usually ``dst`` has no history of its own: rename the whole directory.
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(os.path.dirname(directory), exist_ok=True)
+            os.rename(src_dir, directory)
+            source["filename"] = dst
+            self._save(dst, source)
+            return
+        for entry in source["versions"]:
+            version = manifest["next"]
+            os.rename(os.path.join(src_dir, str(entry["version"])), os.path.join(directory, str(version)))
+            manifest["versions"].append(dict(entry, version=version))
+            manifest["next"] = version + 1
+        self._prune(dst, manifest)
+        self._save(dst, manifest)
+        shutil.rmtree(src_dir, ignore_errors=True)
+
+    def list(self, rel_path: str) -> List[Dict[str, Any]]:
+        return list(reversed(self._load(rel_path)["versions"]))
+
+    def path(self, rel_path: str, version: int) -> str:
+        if not any(v["version"] == version for v in self._load(rel_path)["versions"]):
+            raise ValueError(f"Version {version} of '{rel_path}' not found")
+        return os.path.join(self._dir(rel_path), str(version))
+
+    def _prune(self, rel_path: str, manifest: Dict[str, Any]):
+        versions = manifest["versions"]
+        keep = versions[-self.max_count:] if self.max_count > 0 else []
+        if self.max_age_seconds is not None:
+            cutoff = time.time() - self.max_age_seconds
+            keep = [v for v in keep if v["created"] >= cutoff]
+        if len(keep) == len(versions):
+            return
+        kept = {v["version"] for v in keep}
+        for v in versions:
+            if v["version"] not in kept:
+                try:
+                    os.unlink(os.path.join(self._dir(rel_path), str(v["version"])))
+                except FileNotFoundError:
+                    pass
+        VERSIONS_PRUNED.inc(len(versions) - len(keep))
+        manifest["versions"] = keep
+
+    def prune_all(self):
+        """Apply the retention policy to every file, including ones no longer edited."""
+        for shard in os.listdir(self.root):
+            shard_path = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_path):
+                continue
+            for key in os.listdir(shard_path):
+                try:
+                    with open(os.path.join(shard_path, key, self.MANIFEST), 'r', encoding='utf-8') as f:
+                        manifest = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                before = len(manifest["versions"])
+                self._prune(manifest["filename"], manifest)
+                if len(manifest["versions"]) != before:
+                    self._save(manifest["filename"], manifest)
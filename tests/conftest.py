@@ -0,0 +1,21 @@
+# tests/conftest.py
+# Unit tests import the server modules directly, as the server does (flat, from server/).
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+os.environ.setdefault('MCP_DOTENV_LOADED', '1')
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """An MCPServer storing files under ``tmp_path/files``, its state outside the root."""
+    import mcp_server
+    root = tmp_path / "files"
+    root.mkdir()
+    monkeypatch.setattr(mcp_server, "FILE_DIRECTORY", str(root))
+    monkeypatch.setattr(mcp_server, "MCP_STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.setattr(mcp_server, "STATE_SUBDIR", None)
+    return mcp_server.MCPServer()
@@ -0,0 +1,75 @@
+import asyncio
+
+from admission import AdmissionController, Lane
+
+
+def controller(capacity=1):
+    return AdmissionController(capacity, [Lane("read", 0, capacity, 10), Lane("write", 1, capacity, 10)])
+
+
+async def hold(admission, lane, gate, ran):
+    async with admission.admit(lane, "client"):
+        ran.append(lane)
+        await gate.wait()
+
+
+def test_waiter_cancelled_as_slot_frees():
+    async def main():
+        admission = controller()
+        gate, ran = asyncio.Event(), []
+        t1 = asyncio.create_task(hold(admission, "read", gate, ran))
+        await asyncio.sleep(0)
+        t2 = asyncio.create_task(hold(admission, "read", asyncio.Event(), ran))
+        t3 = asyncio.create_task(hold(admission, "read", gate, ran))
+        await asyncio.sleep(0)
+        assert len(admission.lanes["read"].waiting) == 2
+
+        # t1 releases its slot in the same tick that t2's wait is cancelled.
+        gate.set()
+        t2.cancel()
+        await t1
+        await t3
+        assert t2.cancelled()
+        return admission, ran
+
+    admission, ran = asyncio.run(main())
+    assert ran == ["read", "read"]
+    assert admission.active == 0
+    assert admission.lanes["read"].active == 0
+    assert not admission.lanes["read"].waiting
+    assert not admission.lanes["read"].clients
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def main():
+        admission = controller()
+        gate, ran = asyncio.Event(), []
+        t1 = asyncio.create_task(hold(admission, "write", gate, ran))
+        await asyncio.sleep(0)
+        t2 = asyncio.create_task(hold(admission, "write", gate, ran))
+        await asyncio.sleep(0)
+        t2.cancel()
+        await asyncio.sleep(0)
+        assert not admission.lanes["write"].waiting
+        gate.set()
+        await t1
+        return admission, ran
+
+    admission, ran = asyncio.run(main())
+    assert ran == ["write"]
+    assert admission.active == 0
+
+
+def test_priority_lane_admitted_first():
+    async def main():
+        admission = controller()
+        gate, ran = asyncio.Event(), []
+        t1 = asyncio.create_task(hold(admission, "write", gate, ran))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(hold(admission, lane, gate, ran)) for lane in ("write", "read")]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(t1, *waiting)
+        return ran
+
+    assert asyncio.run(main()) == ["write", "read", "write"]
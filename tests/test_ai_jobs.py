@@ -0,0 +1,38 @@
+# tests/test_ai_jobs.py
+
+import asyncio
+
+import pytest
+
+import ai_jobs
+
+
+def test_job_store_creates_its_directory(tmp_path):
+    store = ai_jobs.JobStore(str(tmp_path / "fresh" / "state" / "ai_jobs.sqlite3"))
+    job = store.submit("a.txt", "Shorten it", "model", "0" * 64, "client")
+    assert store.get(job["id"])["status"] == ai_jobs.QUEUED
+
+
+def test_submit_with_s3_backend(tmp_path, monkeypatch):
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    import mcp_server
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"), ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    # The state directory is never created by the s3 backend itself.
+    monkeypatch.setattr(mcp_server, "STORAGE_BACKEND", "s3")
+    monkeypatch.setattr(mcp_server, "S3_BUCKET", "jobs")
+    monkeypatch.setattr(mcp_server, "S3_REGION", "us-east-1")
+    monkeypatch.setattr(mcp_server, "MCP_STATE_DIR", str(tmp_path / "state"))
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="jobs")
+        server = mcp_server.MCPServer()
+
+        async def main():
+            await server.handle_request({"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {
+                "name": "create_file", "arguments": {"filename": "a.txt", "content": "hello\n"}}})
+            return await server.handle_request({"jsonrpc": "2.0", "id": 2, "method": "tools/call", "params": {
+                "name": "submit_ai_edit", "arguments": {"filename": "a.txt", "prompt": "Shout"}}})
+
+        response = asyncio.run(main())
+    assert response["result"]["job"]["status"] == ai_jobs.QUEUED
@@ -0,0 +1,101 @@
+# tests/test_archives.py
+# Hostile archives: what archives.entries refuses, and what extract_archive keeps out of storage.
+
+import asyncio
+import base64
+import gzip
+import io
+import stat
+import tarfile
+import zipfile
+
+import pytest
+
+import archives
+import mcp_server
+
+
+def zip_of(*members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for member in members:
+            if isinstance(member, zipfile.ZipInfo):
+                archive.writestr(member, "target.txt")
+            else:
+                archive.writestr(*member)
+    return buffer.getvalue()
+
+
+def extract(server, data, **arguments):
+    request = {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {
+        "name": "extract_archive", "arguments": {"archive": base64.b64encode(data).decode(), **arguments}}}
+    return asyncio.run(server.handle_request(request))["result"]
+
+
+def statuses(result):
+    return {f["path"]: (f["status"], f.get("error")) for f in result["files"]}
+
+
+def test_parent_and_absolute_entries_stay_out(server, tmp_path):
+    data = zip_of(("../escape.txt", "x"), ("a/../../escape2.txt", "x"), ("/etc/abs.txt", "x"), ("ok.txt", "fine"))
+    result = statuses(extract(server, data, archive_name="evil.zip"))
+    assert result["ok.txt"] == ("created", None)
+    for name in ("../escape.txt", "a/../../escape2.txt", "/etc/abs.txt"):
+        status, error = result[name]
+        assert status == "skipped" and "Invalid filename" in error
+    assert sorted(p.name for p in tmp_path.rglob("*.txt")) == ["ok.txt"]
+
+
+def test_symlink_members_are_not_followed(server, tmp_path):
+    link = zipfile.ZipInfo("link.txt")
+    link.external_attr = (stat.S_IFLNK | 0o777) << 16
+    tar_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode="w") as archive:
+        member = tarfile.TarInfo("tarlink.txt")
+        member.type, member.linkname = tarfile.SYMTYPE, "/etc/passwd"
+        archive.addfile(member)
+    for data, name in ((zip_of(link), "link.txt"), (tar_buffer.getvalue(), "tarlink.txt")):
+        assert statuses(extract(server, data))[name] == ("skipped", "Not a regular file")
+    assert not any(p.is_symlink() for p in tmp_path.rglob("*"))
+
+
+def test_gzip_bombs_stop_at_the_size_limit():
+    limit = 1024 * 1024
+    bomb = gzip.compress(b"a" * (8 * limit))
+    tar_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode="w:gz") as archive:
+        info = tarfile.TarInfo("big.txt")
+        info.size = 8 * limit
+        archive.addfile(info, io.BytesIO(b"\0" * info.size))
+    for data, name in ((bomb, "bomb.txt.gz"), (tar_buffer.getvalue(), "bomb.tar.gz")):
+        assert len(data) < 64 * 1024
+        with pytest.raises(archives.ArchiveLimitExceeded, match="size limit"):
+            list(archives.entries(data, name, 10, limit))
+
+
+def test_gzip_bomb_is_refused_by_extract(server, monkeypatch):
+    monkeypatch.setattr(mcp_server, "ARCHIVE_MAX_MB", 1)
+    bomb = gzip.compress(b"a" * (2 * 1024 * 1024))
+    request = {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {
+        "name": "extract_archive", "arguments": {"archive": base64.b64encode(bomb).decode(), "archive_name": "bomb.txt.gz"}}}
+    response = asyncio.run(server.handle_request(request))
+    assert "size limit" in response["error"]["message"]
+    assert server.storage.stat("bomb.txt") is None
+
+
+def test_too_many_entries():
+    members = [(f"f{i}.txt", "x") for i in range(5)]
+    with pytest.raises(archives.ArchiveLimitExceeded, match="too many entries"):
+        list(archives.entries(zip_of(*members), "many.zip", 4, 1024))
+    tar_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode="w") as archive:
+        for name, text in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(text)
+            archive.addfile(info, io.BytesIO(text.encode()))
+    # A tar is streamed: the entries before the limit come through first.
+    read = []
+    with pytest.raises(archives.ArchiveLimitExceeded, match="too many entries"):
+        for entry in archives.entries(tar_buffer.getvalue(), "many.tar", 4, 1024):
+            read.append(entry.name)
+    assert read == ["f0.txt", "f1.txt", "f2.txt", "f3.txt"]
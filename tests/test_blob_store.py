@@ -0,0 +1,78 @@
+# tests/test_blob_store.py
+# STORAGE_MODE=cas: stored files and versions are links to shared, read-only blobs.
+
+import os
+
+import pytest
+
+from blob_store import BlobStore
+from file_index import FileIndex
+from storage import LocalStorage
+from versions import VersionStore
+
+
+@pytest.fixture
+def cas(tmp_path):
+    root = tmp_path / "files"
+    root.mkdir()
+    index = FileIndex(str(root), str(tmp_path / "index.snapshot"))
+    index.load()
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    return LocalStorage(str(root), index, VersionStore(str(tmp_path / "versions")), blobs)
+
+
+def disk_usage(*roots):
+    """Bytes allocated under ``roots``, counting each inode once."""
+    seen = {}
+    for root in roots:
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                st = os.stat(os.path.join(dirpath, name))
+                seen[st.st_ino] = st.st_blocks * 512
+    return sum(seen.values())
+
+
+def test_identical_files_share_one_blob(cas, tmp_path):
+    data = os.urandom(1 << 20)
+    for name in ("a.bin", "b.bin", "c/d.bin"):
+        cas.write(name, data, "create")
+    cas.copy("a.bin", "e.bin")
+    inodes = {os.stat(cas._abs(name)).st_ino for name in ("a.bin", "b.bin", "c/d.bin", "e.bin")}
+    assert len(inodes) == 1
+    assert os.stat(cas._abs("a.bin")).st_nlink == 5  # four files and the blob
+    assert disk_usage(cas.root, cas.blobs.root) < 2 * len(data)
+
+
+def test_edits_and_history_leave_shared_files_alone(cas):
+    cas.write("a.txt", b"same\n", "create")
+    cas.write("b.txt", b"same\n", "create")
+    cas.write("a.txt", b"next\n", "edit")
+    assert cas.read("b.txt").data == b"same\n"
+    assert cas.read("a.txt").data == b"next\n"
+    # a's version is the blob b.txt still links to.
+    assert os.path.samefile(cas.versions.path("a.txt", 1), cas._abs("b.txt"))
+    assert not os.stat(cas._abs("b.txt")).st_mode & 0o222
+
+
+def test_restored_version_links_its_blob(cas):
+    cas.write("a.txt", b"old\n", "create")
+    cas.write("a.txt", b"new\n", "edit")
+    cas.restore_version("a.txt", 1)
+    assert cas.read("a.txt").data == b"old\n"
+    assert os.path.samefile(cas._abs("a.txt"), cas.versions.path("a.txt", 1))
+    cas.write("a.txt", b"newer\n", "edit")
+    assert [cas.read_version("a.txt", v["version"]) for v in cas.list_versions("a.txt")] == [b"old\n", b"new\n", b"old\n"]
+
+
+def test_garbage_collection_keeps_linked_blobs(cas):
+    cas.write("a.txt", b"one\n", "create")
+    cas.write("a.txt", b"two\n", "edit")
+    cas.write("b.txt", b"one\n", "create")
+    cas.write("b.txt", b"three\n", "edit")
+    cas.write("c.txt", b"four\n", "create")
+    assert cas.blobs.collect_garbage(grace_seconds=0) == 0
+    assert cas.read_version("a.txt", 1) == cas.read_version("b.txt", 1) == b"one\n"
+    cas.versions.max_count = 0
+    cas.maintain()
+    assert cas.blobs.collect_garbage(grace_seconds=0) == 1
+    assert cas.read("a.txt").data == b"two\n"
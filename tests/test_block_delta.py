@@ -0,0 +1,109 @@
+# tests/test_block_delta.py
+
+import asyncio
+import hashlib
+import random
+
+import pytest
+
+import block_delta
+
+
+def call(server, name, **arguments):
+    request = {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
+    return asyncio.run(server.handle_request(request))["result"]
+
+
+def sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("edit", [
+    lambda b: b,
+    lambda b: b[:5000] + b"inserted" + b[5000:],
+    lambda b: b[:3000] + b[9000:],
+    lambda b: b"prefix" + b + b"suffix",
+    lambda b: b[:-100],
+    lambda b: b"",
+])
+def test_round_trip(edit):
+    old = random.Random(1).randbytes(20000)
+    new = edit(old)
+    sigs = block_delta.signatures(old, 1024)
+    ops = block_delta.delta(new, sigs)
+    assert block_delta.apply(old, ops, sigs["block_size"]) == new
+    # Only what changed is sent literally.
+    literal = sum(len(op[1]) for op in ops if op[0] == "l")
+    assert literal < 4 * 1024
+
+
+def test_delta_gives_up_past_max_literal():
+    old, new = b"a" * 8192, random.Random(2).randbytes(8192)
+    assert block_delta.delta(new, block_delta.signatures(old, 1024), max_literal=1024) is None
+
+
+@pytest.mark.parametrize("ops", [
+    [["c", 0, 5]],  # runs past the last block
+    [["c", 3, 2]],
+    [["c", 4, 1]],
+    [["c", -1, 1]],
+    [["c", 0, 0]],
+    [["x"]],
+])
+def test_apply_rejects_bad_operations(ops):
+    # Four blocks of 1024, the last one short.
+    with pytest.raises(ValueError):
+        block_delta.apply(b"z" * 3500, ops, 1024)
+
+
+def test_push_and_pull_statuses(server):
+    old = "".join(f"line {i}\n" for i in range(3000)).encode()
+    new = old.replace(b"line 1500\n", b"line fifteen hundred\n")
+    pushed = call(server, "push_files", files=[{"filename": "s.txt", "content": old.decode()}])["files"][0]
+    assert (pushed["status"], pushed["sha256"]) == ("written", sha(old))
+
+    # Pushing content the server already has is a no-op.
+    again = call(server, "push_files", files=[{"filename": "s.txt", "content": old.decode(), "sha256": sha(old)}])["files"][0]
+    assert again["status"] == "unchanged"
+
+    # A delta against the server's content.
+    sigs = block_delta.signatures(old)
+    delta = {"block_size": sigs["block_size"], "ops": block_delta.delta(new, sigs)}
+    entry = {"filename": "s.txt", "delta": delta, "base_hash": sha(old), "sha256": sha(new)}
+    assert call(server, "push_files", files=[entry])["files"][0]["status"] == "written"
+    assert server.storage.read("s.txt").data == new
+
+    # The same delta again: its base is gone, and the file already has its target.
+    assert call(server, "push_files", files=[entry])["files"][0]["status"] == "unchanged"
+    entry["sha256"] = sha(b"something else")
+    conflict = call(server, "push_files", files=[entry])["files"][0]
+    assert (conflict["status"], conflict["current_hash"]) == ("conflict", sha(new))
+
+    # Pulling with signatures of the old content comes back as a delta.
+    pulled = call(server, "pull_files", files=[{"filename": "s.txt", "signatures": sigs}])["files"][0]
+    assert pulled["status"] == "delta"
+    assert block_delta.apply(old, pulled["delta"]["ops"], pulled["delta"]["block_size"]) == new
+    assert call(server, "pull_files", files=[{"filename": "gone.txt"}])["files"][0]["status"] == "missing"
+
+
+def test_malformed_entries_fail_alone(server):
+    call(server, "push_files", files=[{"filename": "s.txt", "content": "x" * 5000}])
+    base = sha(b"x" * 5000)
+    truncated = block_delta.signatures(b"x" * 5000, 2048)
+    truncated["blocks"].pop()
+    bad_pulls = [
+        {"filename": "s.txt", "signatures": truncated},
+        {"filename": "s.txt", "signatures": {"size": 5000, "blocks": []}},
+        {"filename": "s.txt", "signatures": {"block_size": 0, "size": 5000, "blocks": [[1, "00"]]}},
+    ]
+    results = call(server, "pull_files", files=bad_pulls + [{"filename": "s.txt"}])["files"]
+    assert [r["status"] for r in results] == ["error", "error", "error", "content"]
+
+    bad_pushes = [
+        {"filename": "s.txt", "base_hash": base, "delta": {"block_size": 2048, "ops": [["c", 1, 3]]}},  # past the end
+        {"filename": "s.txt", "base_hash": base, "delta": {"block_size": 2048, "ops": [["c"]]}},
+        {"filename": "s.txt", "base_hash": base, "delta": {"ops": []}},
+    ]
+    results = call(server, "push_files", files=bad_pushes)["files"]
+    assert [r["status"] for r in results] == ["error", "error", "error"]
+    assert server.storage.read("s.txt").data == b"x" * 5000
@@ -0,0 +1,72 @@
+# tests/test_file_index.py
+
+import asyncio
+import threading
+
+import pytest
+
+from file_index import FileIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    root = tmp_path / "files"
+    (root / "d").mkdir(parents=True)
+    (root / "d" / "a.txt").write_text("a")
+    index = FileIndex(str(root))
+    index.reconcile()
+    return index
+
+
+def test_reconcile_reports_changes(index, tmp_path):
+    root = tmp_path / "files"
+    (root / "d" / "b.txt").write_text("b")
+    (root / "e").mkdir()
+    (root / "e" / "c.txt").write_text("c")
+    (root / "d" / "a.txt").unlink()
+    assert sorted(index.reconcile()) == [("created", "d/b.txt"), ("created", "e/c.txt"), ("deleted", "d/a.txt")]
+    assert index.reconcile() == []
+
+
+def test_write_during_the_walk_is_kept(index, tmp_path, monkeypatch):
+    root = tmp_path / "files"
+    (root / "d" / "x.txt").write_text("x")  # makes d's mtime move
+    list_dir = index._list
+    lock_free = []
+
+    def listing_then_write(rel_dir):
+        listed = list_dir(rel_dir)
+        if rel_dir == "d":
+            # Other threads can take the lock meanwhile...
+            probe = threading.Thread(target=lambda: lock_free.append(index._lock.acquire(blocking=False) and index._lock.release() is None))
+            probe.start()
+            probe.join()
+            # ...and a server write lands after the listing was taken.
+            (root / "d" / "new.txt").write_text("new")
+            index.update("d/new.txt")
+            (root / "d" / "a.txt").write_text("changed")
+            index.update("d/a.txt")
+        return listed
+
+    monkeypatch.setattr(index, "_list", listing_then_write)
+    changes = index.reconcile()
+    assert lock_free == [True]
+    assert ("created", "d/x.txt") in changes
+    assert not any(path == "d/new.txt" for _, path in changes)
+    assert index.get("d/new.txt") is not None
+    assert index.get("d/a.txt").size == len("changed")
+
+
+def test_list_files_relies_on_the_watcher(server):
+    root = server.storage.root
+
+    def listed():
+        request = {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": "list_files", "arguments": {}}}
+        return asyncio.run(server.handle_request(request))["result"]["files"]
+
+    with open(f"{root}/outside.txt", "w") as f:
+        f.write("x")
+    server._watching = True
+    assert listed() == []
+    server._watching = False
+    assert listed() == ["outside.txt"]
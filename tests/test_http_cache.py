@@ -0,0 +1,21 @@
+from http_cache import content_range, requested_range
+
+
+def test_single_ranges():
+    assert requested_range({'Range': 'bytes=2-5'}) == (2, 4)
+    assert requested_range({'Range': 'bytes=10-'}) == (10, None)
+    assert requested_range({'Range': 'bytes=-3'}) == (-3, None)
+
+
+def test_whole_file_when_range_cannot_be_served():
+    assert requested_range({}) is None
+    assert requested_range({'Range': 'bytes=0-1,4-5'}) is None
+    assert requested_range({'Range': 'bytes=5-2'}) is None
+    assert requested_range({'Range': 'bytes=-0'}) is None
+    assert requested_range({'Range': 'lines=1-2'}) is None
+    assert requested_range({'Range': 'bytes=0-1', 'If-Range': '"abc"'}) is None
+
+
+def test_content_range():
+    assert content_range(2, 4, 16) == "bytes 2-5/16"
+    assert content_range(100, 0, 16) == "bytes */16"
@@ -0,0 +1,40 @@
+# tests/test_move_directory.py
+
+import asyncio
+import os
+import threading
+import time
+
+
+def call(server, name, **arguments):
+    request = {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
+    return asyncio.run(server.handle_request(request))
+
+
+def test_move_waits_for_writers_at_the_destination(server):
+    for name in ("a.txt", "sub/b.txt"):
+        call(server, "create_file", filename=f"src/{name}", content=name)
+    held, release = threading.Event(), threading.Event()
+
+    def writer():
+        # A write to a destination path, in progress when the move starts.
+        with server.storage.lock("dst/a.txt"):
+            held.set()
+            release.wait()
+
+    threading.Thread(target=writer, daemon=True).start()
+    held.wait()
+    results = []
+    mover = threading.Thread(target=lambda: results.append(call(server, "move_directory", source="src", destination="dst")), daemon=True)
+    mover.start()
+    try:
+        time.sleep(0.2)
+        assert not results
+    finally:
+        release.set()
+    mover.join()
+    assert results[0]["result"]["files"] == ["dst/a.txt", "dst/sub/b.txt"]
+    root = server.storage.root
+    # Still one rename of the whole directory, and no lock files among the stored ones.
+    assert not os.path.exists(os.path.join(root, "src"))
+    assert sorted(os.listdir(os.path.join(root, "dst"))) == ["a.txt", "sub"]
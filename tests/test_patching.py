@@ -0,0 +1,82 @@
+# tests/test_patching.py
+
+import asyncio
+import hashlib
+
+import pytest
+
+from mcp_server import PRECONDITION_FAILED
+from patching import PatchError, apply_operations, apply_unified_diff
+
+TEXT = "one\ntwo\nthree\nfour\n"
+
+
+def call(server, name, **arguments):
+    request = {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
+    return asyncio.run(server.handle_request(request))
+
+
+def test_operations():
+    ops = [{"offset": 0, "delete": 3, "insert": "ONE"}, {"offset": 8, "insert": "2.5\n"}, {"offset": 14, "delete": 5}]
+    assert apply_operations(TEXT, ops) == "ONE\ntwo\n2.5\nthree\n"
+    assert apply_operations("héllo", [{"offset": 1, "delete": 1, "insert": "e"}]) == "hello"  # characters, not bytes
+    assert apply_operations(TEXT, []) == TEXT
+
+
+@pytest.mark.parametrize("ops", [
+    [{"offset": 4, "delete": 1}, {"offset": 2}],  # out of order
+    [{"offset": 2, "delete": 3}, {"offset": 3}],  # overlapping
+    [{"offset": 18, "delete": 5}],  # past the end
+    [{"offset": 0, "delete": -1}],
+    [{"offset": 0, "insert": 5}],
+])
+def test_bad_operations(ops):
+    with pytest.raises(PatchError):
+        apply_operations(TEXT, ops)
+
+
+def test_unified_diff():
+    diff = "--- a/f.txt\n+++ b/f.txt\n@@ -1,2 +1,2 @@\n-one\n+ONE\n two\n@@ -4 +4,2 @@\n four\n+five\n"
+    assert apply_unified_diff(TEXT, diff) == "ONE\ntwo\nthree\nfour\nfive\n"
+    # Adding to an empty file, and dropping the final newline.
+    assert apply_unified_diff("", "@@ -0,0 +1 @@\n+new\n") == "new\n"
+    assert apply_unified_diff(TEXT, "@@ -4 +4 @@\n-four\n+four\n\\ No newline at end of file\n") == "one\ntwo\nthree\nfour"
+
+
+@pytest.mark.parametrize("diff", [
+    "@@ -1 +1 @@\n-uno\n+ONE\n",  # context does not match
+    "@@ -9 +9 @@\n-x\n+y\n",  # outside the file
+    "@@ -3 +3 @@\n three\n@@ -1 +1 @@\n one\n",  # hunks out of order
+    "@@ -1,2 +1,2 @@\n-one\n",  # truncated
+    "just text\n",  # no hunks
+])
+def test_bad_diffs(diff):
+    with pytest.raises(PatchError):
+        apply_unified_diff(TEXT, diff)
+
+
+def test_patch_file_base_hash(server):
+    call(server, "create_file", filename="p.txt", content=TEXT)
+    base = hashlib.sha256(TEXT.encode()).hexdigest()
+
+    response = call(server, "patch_file", filename="p.txt", base_hash=base, operations=[{"offset": 0, "delete": 3, "insert": "ONE"}])
+    patched = "ONE" + TEXT[3:]
+    assert response["result"]["sha256"] == hashlib.sha256(patched.encode()).hexdigest()
+
+    # The same base again: the file has moved on, so nothing is written.
+    response = call(server, "patch_file", filename="p.txt", base_hash=base, diff="@@ -2 +2 @@\n-two\n+TWO\n")
+    assert response["error"]["code"] == PRECONDITION_FAILED
+    assert response["error"]["data"]["current_hash"] == hashlib.sha256(patched.encode()).hexdigest()
+    assert server.storage.read("p.txt").data.decode() == patched
+
+    # Without a base hash the patch applies to whatever is there.
+    assert "result" in call(server, "patch_file", filename="p.txt", diff="@@ -2 +2 @@\n-two\n+TWO\n")
+    assert server.storage.read("p.txt").data.decode() == "ONE\nTWO\nthree\nfour\n"
+
+
+def test_patch_file_that_does_not_apply_changes_nothing(server):
+    call(server, "create_file", filename="p.txt", content=TEXT)
+    response = call(server, "patch_file", filename="p.txt", diff="@@ -1 +1 @@\n-uno\n+ONE\n")
+    assert "does not apply" in response["error"]["message"]
+    assert server.storage.read("p.txt").data.decode() == TEXT
+    assert "not found" in call(server, "patch_file", filename="nope.txt", operations=[])["error"]["message"]
@@ -0,0 +1,131 @@
+# tests/test_s3_storage.py
+# S3Storage against moto's in-process S3.
+
+import hashlib
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from storage import S3Storage  # noqa: E402
+
+BUCKET = "mcp-test"
+# S3's smallest multipart part.
+PART = 5 * 1024 * 1024
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def storage(s3):
+    return S3Storage(BUCKET, "p/", region="us-east-1", multipart_threshold=PART, max_versions=3)
+
+
+def test_write_read_stat(storage, s3):
+    digest, existed = storage.write("a/b.txt", b"hello\n", "create")
+    assert (digest, existed) == (hashlib.sha256(b"hello\n").hexdigest(), False)
+    stored = storage.read("a/b.txt")
+    assert stored.data == b"hello\n"
+    assert stored.sha256 == digest
+    assert storage.stat("a/b.txt").size == 6
+    assert storage.digest("a/b.txt") == digest
+    assert s3.head_object(Bucket=BUCKET, Key="p/files/a/b.txt")["Metadata"]["sha256"] == digest
+    assert storage.write("a/b.txt", b"again", "edit")[1] is True
+
+
+def test_missing_and_delete(storage):
+    assert storage.stat("nope.txt") is None
+    assert storage.digest("nope.txt") is None
+    with pytest.raises(FileNotFoundError):
+        storage.read("nope.txt")
+    assert storage.delete("nope.txt") is False
+    storage.write("x.txt", b"x", "create")
+    assert storage.delete("x.txt") is True
+    assert storage.stat("x.txt") is None
+
+
+def test_read_range(storage):
+    storage.write("r.txt", b"0123456789", "create")
+    assert storage.read_range("r.txt", 2, 3) == b"234"
+    assert storage.read_range("r.txt", 8, 10) == b"89"
+    assert storage.read_range("r.txt", 20, 5) == b""
+    with pytest.raises(FileNotFoundError):
+        storage.read_range("nope.txt", 0, 1)
+
+
+def test_changes_and_paths(storage, s3):
+    storage.write("one.txt", b"1", "create")
+    assert storage.changes() == []  # the first listing only establishes what exists
+    assert storage.paths() == ["one.txt"]
+    s3.put_object(Bucket=BUCKET, Key="p/files/two.txt", Body=b"2")
+    s3.put_object(Bucket=BUCKET, Key="p/files/one.txt", Body=b"changed")
+    assert sorted(storage.changes()) == [("created", "two.txt"), ("modified", "one.txt")]
+    s3.delete_object(Bucket=BUCKET, Key="p/files/one.txt")
+    assert storage.changes() == [("deleted", "one.txt")]
+    assert storage.paths() == ["two.txt"]
+    # Written by someone else: no sha256 metadata, so it is hashed from the content.
+    assert storage.digest("two.txt") == hashlib.sha256(b"2").hexdigest()
+
+
+def test_multipart_write_and_read(storage, s3):
+    data = bytes(range(256)) * (PART * 2 // 256 + 1000)
+    digest, _ = storage.write("big.txt", data, "create")
+    assert "-" in s3.head_object(Bucket=BUCKET, Key="p/files/big.txt")["ETag"]  # went up in parts
+    stored = storage.read("big.txt")
+    assert stored.data == data
+    assert stored.sha256 == digest == hashlib.sha256(data).hexdigest()
+
+
+def test_versions(storage):
+    storage.write("v.txt", b"first", "create")
+    storage.write("v.txt", b"second", "edit")
+    storage.write("v.txt", b"third", "edit")
+    versions = storage.list_versions("v.txt")
+    assert [(v["version"], v["reason"], v["size"]) for v in versions] == [(2, "edit", 6), (1, "edit", 5)]
+    assert storage.read_version("v.txt", 1) == b"first"
+    assert storage.restore_version("v.txt", 1) is True
+    assert storage.read("v.txt").data == b"first"
+    assert storage.list_versions("v.txt")[0]["reason"] == "restore"
+    with pytest.raises(ValueError):
+        storage.read_version("v.txt", 99)
+
+
+def test_version_retention(storage):
+    for i in range(6):
+        storage.write("keep.txt", str(i).encode(), "edit")
+    assert [v["version"] for v in storage.list_versions("keep.txt")] == [5, 4, 3]
+
+
+def test_copy_and_move_carry_versions(storage):
+    storage.write("src.txt", b"old", "create")
+    storage.write("src.txt", b"new", "edit")
+    digest, existed = storage.copy("src.txt", "copy.txt")
+    assert existed is False and storage.read("copy.txt").data == b"new"
+    assert digest == hashlib.sha256(b"new").hexdigest()
+    storage.move("src.txt", "moved.txt")
+    assert storage.stat("src.txt") is None
+    assert storage.read("moved.txt").data == b"new"
+    assert storage.list_versions("src.txt") == []
+    assert storage.read_version("moved.txt", storage.list_versions("moved.txt")[-1]["version"]) == b"old"
+    with pytest.raises(FileNotFoundError):
+        storage.copy("gone.txt", "x.txt")
+
+
+def test_server_watches_the_bucket_rarely(s3, monkeypatch):
+    import mcp_server
+    monkeypatch.setattr(mcp_server, "STORAGE_BACKEND", "s3")
+    monkeypatch.setattr(mcp_server, "S3_BUCKET", BUCKET)
+    monkeypatch.setattr(mcp_server, "S3_REGION", "us-east-1")
+    server = mcp_server.MCPServer()
+    # Every watcher pass LISTs the whole bucket.
+    assert server.watch_interval == mcp_server.S3_WATCH_INTERVAL > mcp_server.WATCH_INTERVAL
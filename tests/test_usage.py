@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from usage import DirectoryUsage, QuotaExceeded, parse_quotas
+
+
+def tracked(spec, files=()):
+    usage = DirectoryUsage(parse_quotas(spec))
+    usage.build(files)
+    return usage
+
+
+def test_reservation_counts_before_the_write_finishes():
+    usage = tracked("docs=10")
+    with usage.reserve("docs/a.txt", 6):
+        with pytest.raises(QuotaExceeded):
+            with usage.reserve("docs/b.txt", 6):
+                pass
+    assert usage.totals["docs"] == [1, 6]
+    # Recording the finished write changes nothing.
+    usage.set("docs/a.txt", 6)
+    assert usage.totals["docs"] == [1, 6]
+
+
+def test_failed_write_gives_the_reservation_back():
+    usage = tracked("docs=10", [("docs/a.txt", 4)])
+    with pytest.raises(OSError):
+        with usage.reserve("docs/a.txt", 9):
+            raise OSError("disk full")
+    assert usage.sizes["docs/a.txt"] == 4
+    assert usage.totals["docs"] == [1, 4]
+
+
+def test_concurrent_writers_cannot_overcommit():
+    usage = tracked("=:10")
+    start = threading.Barrier(8)
+    written = []
+
+    def writer(n):
+        start.wait()
+        for i in range(5):
+            try:
+                with usage.reserve(f"w{n}/{i}.txt", 1):
+                    written.append((n, i))
+            except QuotaExceeded:
+                pass
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(written) == 10
+    assert usage.totals[""] == [10, 10]
+
+
+def test_move_within_a_quota_needs_no_room():
+    usage = tracked("docs=:2", [("docs/a.txt", 1), ("docs/b.txt", 1)])
+    with usage.reserve("docs/c.txt", 1, moved_from="docs/a.txt"):
+        pass
+    assert sorted(usage.sizes) == ["docs/b.txt", "docs/c.txt"]
+
+
+def test_reserve_moves_is_all_or_nothing():
+    usage = tracked("dst=5", [("src/a.txt", 3), ("src/b.txt", 3)])
+    with pytest.raises(QuotaExceeded):
+        with usage.reserve_moves([("src/a.txt", "dst/a.txt"), ("src/b.txt", "dst/b.txt")]):
+            pass
+    assert sorted(usage.sizes) == ["src/a.txt", "src/b.txt"]
+    with usage.reserve_moves([("src/a.txt", "dst/a.txt")]):
+        pass
+    assert sorted(usage.sizes) == ["dst/a.txt", "src/b.txt"]